@@ -0,0 +1,88 @@
+import inspect
+from functools import partial
+
+from fastapi import APIRouter, Depends, Response
+from fastapi.params import Depends as DependsParam
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+
+from database import get_async_session, get_session
+
+
+def _session_parameter(endpoint):
+    for parameter in inspect.signature(endpoint).parameters.values():
+        default = parameter.default
+        if isinstance(default, DependsParam) and default.dependency is get_session:
+            return parameter.name
+    return None
+
+
+def _call_in_session(endpoint, adapter, session_name, kwargs, sync_session):
+    result = endpoint(**kwargs, **{session_name: sync_session})
+    # Serialize while still inside the session so relationships that were not
+    # eager-loaded can still be lazy-loaded; after run_sync returns that would
+    # need blocking IO on the event loop.
+    if adapter is not None and not isinstance(result, Response):
+        result = adapter.validate_python(result, from_attributes=True)
+    return result
+
+
+def asyncify_endpoint(endpoint, response_model=None):
+    """Wrap a sync ``get_session`` handler as an ``async def`` handler.
+
+    The wrapper takes an ``AsyncSession`` instead and runs the original
+    handler body through ``AsyncSession.run_sync``, so database IO goes
+    through the async driver on the event loop instead of the threadpool.
+    Handlers without a session are returned unchanged.
+    """
+    session_name = _session_parameter(endpoint)
+    if session_name is None:
+        return endpoint
+    adapter = TypeAdapter(response_model) if response_model is not None else None
+
+    async def async_endpoint(**kwargs):
+        session = kwargs.pop(session_name)
+        call = partial(_call_in_session, endpoint, adapter, session_name, kwargs)
+        return await session.run_sync(call)
+
+    signature = inspect.signature(endpoint)
+    async_endpoint.__signature__ = signature.replace(
+        parameters=[
+            (
+                parameter.replace(default=Depends(get_async_session))
+                if parameter.name == session_name
+                else parameter
+            )
+            for parameter in signature.parameters.values()
+        ]
+    )
+    async_endpoint.__name__ = endpoint.__name__
+    async_endpoint.__doc__ = endpoint.__doc__
+    return async_endpoint
+
+
+def asyncify_router(router: APIRouter) -> APIRouter:
+    """Copy of ``router`` whose session-using handlers are async."""
+    async_router = APIRouter()
+    for route in router.routes:
+        if not isinstance(route, APIRoute):
+            async_router.routes.append(route)
+            continue
+        async_router.add_api_route(
+            route.path,
+            asyncify_endpoint(route.endpoint, route.response_model),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=route.dependencies,
+            summary=route.summary,
+            description=route.description,
+            responses=route.responses,
+            deprecated=route.deprecated,
+            methods=route.methods,
+            operation_id=route.operation_id,
+            include_in_schema=route.include_in_schema,
+            response_class=route.response_class,
+            name=route.name,
+        )
+    return async_router
@@ -0,0 +1,667 @@
+"""In-process prefix index for search-as-you-type autocomplete.
+
+Audiobook titles and author and narrator names are kept in one UTF-8
+buffer, with a sorted array of positions of every word start in their
+normalized form, so "hob" completes "The Hobbit" with two ``bisect`` calls.
+Prefixes matching many keys have a precomputed table of their most popular
+entries, so a completion never ranks more than ``_TABLE_RANGE`` keys. The
+index is built from the database at startup, kept current by the create,
+update and delete handlers of the corresponding routers, and popularity
+follows new listening sessions through ``record_listens``.
+"""
+
+import functools
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import ChainMap, Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from schema import Audiobook, Author, Completion, ListeningHistory, Narrator
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("audiobook", "author", "narrator")
+# Keys are cut at this many bytes of normalized UTF-8; nobody types further.
+MAX_KEY_LENGTH = 48
+# Measured bytes per indexed name (see bench/autocomplete.py), including
+# the key of every word start. test_autocomplete.py keeps us under it.
+MEMORY_BUDGET_PER_ENTRY = 250
+# The most completions a request can ask for.
+TOP_K = 50
+# Prefixes matching more keys than this have a table of their TOP_K most
+# popular entries, overall and per kind; shorter ranges are ranked on the
+# fly. There are at most (keys / _TABLE_RANGE) tables per prefix length.
+_TABLE_RANGE = 500
+# Sorts after every byte of valid UTF-8.
+_END = b"\xff"
+_ANY = len(KINDS)
+# upsert_many rebuilds the index for batches of more than 1/_REBUILD_RATIO
+# of its entries, and writes rebuild it once this many bytes and more than
+# the live records are garbage.
+_REBUILD_RATIO = 20
+_MIN_GARBAGE = 1 << 20
+
+Table = Tuple[array, ...]
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip accents and collapse everything but words to one space."""
+    if text.isascii():
+        # Nothing to decompose; the common case, and the slow part otherwise.
+        text = text.lower()
+    else:
+        text = unicodedata.normalize("NFKD", text.casefold())
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", text))
+
+
+def _record(text: str) -> bytes:
+    """How an entry is stored: its normalized and its display text, NUL-ended."""
+    return b"%s\0%s\0" % (normalize(text).encode(), text.replace("\0", "").encode())
+
+
+def _word_starts(normalized: bytes) -> List[int]:
+    """Offsets of the word starts of ``normalized`` with distinct keys."""
+    starts = []
+    seen = set()
+    offset = 0
+    for word in normalized.split(b" ") if normalized else ():
+        key = normalized[offset : offset + MAX_KEY_LENGTH]
+        if key not in seen:
+            seen.add(key)
+            starts.append(offset)
+        offset += len(word) + 1
+    return starts
+
+
+def _prefixes(keys: Iterable[bytes]):
+    return {key[:length] for key in keys for length in range(1, len(key) + 1)}
+
+
+def _logged(method):
+    """Log rather than raise a failed update: the write it follows is committed."""
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            method(*args, **kwargs)
+        except Exception:
+            logger.exception("Failed to update the autocomplete index")
+
+    return wrapper
+
+
+class PrefixIndex:
+    """Prefix index over (kind, id) -> (text, popularity) entries.
+
+    Entries are ``_record`` bytes appended to ``_text``. Per kind, ``_ids``
+    holds the ids of its entries in ascending order, and ``_records`` and
+    ``_popularity`` hold at the same slot one past the position of an
+    entry's record, or 0 once it is removed, and its popularity. ``_keys``
+    holds the ``_text`` positions of every word start, sorted by the key
+    there and then by position, and ``_refs[i]`` packs the kind and id that
+    ``_keys[i]`` belongs to into one machine integer. A record replaced or removed stays in ``_text`` until the
+    garbage outweighs the live records and the index is rebuilt.
+
+    ``_tables`` maps every prefix matching more than ``_TABLE_RANGE`` keys
+    (and possibly some that used to) to the refs of its ``TOP_K`` most
+    popular entries per kind and overall, best first. Writers keep them
+    current: a new or more popular entry is merged into the tables of its
+    prefixes, while a table that loses an entry it was full with is
+    recomputed from the tables of its longer prefixes, longest first.
+    Tables are replaced rather than changed.
+
+    ``_lock`` guards what ``complete`` reads and is taken on the event loop;
+    a completion holds it for a table lookup, or for ranking at most
+    ``_TABLE_RANGE`` keys. Writers also hold ``_write_lock`` for their whole
+    update, so they can read the index without ``_lock`` while they prepare
+    changes, and only take it to apply them: new ``_keys`` and ``_refs``
+    arrays and tables are built aside and swapped in. While ``build`` reads
+    its entries, writers also add themselves to ``_journal``, to be replayed
+    on the new contents.
+    """
+
+    def __init__(self):
+        self._text = bytearray()
+        self._garbage = 0
+        self._count = 0
+        self._ids = [array("q") for _ in KINDS]
+        self._records = [array("q") for _ in KINDS]
+        self._popularity = [array("q") for _ in KINDS]
+        self._keys = array("q")
+        self._refs = array("q")
+        self._tables: Dict[bytes, Table] = {}
+        self._lock = threading.Lock()
+        # Reentrant, so build can replay the journal while holding it.
+        self._write_lock = threading.RLock()
+        self._journal: Optional[list] = None
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _ref(kind: str, entity_id: int) -> int:
+        return entity_id * len(KINDS) + KINDS.index(kind)
+
+    def _slot(self, ref: int) -> int:
+        """The slot of ``ref`` in the arrays of its kind, or -1."""
+        ids = self._ids[ref % len(KINDS)]
+        entity_id = ref // len(KINDS)
+        slot = bisect_left(ids, entity_id)
+        return slot if slot < len(ids) and ids[slot] == entity_id else -1
+
+    def _position(self, ref: int) -> int:
+        """Where the record of ``ref`` starts in ``_text``, or -1."""
+        slot = self._slot(ref)
+        return self._records[ref % len(KINDS)][slot] - 1 if slot >= 0 else -1
+
+    def _rank(self, ref: int):
+        return self._popularity[ref % len(KINDS)][self._slot(ref)], -ref
+
+    def _put(self, ref: int, position: int, popularity: int):
+        """Point ``ref`` at the record at ``position``, adding its slot if new."""
+        code, entity_id = ref % len(KINDS), ref // len(KINDS)
+        ids = self._ids[code]
+        slot = bisect_left(ids, entity_id)
+        if slot == len(ids) or ids[slot] != entity_id:
+            ids.insert(slot, entity_id)
+            self._records[code].insert(slot, 0)
+            self._popularity[code].insert(slot, 0)
+        self._records[code][slot] = position + 1
+        self._popularity[code][slot] = popularity
+
+    def _key(self, position: int):
+        text = self._text
+        end = text.find(0, position, position + MAX_KEY_LENGTH)
+        return text[position : end if end >= 0 else position + MAX_KEY_LENGTH]
+
+    def _sort_key(self, position: int):
+        return self._key(position), position
+
+    def _record_keys(self, position: int) -> List[bytes]:
+        normalized = bytes(self._text[position : self._text.index(0, position)])
+        return [
+            normalized[offset : offset + MAX_KEY_LENGTH]
+            for offset in _word_starts(normalized)
+        ]
+
+    def _completion(self, ref: int) -> Completion:
+        position = self._position(ref)
+        start = self._text.index(0, position) + 1
+        return Completion(
+            kind=KINDS[ref % len(KINDS)],
+            id=ref // len(KINDS),
+            text=self._text[start : self._text.index(0, start)].decode(),
+            popularity=self._rank(ref)[0],
+        )
+
+    def _live(self):
+        """``(ref, record, popularity)`` of every entry."""
+        text = self._text
+        for code, ids in enumerate(self._ids):
+            slots = zip(ids, self._records[code], self._popularity[code])
+            for entity_id, end, popularity in slots:
+                if end:
+                    position = end - 1
+                    record_end = text.index(0, text.index(0, position) + 1) + 1
+                    yield (
+                        entity_id * len(KINDS) + code,
+                        bytes(text[position:record_end]),
+                        popularity,
+                    )
+
+    # Building
+
+    @classmethod
+    def _assemble(cls, entries) -> "PrefixIndex":
+        """A new index over ``(ref, record, popularity)`` tuples, tables included."""
+        index = cls()
+        text = index._text
+        positions = array("q")
+        refs = array("q")
+        keys = []
+        slots = [[] for _ in KINDS]
+        ranks = {}
+        for ref, record, popularity in entries:
+            start = len(text)
+            text += record
+            slots[ref % len(KINDS)].append((ref // len(KINDS), start + 1, popularity))
+            ranks[ref] = popularity, -ref
+            index._count += 1
+            normalized = record[: record.index(0)]
+            for offset in _word_starts(normalized):
+                positions.append(start + offset)
+                refs.append(ref)
+                keys.append(normalized[offset : offset + MAX_KEY_LENGTH])
+        for code, kind_slots in enumerate(slots):
+            kind_slots.sort()
+            index._ids[code] = array("q", (slot[0] for slot in kind_slots))
+            index._records[code] = array("q", (slot[1] for slot in kind_slots))
+            index._popularity[code] = array("q", (slot[2] for slot in kind_slots))
+        # Positions ascend, so the stable sort keeps equal keys in their order.
+        order = sorted(range(len(positions)), key=keys.__getitem__)
+        del keys
+        index._keys = array("q", (positions[i] for i in order))
+        index._refs = array("q", (refs[i] for i in order))
+        del order
+        index._table(b"", 0, len(index._keys), index._tables, False, ranks.__getitem__)
+        return index
+
+    def _adopt(self, other: "PrefixIndex"):
+        with self._lock:
+            self._text, self._garbage, self._count = other._text, 0, other._count
+            self._ids = other._ids
+            self._records, self._popularity = other._records, other._popularity
+            self._keys, self._refs = other._keys, other._refs
+            self._tables = other._tables
+
+    def _log(self, method, *args):
+        if self._journal is not None:
+            self._journal.append((method, args))
+
+    def build(self, entries):
+        """Replace the contents with ``(kind, id, text, popularity)`` tuples.
+
+        ``entries`` may be read while writes go on: they apply to the old
+        contents until the new ones are in, and are then replayed on them.
+        A popularity change already counted in ``entries`` counts twice.
+        """
+        with self._write_lock:
+            self._journal = []
+        records = {
+            self._ref(kind, entity_id): (_record(text), popularity)
+            for kind, entity_id, text, popularity in entries
+        }
+        index = self._assemble(
+            (ref, record, popularity) for ref, (record, popularity) in records.items()
+        )
+        with self._write_lock:
+            journal, self._journal = self._journal, None
+            self._adopt(index)
+            for method, args in journal:
+                method(*args)
+
+    # Tables
+
+    def _pack(self, tops: List[List[int]]) -> Table:
+        tops = [array("q", top) for top in tops]
+        # With a single kind under a prefix, share its list with the overall one.
+        return tuple(tops[_ANY] if top == tops[_ANY] else top for top in tops)
+
+    def _scan(self, low: int, high: int, rank) -> Table:
+        refs = set(self._refs[low:high])
+        candidates = [[] for _ in KINDS] + [refs]
+        for ref in refs:
+            candidates[ref % len(KINDS)].append(ref)
+        return self._pack(
+            [heapq.nlargest(TOP_K, refs, key=rank) for refs in candidates]
+        )
+
+    def _range(self, prefix: bytes, low: int = 0) -> Tuple[int, int]:
+        low = bisect_left(self._keys, prefix, low, key=self._key)
+        return low, bisect_left(self._keys, prefix + _END, low, key=self._key)
+
+    def _table(
+        self, prefix: bytes, low: int, high: int, tables, reuse: bool, rank=None
+    ):
+        """The table of ``prefix`` (whose keys are ``low:high``), from its children.
+
+        Tables of longer prefixes that are missing, or with ``reuse`` false
+        all of them, are built on the way and stored in ``tables``. ``rank``
+        stands in for ``_rank`` while building, where it is hot.
+        """
+        rank = rank or self._rank
+        candidates = [set() for _ in range(_ANY + 1)]
+        depth = len(prefix)
+        position = low
+        # The keys equal to the prefix sort before the longer ones.
+        while position < high and len(self._key(self._keys[position])) == depth:
+            ref = self._refs[position]
+            candidates[ref % len(KINDS)].add(ref)
+            candidates[_ANY].add(ref)
+            position += 1
+        while position < high:
+            byte = self._key(self._keys[position])[depth]
+            child = prefix + bytes([byte])
+            end = high
+            if byte < 0xFF:
+                end = bisect_left(
+                    self._keys,
+                    prefix + bytes([byte + 1]),
+                    position,
+                    high,
+                    key=self._key,
+                )
+            if reuse and child in tables:
+                table = tables[child]
+            elif end - position > _TABLE_RANGE:
+                table = self._table(child, position, end, tables, reuse, rank)
+            else:
+                table = self._scan(position, end, rank)
+            for refs, top in zip(candidates, table):
+                refs.update(top)
+            position = end
+        table = self._pack(
+            [heapq.nlargest(TOP_K, refs, key=rank) for refs in candidates]
+        )
+        if prefix:
+            tables[prefix] = table
+        return table
+
+    def _merge(self, table: Table, ref: int, include: bool) -> Table:
+        """``table`` without ``ref``, or with it at its rank if ``include``."""
+        tops = []
+        for code, top in enumerate(table):
+            top = [other for other in top if other != ref]
+            if include and code in (ref % len(KINDS), _ANY):
+                top.append(ref)
+                top.sort(key=self._rank, reverse=True)
+                del top[TOP_K:]
+            tops.append(top)
+        return self._pack(tops)
+
+    def _update_tables(self, ref: int, stale: List[bytes], fresh: List[bytes], lowered):
+        """Follow a change of ``ref`` from keys ``stale`` to keys ``fresh``.
+
+        The arrays must already hold the change; ``lowered`` says whether
+        the popularity of ``ref`` went down.
+        """
+        fresh_prefixes = _prefixes(fresh)
+        built: Dict[bytes, Table] = {}
+        tables = ChainMap(built, self._tables)
+        recompute = []
+        for prefix in _prefixes(stale) | fresh_prefixes:
+            table = self._tables.get(prefix)
+            if table is None:
+                continue
+            include = prefix in fresh_prefixes
+            if (not include or lowered) and any(
+                ref in top and len(top) == TOP_K for top in table
+            ):
+                recompute.append(prefix)
+            else:
+                built[prefix] = self._merge(table, ref, include)
+        for prefix in sorted(recompute, key=len, reverse=True):
+            self._table(prefix, *self._range(prefix), tables, reuse=True)
+        for key in fresh:
+            for length in range(1, len(key) + 1):
+                prefix = key[:length]
+                if prefix in tables:
+                    continue
+                low, high = self._range(prefix)
+                if high - low <= _TABLE_RANGE:
+                    break
+                self._table(prefix, low, high, tables, reuse=True)
+        return built
+
+    # Writing
+
+    def _record_length(self, position: int) -> int:
+        return self._text.index(0, self._text.index(0, position) + 1) + 1 - position
+
+    def _key_slots(self, position: int):
+        """``(slot, key position)`` in ``_keys`` of each key of the record at ``position``."""
+        normalized = bytes(self._text[position : self._text.index(0, position)])
+        for offset in _word_starts(normalized):
+            key_position = position + offset
+            slot = bisect_left(
+                self._keys, self._sort_key(key_position), key=self._sort_key
+            )
+            yield slot, key_position
+
+    def _spliced(self, removed: List[int], added: List[int], ref: int):
+        """New ``_keys`` and ``_refs`` without the slots ``removed`` and with
+        ``ref`` at the key positions ``added``.
+
+        Built beside the live arrays, so a write holds ``_lock`` only to swap
+        them in rather than for an O(n) ``insert`` or ``del`` per key.
+        """
+        added = sorted(added, key=self._sort_key)
+        sort_key = self._sort_key
+        slots = [
+            bisect_left(self._keys, sort_key(position), key=sort_key)
+            for position in added
+        ]
+        # At one slot, new keys go in sorted order, before the old key there.
+        edits = sorted(
+            [(slot, 0, i) for i, slot in enumerate(slots)]
+            + [(slot, 1, 0) for slot in removed]
+        )
+        keys, refs = array("q"), array("q")
+        start = 0
+        for slot, removal, i in edits:
+            keys += self._keys[start:slot]
+            refs += self._refs[start:slot]
+            if removal:
+                start = slot + 1
+            else:
+                start = slot
+                keys.append(added[i])
+                refs.append(ref)
+        keys += self._keys[start:]
+        refs += self._refs[start:]
+        return keys, refs
+
+    def _upsert(self, ref: int, record: bytes, popularity: Optional[int]):
+        old = self._position(ref)
+        stale = self._record_keys(old) if old >= 0 else []
+        previous = self._rank(ref)[0] if old >= 0 else 0
+        if popularity is None:
+            popularity = previous
+        removed = [slot for slot, _ in self._key_slots(old)] if old >= 0 else []
+        # Nothing refers to the new record until the arrays below are in.
+        with self._lock:
+            position = len(self._text)
+            self._text += record
+        offsets = _word_starts(record[: record.index(0)])
+        keys, refs = self._spliced(removed, [position + o for o in offsets], ref)
+        with self._lock:
+            self._keys, self._refs = keys, refs
+            if old >= 0:
+                self._garbage += self._record_length(old)
+            else:
+                self._count += 1
+            self._put(ref, position, popularity)
+        fresh = self._record_keys(position)
+        built = self._update_tables(ref, stale, fresh, popularity < previous)
+        with self._lock:
+            self._tables.update(built)
+
+    @_logged
+    def upsert(self, kind: str, entity_id: int, text: str, popularity=None):
+        with self._write_lock:
+            self._log(self.upsert, kind, entity_id, text, popularity)
+            self._upsert(self._ref(kind, entity_id), _record(text), popularity)
+            self._compact()
+
+    @_logged
+    def upsert_many(self, kind: str, items: Iterable[Tuple[int, str]]):
+        """``upsert`` each ``(id, text)`` of ``items``.
+
+        A batch that is large next to the index is cheaper to take in by
+        rebuilding, which happens aside, so completions go on meanwhile.
+        """
+        items = list(items)
+        with self._write_lock:
+            self._log(self.upsert_many, kind, items)
+            changed = {
+                self._ref(kind, entity_id): _record(text) for entity_id, text in items
+            }
+            if len(changed) * _REBUILD_RATIO < self._count:
+                for ref, record in changed.items():
+                    self._upsert(ref, record, None)
+                self._compact()
+                return
+            entries = [entry for entry in self._live() if entry[0] not in changed]
+            for ref, record in changed.items():
+                popularity = self._rank(ref)[0] if self._position(ref) >= 0 else 0
+                entries.append((ref, record, popularity))
+            self._adopt(self._assemble(entries))
+
+    @_logged
+    def remove(self, kind: str, entity_id: int):
+        ref = self._ref(kind, entity_id)
+        code = ref % len(KINDS)
+        with self._write_lock:
+            self._log(self.remove, kind, entity_id)
+            slot = self._slot(ref)
+            position = self._position(ref)
+            if position < 0:
+                return
+            stale = self._record_keys(position)
+            removed = [slot for slot, _ in self._key_slots(position)]
+            keys, refs = self._spliced(removed, [], ref)
+            with self._lock:
+                self._keys, self._refs = keys, refs
+            # Tables may still list the entry until the new ones are in.
+            built = self._update_tables(ref, stale, [], False)
+            with self._lock:
+                self._tables.update(built)
+                self._records[code][slot] = 0
+                self._popularity[code][slot] = 0
+                self._count -= 1
+                self._garbage += self._record_length(position)
+            self._compact()
+
+    @_logged
+    def add_popularity(self, changes: Mapping[Tuple[str, int], int]):
+        """Add ``changes``, by ``(kind, id)``, to the popularity of entries."""
+        with self._write_lock:
+            self._log(self.add_popularity, changes)
+            for (kind, entity_id), delta in changes.items():
+                ref = self._ref(kind, entity_id)
+                position = self._position(ref)
+                if position < 0 or not delta:
+                    continue
+                keys = self._record_keys(position)
+                with self._lock:
+                    self._popularity[ref % len(KINDS)][self._slot(ref)] += delta
+                built = self._update_tables(ref, keys, keys, delta < 0)
+                with self._lock:
+                    self._tables.update(built)
+
+    def _compact(self):
+        """Rebuild once replaced and removed records outweigh the live ones."""
+        if self._garbage > max(len(self._text) // 2, _MIN_GARBAGE):
+            self._adopt(self._assemble(list(self._live())))
+
+    def complete(
+        self, prefix: str, limit: int = 10, kind: Optional[str] = None
+    ) -> List[Completion]:
+        """The ``limit`` most popular entries with a word starting with ``prefix``."""
+        prefix = normalize(prefix).encode()[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        code = _ANY if kind is None else KINDS.index(kind)
+        with self._lock:
+            table = self._tables.get(prefix)
+            if table is not None:
+                top = table[code][:limit]
+            else:
+                low, high = self._range(prefix)
+                refs = set(self._refs[low:high])
+                if kind is not None:
+                    refs = {ref for ref in refs if ref % len(KINDS) == code}
+                top = heapq.nlargest(limit, refs, key=self._rank)
+            return [self._completion(ref) for ref in top]
+
+
+def load_entries(session: Session):
+    """``(kind, id, text, popularity)`` for every autocompletable entity.
+
+    Popularity is the number of listening sessions of an audiobook, and for
+    authors and narrators the sum over their audiobooks.
+    """
+    listens = dict(
+        session.exec(
+            select(ListeningHistory.audiobook_id, func.count()).group_by(
+                ListeningHistory.audiobook_id
+            )
+        ).all()
+    )
+    author_listens: Dict[int, int] = {}
+    narrator_listens: Dict[int, int] = {}
+    books = session.exec(
+        select(
+            Audiobook.audiobook_id,
+            Audiobook.title,
+            Audiobook.author_id,
+            Audiobook.narrator_id,
+        )
+    )
+    for audiobook_id, title, author_id, narrator_id in books:
+        popularity = listens.get(audiobook_id, 0)
+        author_listens[author_id] = author_listens.get(author_id, 0) + popularity
+        narrator_listens[narrator_id] = (
+            narrator_listens.get(narrator_id, 0) + popularity
+        )
+        yield "audiobook", audiobook_id, title, popularity
+    for author_id, name in session.exec(select(Author.author_id, Author.name)):
+        yield "author", author_id, name, author_listens.get(author_id, 0)
+    for narrator_id, name in session.exec(select(Narrator.narrator_id, Narrator.name)):
+        yield "narrator", narrator_id, name, narrator_listens.get(narrator_id, 0)
+
+
+autocomplete_index = PrefixIndex()
+
+
+def build_autocomplete_index(session: Session):
+    autocomplete_index.build(load_entries(session))
+
+
+def start_autocomplete_build(engine: Engine) -> threading.Thread:
+    """Build the index on a thread; until then it completes what it has."""
+
+    def run():
+        started = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                build_autocomplete_index(session)
+        except Exception:
+            logger.exception("Failed to build the autocomplete index")
+            return
+        logger.info(
+            "Built the autocomplete index of %d entries in %.1fs",
+            len(autocomplete_index),
+            time.perf_counter() - started,
+        )
+
+    thread = threading.Thread(target=run, name="autocomplete-build", daemon=True)
+    thread.start()
+    return thread
+
+
+def record_listens(connection, listens: Mapping[int, int]):
+    """Count ``listens``, new listening sessions by audiobook id, as popularity.
+
+    They go to the audiobooks and to their authors and narrators, as in
+    ``load_entries``; a negative count takes deleted sessions back.
+    ``connection`` is a ``Connection`` or ``Session`` to look them up with.
+    """
+    listens = {audiobook_id: count for audiobook_id, count in listens.items() if count}
+    if not listens:
+        return
+    changes = Counter()
+    books = connection.execute(
+        select(
+            Audiobook.audiobook_id, Audiobook.author_id, Audiobook.narrator_id
+        ).where(Audiobook.audiobook_id.in_(listens))
+    )
+    for audiobook_id, author_id, narrator_id in books:
+        count = listens[audiobook_id]
+        changes["audiobook", audiobook_id] += count
+        if author_id is not None:
+            changes["author", author_id] += count
+        if narrator_id is not None:
+            changes["narrator", narrator_id] += count
+    autocomplete_index.add_popularity(changes)
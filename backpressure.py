@@ -0,0 +1,13 @@
+"""The response to a write refused because its write-behind buffer is full."""
+
+import math
+
+from fastapi import HTTPException
+
+
+def retry_later(detail: str, flush_interval: float) -> HTTPException:
+    """A ``503`` asking the client to retry once the buffer has been flushed."""
+    retry_after = max(1, math.ceil(flush_interval))
+    return HTTPException(
+        status_code=503, detail=detail, headers={"Retry-After": str(retry_after)}
+    )
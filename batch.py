@@ -0,0 +1,69 @@
+"""Multi-get reads: ``GET /{entity}/batch?ids=1,2,3`` and ``POST /{entity}/batch``.
+
+A client rendering a shelf of books can fetch them in one request instead of
+one per book. All ids are resolved with a single ``WHERE pk IN (...)`` query
+that eager-loads what the response model nests, and the response lists the
+items in request order with ``null`` for ids that do not exist, which are
+also listed under ``missing``.
+
+Entities served from the response cache pass their cache entity name: cached
+bodies are spliced into the response as they are and only the misses are
+queried (and cached).
+"""
+
+from typing import List, Optional
+
+import orjson
+from fastapi import HTTPException, Response
+from sqlmodel import Session
+
+from queries import get_many_for
+from response_cache import response_cache
+from serialization import MEDIA_TYPE, encoder_for
+from settings import get_settings
+
+
+def parse_ids(ids: str) -> List[int]:
+    """Ids of a comma-separated ``?ids=`` query parameter."""
+    try:
+        return [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail="ids must be a comma-separated list of integers"
+        )
+
+
+def read_batch(
+    session: Session,
+    model,
+    response_model,
+    ids: List[int],
+    entity: Optional[str] = None,
+) -> Response:
+    """Serialized ``{"items": [...], "missing": [...]}`` for ``ids``."""
+    max_ids = get_settings().batch_max_ids
+    if len(ids) > max_ids:
+        raise HTTPException(
+            status_code=413, detail=f"At most {max_ids} ids per request"
+        )
+
+    def load(idents):
+        return get_many_for(session, model, response_model, idents)
+
+    if entity is not None:
+        bodies = response_cache.fetch_many(entity, ids, response_model, load)
+    else:
+        encode = encoder_for(response_model)
+        rows = load(list(dict.fromkeys(ids))) if ids else {}
+        bodies = {ident: encode(row) for ident, row in rows.items()}
+    missing = [ident for ident in dict.fromkeys(ids) if ident not in bodies]
+    content = b"".join(
+        (
+            b'{"items":[',
+            b",".join(bodies.get(ident, b"null") for ident in ids),
+            b'],"missing":',
+            orjson.dumps(missing),
+            b"}",
+        )
+    )
+    return Response(content=content, media_type=MEDIA_TYPE)
@@ -0,0 +1,126 @@
+"""Requests/sec of sync vs async database mode under many concurrent clients.
+
+Usage::
+
+    python -m bench.async_mode [--clients 500] [--requests 10000]
+
+Each mode gets its own uvicorn server on a fresh SQLite database seeded with
+a small catalog; the clients then hammer ``GET /audiobooks/{id}`` and
+``GET /audiobooks/``.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlmodel import Session, SQLModel
+
+from database import create_db_engine
+from schema import Audiobook, Author, Narrator
+from settings import Settings
+
+BOOKS = 100
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(url):
+    engine = create_db_engine(Settings(database_url=url))
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i in range(BOOKS):
+            session.add(
+                Audiobook(
+                    title=f"Book {i}",
+                    author=Author(name=f"Author {i}"),
+                    narrator=Narrator(name=f"Narrator {i}"),
+                    duration=3600,
+                )
+            )
+        session.commit()
+    engine.dispose()
+
+
+def start_server(mode, url, port):
+    env = dict(os.environ, AUDIOBOOK_DATABASE_MODE=mode, AUDIOBOOK_DATABASE_URL=url)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(100):
+            try:
+                await client.get("/audiobooks/1")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def load(base_url, clients, requests):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    remaining = iter(range(requests))
+    errors = 0
+
+    async def client_loop(client):
+        nonlocal errors
+        for i in remaining:
+            if i % 10:
+                path = f"/audiobooks/{random.randint(1, BOOKS)}"
+            else:
+                path = "/audiobooks/"
+            try:
+                response = await client.get(path)
+                errors += response.status_code != 200
+            except httpx.TransportError:
+                errors += 1
+
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60
+    ) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=10000)
+    args = parser.parse_args()
+
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            seed(url)
+            port = free_port()
+            server = start_server(mode, url, port)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                asyncio.run(wait_ready(base_url))
+                rps, errors = asyncio.run(load(base_url, args.clients, args.requests))
+            finally:
+                server.terminate()
+                server.wait()
+        print(f"{mode:>5}: {rps:8.0f} requests/s ({errors} errors)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Autocomplete memory footprint and completion latency.
+
+Usage::
+
+    python -m bench.autocomplete [--entries 1000000] [--queries 20000]
+
+Builds a ``PrefixIndex`` over ``--entries`` synthetic titles (Zipfian words,
+as in ``bench.search``), reports bytes per entry as traced by
+``tracemalloc`` and times completions of random 1 to 6 character prefixes.
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from autocomplete import PrefixIndex
+from bench.search import words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    entries = [
+        (
+            "audiobook",
+            entity_id,
+            " ".join(words(rng, rng.randint(2, 5))).title(),
+            int(rng.paretovariate(1.2)),
+        )
+        for entity_id in range(args.entries)
+    ]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    index = PrefixIndex()
+    index.build(entries)
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(
+        f"built {args.entries} entries in {elapsed:.1f}s: "
+        f"{used / 2**20:.0f} MiB, {used / args.entries:.0f} bytes per entry"
+    )
+
+    latencies = []
+    for word in words(rng, args.queries):
+        prefix = word[: rng.randint(1, 6)]
+        start = time.perf_counter()
+        index.complete(prefix, limit=10)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"complete: p50 {p50:.0f} µs, p99 {p99:.0f} µs over {args.queries} queries")
+
+
+if __name__ == "__main__":
+    main()
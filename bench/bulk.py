@@ -0,0 +1,107 @@
+"""Chapter ingestion throughput: one POST per chapter vs ``POST /chapters/bulk``.
+
+Usage::
+
+    python -m bench.bulk [--chapters 100000] [--batch 10000] [--single 2000]
+
+Loads ``--chapters`` chapters into a fresh database through the app
+in-process, in requests of ``--batch`` items sent as a JSON array and as a
+streamed NDJSON body. The per-chapter baseline (``POST /chapters/``) posts
+only ``--single`` chapters, as it would take minutes to post them all.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+import orjson
+
+
+def chapters(start, count):
+    return [
+        {
+            "audiobook_id": 1 + i // 20,
+            "title": f"Chapter {i % 20 + 1}",
+            "duration": 600,
+            "position": i % 20 + 1,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+async def single(client, total):
+    for chapter in chapters(0, total):
+        response = await client.post("/chapters/", json=chapter)
+        assert response.status_code == 200
+
+
+async def bulk_json(client, total, batch):
+    for start in range(0, total, batch):
+        response = await client.post(
+            "/chapters/bulk", json=chapters(start, min(batch, total - start))
+        )
+        assert response.status_code == 200, response.text
+
+
+async def bulk_ndjson(client, total, batch):
+    for start in range(0, total, batch):
+
+        async def body():
+            for chapter in chapters(start, min(batch, total - start)):
+                yield orjson.dumps(chapter) + b"\n"
+
+        response = await client.post(
+            "/chapters/bulk",
+            content=body(),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == 200, response.text
+
+
+async def run(args):
+    # Imported here so the database URL from main() applies.
+    from sqlmodel import SQLModel
+
+    from database import engine
+    from main import app, settings
+
+    settings.bulk_max_items = args.batch
+    SQLModel.metadata.create_all(engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        variants = [
+            ("POST /chapters/", args.single, single(client, args.single)),
+            ("bulk, JSON", args.chapters, bulk_json(client, args.chapters, args.batch)),
+            (
+                "bulk, NDJSON",
+                args.chapters,
+                bulk_ndjson(client, args.chapters, args.batch),
+            ),
+        ]
+        for label, count, coroutine in variants:
+            start = time.perf_counter()
+            await coroutine
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:>16}: {count:7} chapters in {elapsed:6.2f} s,"
+                f" {count / elapsed:8.0f} chapters/s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--single", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["AUDIOBOOK_DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Read/write throughput of the SQLite engine before and after tuning.
+
+Usage::
+
+    python -m bench.engine_throughput [--threads 8] [--operations 2000]
+
+"Before" reproduces the stock SQLite settings the app used to run with
+(rollback journal, ``synchronous=FULL``, default cache, no mmap); "after"
+uses the defaults from ``settings.Settings``.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session, SQLModel
+
+from database import create_db_engine
+from schema import Audiobook, Author, ListeningHistory, User
+from settings import Settings
+
+LEGACY = dict(
+    sqlite_journal_mode="DELETE",
+    sqlite_synchronous="FULL",
+    sqlite_cache_size_kib=2000,
+    sqlite_mmap_size=0,
+    pool_pre_ping=False,
+)
+
+
+def seed(engine, rows):
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="bench", name="Bench", email="b@x", password="x"))
+        session.add(Audiobook(title="Bench", author=Author(name="A"), duration=1))
+        session.add_all(
+            ListeningHistory(user_id=1, audiobook_id=1) for _ in range(rows)
+        )
+        session.commit()
+
+
+def write(engine):
+    with Session(engine) as session:
+        session.add(ListeningHistory(user_id=1, audiobook_id=1))
+        session.commit()
+
+
+def read(engine, rows):
+    with Session(engine) as session:
+        session.get(ListeningHistory, random.randint(1, rows))
+
+
+def run(engine, threads, operations, rows):
+    def timed(fn, *args):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            for _ in range(operations):
+                pool.submit(fn, engine, *args)
+        return operations / (time.perf_counter() - start)
+
+    return timed(write), timed(read, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    for label, overrides in (("before", LEGACY), ("after", {})):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine = create_db_engine(Settings(database_url=url, **overrides))
+            seed(engine, args.rows)
+            writes, reads = run(engine, args.threads, args.operations, args.rows)
+            engine.dispose()
+        print(f"{label:>6}: {writes:10.0f} writes/s {reads:10.0f} reads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Latency of entitlement checks on the playback hot path.
+
+Usage::
+
+    python -m bench.entitlements [--checks 20000]
+
+Seeds a database with ``populate_db`` and reports, per check:
+
+- ``Entitlements.check`` alone, for a user with the most purchases
+- ``GET /users/{id}/entitlements/{audiobook_id}`` through the whole ASGI
+  app, called directly without an HTTP client, served from the cache
+- the same with the cache invalidated before every check
+
+Exits non-zero when a cached request takes over 1 ms.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BUDGET_MS = 1.0
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+statuses = []
+
+
+async def send(message):
+    if message["type"] == "http.response.start":
+        statuses.append(message["status"])
+
+
+def scope(path):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+
+
+async def requests(app, paths, before=None):
+    start = time.perf_counter()
+    for path in paths:
+        if before is not None:
+            before()
+        await app(scope(path), receive, send)
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # Set before the app's modules bind their engine to it.
+        os.environ.update(AUDIOBOOK_DATABASE_URL=url, AUDIOBOOK_SLOW_QUERY_MS="0")
+        import populate_db
+
+        argv = ["--database-url", url, "--users", "1000", "--audiobooks", "2000"]
+        argv += ["--listening-histories", "100000"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            populate_db.main(argv)
+
+        from database import engine
+        from entitlements import entitlement_index
+        from main import app
+
+        with engine.connect() as connection:
+            user_id, purchases = connection.exec_driver_sql(
+                "SELECT user_id, count(*) FROM purchase"
+                " GROUP BY user_id ORDER BY 2 DESC LIMIT 1"
+            ).one()
+        rng = random.Random(1)
+        audiobook_ids = [rng.randint(1, 2000) for _ in range(args.checks)]
+
+        entitlements = entitlement_index.load(user_id)
+        now = datetime.utcnow()
+        start = time.perf_counter()
+        for audiobook_id in audiobook_ids:
+            entitlements.check(audiobook_id, now)
+        check = (time.perf_counter() - start) / args.checks
+
+        paths = [f"/users/{user_id}/entitlements/{i}" for i in audiobook_ids]
+        cached = asyncio.run(requests(app, paths))
+        uncached = asyncio.run(
+            requests(
+                app,
+                paths[: args.checks // 10],
+                lambda: entitlement_index.invalidate(user_id),
+            )
+        )
+        engine.dispose()
+
+    assert set(statuses) == {200}, set(statuses)
+    print(f"user {user_id} with {purchases} purchases")
+    print(f"Entitlements.check  {check * 1e6:8.2f} µs")
+    print(f"cached request      {cached * 1e6:8.1f} µs")
+    print(f"uncached request    {uncached * 1e6:8.1f} µs")
+    if cached * 1000 > BUDGET_MS:
+        sys.exit(f"cached checks take over {BUDGET_MS} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Sustained listening-progress throughput: per-request commits vs write-behind.
+
+Usage::
+
+    python -m bench.heartbeats [--events 20000] [--listeners 500]
+
+"Before" stores each heartbeat the way ``POST /listening_histories/`` does
+(add, commit, refresh); "after" offers them to a ``ProgressBuffer`` and
+includes the final drain in the measured time.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, SQLModel
+
+from database import create_db_engine
+from progress_ingest import ProgressBuffer
+from schema import ListeningHistory, ListeningProgressEvent
+from settings import Settings
+
+STARTED_AT = datetime(2024, 1, 1)
+
+
+def heartbeats(events, listeners):
+    for i in range(events):
+        listener = random.randrange(listeners)
+        yield ListeningProgressEvent(
+            user_id=listener,
+            audiobook_id=listener % 50,
+            started_at=STARTED_AT,
+            reported_at=STARTED_AT + timedelta(seconds=i),
+        )
+
+
+def per_request(engine, events):
+    for event in events:
+        with Session(engine) as session:
+            history = ListeningHistory(
+                user_id=event.user_id,
+                audiobook_id=event.audiobook_id,
+                started_at=event.reported_at,  # a new row per heartbeat
+                finished_at=event.reported_at,
+            )
+            session.add(history)
+            session.commit()
+            session.refresh(history)
+
+
+def write_behind(engine, events):
+    settings = Settings()
+    buffer = ProgressBuffer(
+        engine,
+        max_size=settings.progress_buffer_size,
+        batch_size=settings.progress_batch_size,
+        flush_interval=settings.progress_flush_interval,
+    )
+    buffer.start()
+    for event in events:
+        while not buffer.offer([event]):
+            time.sleep(0.001)
+    buffer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--listeners", type=int, default=500)
+    args = parser.parse_args()
+    events = list(heartbeats(args.events, args.listeners))
+
+    for label, ingest in (("before", per_request), ("after", write_behind)):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine = create_db_engine(Settings(database_url=url))
+            SQLModel.metadata.create_all(engine)
+            start = time.perf_counter()
+            ingest(engine, events)
+            elapsed = time.perf_counter() - start
+            engine.dispose()
+        print(f"{label:>6}: {len(events) / elapsed:10.0f} heartbeats/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Mixed-workload HTTP load test with a regression check against a baseline.
+
+Usage::
+
+    python -m bench.load [--target asgi|uvicorn] [--requests 20000]
+                         [--concurrency 50] [--threshold 0.2]
+                         [--save-baseline]
+
+Virtual users repeatedly pick a scenario by weight and run its requests:
+
+=========  ======  ====================================================
+browse         50  list an author's audiobooks, open one, its timeline,
+                   its rating, and search
+resume         20  read the resume position, then save a new one
+heartbeat      20  report listening progress
+rate            5  rate an audiobook
+purchase        5  buy an audiobook
+=========  ======  ====================================================
+
+Users and audiobooks are drawn with the same Zipf skew as ``populate_db``,
+which seeds a fresh database for every run. ``asgi`` drives the app in
+process through ``httpx.ASGITransport``, which measures the application
+alone; ``uvicorn`` starts a server, which adds HTTP parsing and the network
+stack.
+
+Throughput and p50/p95/p99 latency per endpoint are printed and written to
+``--output``. With a baseline at ``--baseline`` (``--save-baseline`` writes
+one from this run), the run fails if the overall throughput dropped, or the
+p95 of an endpoint rose, by more than ``--threshold``, and if the error rate
+of an endpoint rose at all. Baselines only compare runs on the same machine.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import orjson
+
+# The app's modules bind the engine to the configured database when they are
+# first imported, so they are imported once ``main`` has pointed
+# AUDIOBOOK_DATABASE_URL at the benchmark database.
+
+SCENARIOS = {
+    "browse": 50,
+    "resume": 20,
+    "heartbeat": 20,
+    "rate": 5,
+    "purchase": 5,
+}
+DATASET = {"users": 2000, "audiobooks": 1000, "listening_histories": 50000}
+NOISE_MS = 5
+# Responses other than 2xx that are not errors.
+EXPECTED = {"GET /users/{id}/resume/{id}": {404}}  # nothing saved yet
+SEARCH_TERMS = ["shadow", "river", "empire", "garden", "storm", "glass"]
+
+
+class Workload:
+    """Requests of each scenario, over the ids of the seeded dataset."""
+
+    def __init__(self, seed: int):
+        import populate_db
+
+        self.rng = random.Random(seed)
+        generator = populate_db.Generator(argparse.Namespace(seed=seed))
+        self.users = generator.popularity(DATASET["users"], 0.8)
+        self.audiobooks = generator.popularity(DATASET["audiobooks"], 1.1)
+        self.authors = DATASET["audiobooks"] // 5
+        self.clock = datetime(2024, 6, 1)
+
+    def pick(self, popularity) -> int:
+        ids, cum_weights = popularity
+        return self.rng.choices(ids, cum_weights=cum_weights)[0]
+
+    def now(self) -> str:
+        self.clock += timedelta(milliseconds=1)
+        return self.clock.isoformat()
+
+    def scenario(self):
+        """``(endpoint, method, path, body)`` of one scenario picked by weight."""
+        name = self.rng.choices(list(SCENARIOS), weights=list(SCENARIOS.values()))[0]
+        user_id = self.pick(self.users)
+        audiobook_id = self.pick(self.audiobooks)
+        if name == "browse":
+            author_id = self.rng.randint(1, self.authors)
+            term = self.rng.choice(SEARCH_TERMS)
+            return [
+                (
+                    "GET /audiobooks/",
+                    "GET",
+                    f"/audiobooks/?author_id={author_id}",
+                    None,
+                ),
+                ("GET /audiobooks/{id}", "GET", f"/audiobooks/{audiobook_id}", None),
+                (
+                    "GET /audiobooks/{id}/timeline",
+                    "GET",
+                    f"/audiobooks/{audiobook_id}/timeline",
+                    None,
+                ),
+                (
+                    "GET /audiobooks/{id}/rating",
+                    "GET",
+                    f"/audiobooks/{audiobook_id}/rating",
+                    None,
+                ),
+                ("GET /search/", "GET", f"/search/?q={term}", None),
+            ]
+        if name == "resume":
+            path = f"/users/{user_id}/resume/{audiobook_id}"
+            body = {"position": self.rng.randrange(36000), "updated_at": self.now()}
+            return [
+                ("GET /users/{id}/resume/{id}", "GET", path, None),
+                ("PUT /users/{id}/resume/{id}", "PUT", path, body),
+            ]
+        if name == "heartbeat":
+            event = {
+                "user_id": user_id,
+                "audiobook_id": audiobook_id,
+                "started_at": "2024-06-01T00:00:00",
+                "reported_at": self.now(),
+            }
+            path = "/listening_histories/progress"
+            return [("POST /listening_histories/progress", "POST", path, [event])]
+        if name == "rate":
+            body = {
+                "user_id": user_id,
+                "audiobook_id": audiobook_id,
+                "rating": self.rng.randint(1, 5),
+            }
+            return [("POST /ratings/", "POST", "/ratings/", body)]
+        body = {
+            "user_id": user_id,
+            "audiobook_id": audiobook_id,
+            "purchase_date": self.now(),
+        }
+        return [("POST /purchases/", "POST", "/purchases/", body)]
+
+
+async def drive(client, workload: Workload, requests: int, concurrency: int):
+    """Run scenarios on ``concurrency`` virtual users until ``requests`` are sent."""
+    latencies = {}
+    errors = {}
+    sent = 0
+
+    async def user():
+        nonlocal sent
+        while sent < requests:
+            for endpoint, method, path, body in workload.scenario():
+                sent += 1
+                content = None if body is None else orjson.dumps(body)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(
+                        method,
+                        path,
+                        content=content,
+                        headers={"content-type": "application/json"},
+                    )
+                    status = response.status_code
+                    failed = status >= 400 and status not in EXPECTED.get(endpoint, ())
+                except httpx.TransportError:
+                    failed = True
+                latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+                errors[endpoint] = errors.get(endpoint, 0) + failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(ordered, fraction: float) -> float:
+    """Nearest-rank percentile of the sorted list ``ordered``."""
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+
+def summarize(latencies, errors, elapsed: float) -> dict:
+    def stats(samples, failed):
+        ordered = sorted(samples)
+        return {
+            "requests": len(ordered),
+            "errors": failed,
+            "throughput": round(len(ordered) / elapsed, 1),
+            **{
+                f"p{q}_ms": round(percentile(ordered, q / 100) * 1000, 3)
+                for q in (50, 95, 99)
+            },
+        }
+
+    endpoints = {
+        endpoint: stats(samples, errors[endpoint])
+        for endpoint, samples in sorted(latencies.items())
+    }
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "elapsed": round(elapsed, 3),
+        "overall": stats(everything, sum(errors.values())),
+        "endpoints": endpoints,
+    }
+
+
+def regressions(result: dict, baseline: dict, threshold: float):
+    """Descriptions of what got worse than ``baseline`` by over ``threshold``.
+
+    A p95 also has to rise by ``NOISE_MS``: a sub-millisecond endpoint
+    crosses any relative threshold on scheduling jitter alone. Any rise in
+    the error rate of an endpoint counts, or an endpoint that turned into
+    fast errors would pass as faster.
+    """
+    found = []
+    was = baseline["overall"]["throughput"]
+    now = result["overall"]["throughput"]
+    if now < was * (1 - threshold):
+        found.append(f"throughput {now:.0f}/s, was {was:.0f}/s")
+    for endpoint, stats in result["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        error_rate = stats["errors"] / stats["requests"]
+        was_error_rate = before["errors"] / before["requests"] if before else 0.0
+        if error_rate > was_error_rate:
+            found.append(
+                f"{endpoint} errors {error_rate:.2%}, was {was_error_rate:.2%}"
+            )
+        if before and stats["p95_ms"] > max(
+            before["p95_ms"] * (1 + threshold), before["p95_ms"] + NOISE_MS
+        ):
+            found.append(
+                f"{endpoint} p95 {stats['p95_ms']:.2f} ms, was {before['p95_ms']:.2f} ms"
+            )
+    return found
+
+
+def seed_database(url: str, seed: int):
+    import populate_db
+
+    argv = ["--database-url", url, "--seed", str(seed)]
+    for option, count in DATASET.items():
+        argv += [f"--{option.replace('_', '-')}", str(count)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        populate_db.main(argv)
+
+
+async def run_asgi(workload, args):
+    # The app binds its engine to the configured database at import.
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            await drive(client, workload, args.warmup, args.concurrency)
+            return await drive(client, workload, args.requests, args.concurrency)
+
+
+async def run_uvicorn(workload, args, env):
+    from bench.async_mode import free_port
+
+    port = free_port()
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "main:app",
+        "--port",
+        str(port),
+        "--log-level",
+        "warning",
+        env=env,
+    )
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/metrics")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("server did not start")
+            await drive(client, workload, args.warmup, args.concurrency)
+            return await drive(client, workload, args.requests, args.concurrency)
+    finally:
+        server.terminate()
+        await server.wait()
+
+
+def report(result: dict):
+    print(
+        f"{'endpoint':<36} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} errors"
+    )
+    for endpoint, stats in [
+        *result["endpoints"].items(),
+        ("overall", result["overall"]),
+    ]:
+        print(
+            f"{endpoint:<36} {stats['throughput']:8.0f} {stats['p50_ms']:8.2f}"
+            f" {stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f} {stats['errors']:6d}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="default: bench/results/load-TARGET.json")
+    parser.add_argument("--baseline", help="default: bench/baselines/load-TARGET.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%"
+    )
+    args = parser.parse_args()
+    here = os.path.dirname(__file__)
+    output = args.output or os.path.join(here, "results", f"load-{args.target}.json")
+    baseline_path = args.baseline or os.path.join(
+        here, "baselines", f"load-{args.target}.json"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ.update(AUDIOBOOK_DATABASE_URL=url, AUDIOBOOK_SLOW_QUERY_MS="0")
+        seed_database(url, args.seed)
+        workload = Workload(args.seed)
+        if args.target == "asgi":
+            latencies, errors, elapsed = asyncio.run(run_asgi(workload, args))
+        else:
+            run = run_uvicorn(workload, args, dict(os.environ))
+            latencies, errors, elapsed = asyncio.run(run)
+
+    result = {
+        "target": args.target,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "dataset": DATASET,
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **summarize(latencies, errors, elapsed),
+    }
+    report(result)
+    for path in [output] + ([baseline_path] if args.save_baseline else []):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+        print(f"wrote {path}")
+
+    if args.save_baseline or not os.path.exists(baseline_path):
+        return
+    with open(baseline_path, "rb") as f:
+        baseline = orjson.loads(f.read())
+    if baseline["target"] != args.target:
+        sys.exit(f"{baseline_path} is a baseline for {baseline['target']}")
+    found = regressions(result, baseline, args.threshold)
+    for regression in found:
+        print(f"REGRESSION: {regression}")
+    if found:
+        sys.exit(1)
+    print(f"no regression over {args.threshold:.0%} against {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
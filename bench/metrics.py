@@ -0,0 +1,74 @@
+"""Per-request cost of ``MetricsMiddleware``.
+
+Usage::
+
+    python -m bench.metrics [--requests 200000]
+
+Drives a minimal ASGI app that answers every request with an empty 200,
+with and without the middleware in front, and reports the difference per
+request. The app and scope stand in for a routed FastAPI request, so what
+is left is the middleware alone. Exits non-zero over the 20 µs budget.
+"""
+
+import argparse
+import asyncio
+import time
+
+from metrics import MetricsMiddleware, RequestMetrics
+
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b""}
+BUDGET_US = 20
+
+
+class Route:
+    path = "/audiobooks/{audiobook_id}"
+
+
+async def endpoint(scope, receive, send):
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, requests):
+    scope = {"type": "http", "method": "GET", "route": Route()}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def main_async(requests):
+    wrapped = MetricsMiddleware(endpoint, RequestMetrics())
+    # warm up, then take the best of a few rounds of each
+    await run(endpoint, requests // 10)
+    await run(wrapped, requests // 10)
+    bare = min([await run(endpoint, requests) for _ in range(3)])
+    measured = min([await run(wrapped, requests) for _ in range(3)])
+    return bare, measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    bare, measured = asyncio.run(main_async(args.requests))
+    overhead = (measured - bare) * 1e6
+    print(f"      bare: {bare * 1e6:6.2f} µs/request")
+    print(f"   metrics: {measured * 1e6:6.2f} µs/request")
+    print(f"  overhead: {overhead:6.2f} µs/request (budget {BUDGET_US})")
+    if overhead > BUDGET_US:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Catalog search latency on a large synthetic catalog.
+
+Usage::
+
+    python -m bench.search [--titles 1000000] [--queries 2000]
+
+Loads ``--titles`` audiobooks (the FTS triggers index them on insert), then
+times ``search_catalog`` for random one- and two-word prefix queries.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlmodel import Session, SQLModel
+
+import search  # noqa: F401  registers the FTS table with create_all
+from database import create_db_engine
+from search import search_catalog
+from settings import Settings
+
+SYLLABLES = (
+    "ka lo mi ra ten vor sil an del mar is quen tha bel or un ri ae gon fel".split()
+)
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+# Word frequencies in titles, descriptions and queries follow Zipf's law.
+_rng = random.Random(0)
+WORDS = vocabulary(30000, _rng)
+WEIGHTS = list(itertools.accumulate(1 / rank**1.1 for rank in range(1, len(WORDS) + 1)))
+
+
+def words(rng, count):
+    return rng.choices(WORDS, cum_weights=WEIGHTS, k=count)
+
+
+def load(engine, titles, batch=50000):
+    SQLModel.metadata.create_all(engine)
+    rng = random.Random(1)
+    authors = [(i, " ".join(words(rng, 2)).title()) for i in range(1, 10001)]
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO author (author_id, name, created_at) "
+            "VALUES (?, ?, '2024-01-01')",
+            authors,
+        )
+        for start in range(0, titles, batch):
+            rows = [
+                (
+                    " ".join(words(rng, rng.randint(2, 5))).title(),
+                    rng.randint(1, len(authors)),
+                    " ".join(words(rng, 30)),
+                )
+                for _ in range(min(batch, titles - start))
+            ]
+            connection.exec_driver_sql(
+                "INSERT INTO audiobook (title, author_id, description, duration,"
+                " created_at) VALUES (?, ?, ?, 3600, '2024-01-01')",
+                rows,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_db_engine(Settings(database_url=url))
+        start = time.perf_counter()
+        load(engine, args.titles)
+        print(f"loaded {args.titles} titles in {time.perf_counter() - start:.0f}s")
+
+        rng = random.Random(2)
+        latencies = []
+        with Session(engine) as session:
+            for _ in range(args.queries):
+                query = " ".join(
+                    word[: rng.randint(3, len(word))]
+                    for word in words(rng, rng.randint(1, 2))
+                )
+                start = time.perf_counter()
+                search_catalog(session, query, limit=10)
+                latencies.append((time.perf_counter() - start) * 1000)
+        engine.dispose()
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"search: p50 {p50:.2f} ms, p99 {p99:.2f} ms over {args.queries} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Database load of a read stampede with and without single-flight coalescing.
+
+Usage::
+
+    python -m bench.stampede [--clients 1000] [--rounds 10] [--latency-ms 5]
+
+Each round empties the response cache and fires ``--clients`` concurrent
+``GET /audiobooks/1`` requests at the app in-process, as when a popular title
+launches, then reports the SQL statements and pool checkouts it took. Every
+statement is delayed by ``--latency-ms`` to stand in for the round trip to a
+database server; a local SQLite file answers a primary-key lookup so fast
+that hardly any requests overlap. Sync and async database mode each run in
+their own process on a fresh database.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+
+async def stampede(app, response_cache, clients, rounds, latency):
+    statements = checkouts = 0
+
+    def count_statement(*args):
+        nonlocal statements
+        statements += 1
+        if in_greenlet():
+            # Async mode: wait without blocking the event loop.
+            await_only(asyncio.sleep(latency))
+        else:
+            time.sleep(latency)
+
+    def count_checkout(*args):
+        nonlocal checkouts
+        checkouts += 1
+
+    event.listen(Engine, "before_cursor_execute", count_statement)
+    event.listen(Pool, "checkout", count_checkout)
+    transport = httpx.ASGITransport(app=app)
+    elapsed = 0.0
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for _ in range(rounds):
+            response_cache.clear()
+            start = time.perf_counter()
+            responses = await asyncio.gather(
+                *(client.get("/audiobooks/1") for _ in range(clients))
+            )
+            elapsed += time.perf_counter() - start
+            assert all(response.status_code == 200 for response in responses)
+    event.remove(Engine, "before_cursor_execute", count_statement)
+    event.remove(Pool, "checkout", count_checkout)
+    return statements / rounds, checkouts / rounds, elapsed / rounds
+
+
+def run(clients, rounds, latency):
+    # Imported here so the parent process does not need a database.
+    from sqlmodel import Session, SQLModel
+
+    from database import engine
+    from main import app, settings
+    from response_cache import response_cache
+    from schema import Audiobook, Author, Narrator
+    from single_flight import SingleFlight
+
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(
+            Audiobook(
+                title="Launch Day",
+                author=Author(name="Author"),
+                narrator=Narrator(name="Narrator"),
+                duration=3600,
+            )
+        )
+        session.commit()
+
+    for flights in (None, SingleFlight()):
+        response_cache.flights = flights
+        statements, checkouts, elapsed = asyncio.run(
+            stampede(app, response_cache, clients, rounds, latency)
+        )
+        label = "single-flight" if flights else "uncoalesced"
+        print(
+            f"{settings.database_mode:>5} {label:>13}: {statements:7.1f} statements,"
+            f" {checkouts:7.1f} checkouts, {elapsed * 1000:7.0f} ms per round"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run(args.clients, args.rounds, args.latency_ms / 1000)
+        return
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                AUDIOBOOK_DATABASE_MODE=mode,
+                AUDIOBOOK_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            )
+            subprocess.run(
+                [sys.executable, "-m", "bench.stampede", "--child"]
+                + ["--clients", str(args.clients), "--rounds", str(args.rounds)]
+                + ["--latency-ms", str(args.latency_ms)],
+                env=env,
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
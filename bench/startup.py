@@ -0,0 +1,60 @@
+"""Schema check at startup: ``create_all`` vs the migration version read.
+
+Usage::
+
+    python -m bench.startup [--runs 200]
+
+Both run against an up-to-date database, as on every restart of a deployed
+app: ``create_all`` reflects every table and index to find there is
+nothing to create, ``ensure_schema`` reads one row of ``schema_migrations``.
+Each run uses a freshly opened connection, as the first request would.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import event
+from sqlmodel import SQLModel
+
+from database import create_db_engine
+from migrations import ensure_schema
+from settings import Settings
+
+
+def measure(url, check, runs):
+    timings, statements = [], []
+    for _ in range(runs):
+        engine = create_db_engine(Settings(database_url=url))
+        executed = []
+        event.listen(
+            engine, "before_cursor_execute", lambda *args: executed.append(args[2])
+        )
+        start = time.perf_counter()
+        check(engine)
+        timings.append(time.perf_counter() - start)
+        statements.append(len(executed))
+        engine.dispose()
+    return statistics.median(timings) * 1000, statistics.median(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        ensure_schema(create_db_engine(Settings(database_url=url)))
+        for label, check in (
+            ("create_all", SQLModel.metadata.create_all),
+            ("ensure_schema", ensure_schema),
+        ):
+            ms, count = measure(url, check, args.runs)
+            print(f"{label:>13}: {ms:8.3f} ms {count:5.0f} statements")
+
+
+if __name__ == "__main__":
+    main()
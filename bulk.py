@@ -0,0 +1,326 @@
+"""Bulk creation of catalog rows for ``POST /{entity}/bulk``.
+
+A request body is a JSON array of ``*Create`` objects, or the same objects as
+NDJSON (``Content-Type: application/x-ndjson``), which is parsed line by line
+as it streams in instead of being buffered whole. The items are validated
+together against ``List[XCreate]`` and then written in one transaction with
+executemany statements, which SQLAlchemy sends as multi-row ``INSERT``s.
+
+An item may carry its primary key (``"author_id": 7``). It conflicts with an
+existing row that has the same primary key or, for columns declared unique
+(category names), the same value there. A new row may only take a free id
+between 1 and the largest id in the table; ids beyond it are the database's
+to assign, so the batch is rejected with ``422`` instead. ``on_conflict`` decides what happens:
+
+- ``fail``: nothing is written; the response is ``409`` listing the conflicts
+- ``skip``: conflicting items are left alone and reported as ``skipped``
+- ``update``: the matched row is overwritten with the item's fields
+
+A batch with any invalid item is rejected as a whole with ``422``. Either way
+the response lists one result per item, or only the offending items when the
+batch is rejected.
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, Request, Response
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Engine, bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from schema import BulkItemResult, BulkResult
+from serialization import json_response
+
+logger = logging.getLogger(__name__)
+
+OnConflict = Literal["fail", "skip", "update"]
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Values per "IN (...)" when looking up existing rows.
+_LOOKUP_CHUNK = 500
+
+Errors = Dict[int, List[Dict[str, Any]]]
+# (id, values) of every row written, and the ids of rows that already existed.
+AfterWrite = Callable[[List[Tuple[int, dict]], List[int]], None]
+
+
+def bulk_openapi(create_model) -> dict:
+    """``openapi_extra`` documenting the request body of a bulk endpoint."""
+    schema = {
+        "type": "array",
+        "items": {"$ref": f"#/components/schemas/{create_model.__name__}"},
+    }
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": schema},
+                NDJSON_MEDIA_TYPE: {"schema": schema["items"]},
+            },
+        }
+    }
+
+
+def _error(message: str, type: str, loc: Tuple = ()) -> Dict[str, Any]:
+    return {"loc": list(loc), "msg": message, "type": type}
+
+
+def _too_many(max_items: int) -> HTTPException:
+    return HTTPException(
+        status_code=413, detail=f"At most {max_items} items per request"
+    )
+
+
+async def read_items(request: Request, max_items: int) -> Tuple[list, Errors]:
+    """Parse the request body into raw items and per-item JSON errors."""
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type != NDJSON_MEDIA_TYPE:
+        try:
+            items = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Body is not valid JSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=422, detail="Body must be a JSON array")
+        if len(items) > max_items:
+            raise _too_many(max_items)
+        return items, {}
+
+    items, errors = [], {}
+
+    def add(line: bytes):
+        if not line.strip():
+            return
+        if len(items) == max_items:
+            raise _too_many(max_items)
+        try:
+            items.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            errors[len(items)] = [_error("Invalid JSON", "json_invalid")]
+            items.append(None)
+
+    pending = b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            add(line)
+    add(pending)
+    return items, errors
+
+
+def _conflict_columns(table) -> list:
+    return list(table.primary_key) + [column for column in table.c if column.unique]
+
+
+def validate_items(model, create_model, items: list, errors: Errors) -> List[dict]:
+    """Validate ``items`` in one pass; returns their column values.
+
+    Adds the errors of invalid items to ``errors``, keyed by item index.
+    """
+    (pk,) = model.__table__.primary_key
+    keys = []
+    for index, item in enumerate(items):
+        key = item.get(pk.name) if isinstance(item, dict) else None
+        if key is not None and type(key) is not int:
+            errors[index] = [
+                _error("Input should be a valid integer", "int_type", (pk.name,))
+            ]
+            key = None
+        keys.append(key)
+    try:
+        validated = TypeAdapter(List[create_model]).validate_python(items)
+    except ValidationError as error:
+        for detail in error.errors(include_url=False):
+            index, *loc = detail["loc"]
+            # Lines that were not JSON are already reported as such.
+            if index in errors and errors[index][0]["type"] == "json_invalid":
+                continue
+            errors.setdefault(index, []).append(
+                _error(detail["msg"], detail["type"], loc)
+            )
+        return []
+
+    rows = []
+    for key, values in zip(keys, validated):
+        values = values.model_dump()
+        values[pk.name] = key
+        rows.append(values)
+
+    # Two items claiming the same row would silently overwrite each other.
+    for column in _conflict_columns(model.__table__):
+        seen = {}
+        for index, values in enumerate(rows):
+            value = values.get(column.name)
+            if value is None:
+                continue
+            if value in seen:
+                errors.setdefault(index, []).append(
+                    _error(
+                        f"Duplicate {column.name} in batch, see item {seen[value]}",
+                        "duplicate",
+                        (column.name,),
+                    )
+                )
+            else:
+                seen[value] = index
+    return rows
+
+
+def _existing(connection, table, rows: List[dict]) -> Dict[int, int]:
+    """Map the index of every conflicting item to the id of the row it matches."""
+    (pk,) = table.primary_key
+    matches = {}
+    for column in _conflict_columns(table):
+        values = [row[column.name] for row in rows if row[column.name] is not None]
+        found = {}
+        for start in range(0, len(values), _LOOKUP_CHUNK):
+            chunk = values[start : start + _LOOKUP_CHUNK]
+            statement = select(column, pk).where(column.in_(chunk))
+            found.update(connection.execute(statement).all())
+        for index, row in enumerate(rows):
+            if index not in matches and row[column.name] in found:
+                matches[index] = found[row[column.name]]
+    return matches
+
+
+def write_rows(
+    engine: Engine, model, rows: List[dict], on_conflict: OnConflict
+) -> Tuple[List[BulkItemResult], List[Tuple[int, dict]], List[int]]:
+    """Write ``rows`` in one transaction.
+
+    Returns the per-item results, the ``(id, values)`` of the rows written and
+    the ids of rows that were updated. In ``fail`` mode with conflicts, or
+    when a new row carries an id out of range, only the offending items are
+    returned and nothing is written.
+    """
+    table = model.__table__
+    (pk,) = table.primary_key
+    with engine.begin() as connection:
+        existing = _existing(connection, table, rows)
+        if existing and on_conflict == "fail":
+            conflicts = [
+                BulkItemResult(index=index, status="conflict", id=existing[index])
+                for index in sorted(existing)
+            ]
+            return conflicts, [], []
+
+        new = [index for index in range(len(rows)) if index not in existing]
+        statuses = dict.fromkeys(existing, "skipped")
+        statuses.update(dict.fromkeys(new, "created"))
+        ids = dict(existing)
+        keyed = [index for index in new if rows[index][pk.name] is not None]
+        if keyed:
+            last = connection.execute(select(func.max(pk))).scalar() or 0
+            error = _error(
+                f"New rows may only take free ids from 1 to {last}",
+                "out_of_range",
+                (pk.name,),
+            )
+            invalid = [
+                BulkItemResult(index=index, status="invalid", errors=[error])
+                for index in keyed
+                if not 1 <= rows[index][pk.name] <= last
+            ]
+            if invalid:
+                return invalid, [], []
+            connection.execute(insert(table), [rows[index] for index in keyed])
+            ids.update((index, rows[index][pk.name]) for index in keyed)
+        unkeyed = [index for index in new if rows[index][pk.name] is None]
+        if unkeyed:
+            # SQLite can only return generated keys one row at a time in a
+            # known order. But from its first insert on this transaction
+            # holds the write lock, and each row gets the largest rowid plus
+            # one, so one executemany assigns consecutive ids ending at
+            # last_insert_rowid().
+            connection.execute(insert(table), [rows[index] for index in unkeyed])
+            last = connection.execute(select(func.last_insert_rowid())).scalar()
+            ids.update(zip(unkeyed, range(last - len(unkeyed) + 1, last + 1)))
+        if existing and on_conflict == "update":
+            columns = [name for name in rows[0] if name != pk.name]
+            statement = (
+                update(table)
+                .where(pk == bindparam("match_id"))
+                .values({name: bindparam(f"new_{name}") for name in columns})
+            )
+            connection.execute(
+                statement,
+                [
+                    {"match_id": ids[index]}
+                    | {f"new_{name}": rows[index][name] for name in columns}
+                    for index in existing
+                ],
+            )
+            statuses.update(dict.fromkeys(existing, "updated"))
+
+    results = [
+        BulkItemResult(index=index, status=statuses[index], id=ids[index])
+        for index in range(len(rows))
+    ]
+    written = [
+        (ids[index], rows[index])
+        for index in range(len(rows))
+        if statuses[index] != "skipped"
+    ]
+    updated = [ids[index] for index in existing] if on_conflict == "update" else []
+    return results, written, updated
+
+
+def _write(engine, model, rows, on_conflict, after_write: Optional[AfterWrite]):
+    results, written, updated = write_rows(engine, model, rows, on_conflict)
+    if written and after_write is not None:
+        # The rows are committed; a failure here must not fail the request.
+        try:
+            after_write(written, updated)
+        except Exception:
+            logger.exception("Failed to follow a bulk write of %d rows", len(written))
+    return results
+
+
+def _summary(results: List[BulkItemResult], status_code: int = 200) -> Response:
+    counts = dict.fromkeys(("created", "updated", "skipped"), 0)
+    if status_code == 200:
+        for result in results:
+            counts[result.status] += 1
+    response = json_response(BulkResult, BulkResult(**counts, results=results))
+    response.status_code = status_code
+    return response
+
+
+async def bulk_create(
+    request: Request,
+    engine: Engine,
+    model,
+    create_model,
+    on_conflict: OnConflict,
+    max_items: int,
+    after_write: Optional[AfterWrite] = None,
+) -> Response:
+    """Handle a bulk request for ``model``.
+
+    The database work runs on the threadpool. ``after_write`` is called
+    there after the transaction commits, to update in-process indexes and
+    caches.
+    """
+    items, errors = await read_items(request, max_items)
+    rows = validate_items(model, create_model, items, errors)
+    if errors:
+        invalid = [
+            BulkItemResult(index=index, status="invalid", errors=errors[index])
+            for index in sorted(errors)
+        ]
+        return _summary(invalid, 422)
+    if not rows:
+        return _summary([])
+    try:
+        results = await run_in_threadpool(
+            _write, engine, model, rows, on_conflict, after_write
+        )
+    except IntegrityError:
+        # A concurrent write took a key between the lookup and the insert.
+        raise HTTPException(status_code=409, detail="Conflicting write, retry")
+    if results and results[0].status == "conflict":
+        return _summary(results, 409)
+    if results and results[0].status == "invalid":
+        return _summary(results, 422)
+    return _summary(results)
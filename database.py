@@ -1,9 +1,84 @@
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from settings import Settings, get_settings
+from sql_instrumentation import instrument
+
+
+def _set_sqlite_pragmas(settings: Settings):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms:d}")
+        # A negative cache_size is a size in KiB rather than a page count.
+        cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib:d}")
+        cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size:d}")
+        cursor.close()
+
+    return on_connect
+
+
+def _engine_options(url, settings: Settings) -> dict:
+    options = dict(echo=settings.sql_echo, pool_pre_ping=settings.pool_pre_ping)
+    # In-memory SQLite databases live and die with a single connection, so
+    # only real databases get a sized pool shared across requests.
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(
+            pool_size=settings.pool_size,
+            max_overflow=settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+        )
+    return options
+
 
-sqlite_file_name = "test/test_audiobook_app.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+def create_db_engine(settings: Optional[Settings] = None):
+    """Build the application engine from ``settings`` (environment by default)."""
+    settings = settings or get_settings()
+    url = make_url(settings.database_url)
+    options = _engine_options(url, settings)
+    if url.get_backend_name() == "sqlite":
+        if "pool_size" in options:
+            options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False}
+    db_engine = create_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(db_engine, "connect", _set_sqlite_pragmas(settings))
+    return db_engine
 
-engine = create_engine(sqlite_url, echo=True)
+
+def create_async_db_engine(settings: Optional[Settings] = None):
+    """Async counterpart of ``create_db_engine``; SQLite goes through aiosqlite."""
+    settings = settings or get_settings()
+    url = make_url(settings.database_url)
+    options = _engine_options(url, settings)
+    if url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+        # aiosqlite defaults to NullPool for files, which takes no sizes.
+        if "pool_size" in options:
+            options["poolclass"] = AsyncAdaptedQueuePool
+    db_engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", _set_sqlite_pragmas(settings))
+    return db_engine
+
+
+engine = instrument(create_db_engine())
+
+
+@lru_cache
+def get_async_engine():
+    # Created on first use so sync deployments never need an async driver.
+    db_engine = create_async_db_engine()
+    instrument(db_engine.sync_engine)
+    return db_engine
 
 
 def get_session():
@@ -11,5 +86,10 @@ def get_session():
         yield session
 
 
+async def get_async_session():
+    async with AsyncSession(get_async_engine()) as session:
+        yield session
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
@@ -0,0 +1,144 @@
+"""Whether a user may stream an audiobook: they bought it, or were subscribed.
+
+Players ask before every playback session, so
+``GET /users/{user_id}/entitlements/{audiobook_id}`` is answered from
+memory. The first check of a user loads everything that entitles them, once:
+the audiobooks they purchased and the periods of their subscriptions. An
+``Entitlements`` keeps the ids in a set and the periods merged into sorted,
+disjoint intervals. A check is then a set lookup, or a ``bisect`` for the
+subscription period covering the time of the check. Periods start inclusive
+and end exclusive. Because the intervals are kept rather than a yes/no
+answer, the entry stays valid as subscriptions start and lapse.
+
+``entitlement_index`` holds the entitlements of the ``entitlement_cache_size``
+most recently checked users. The purchase, user subscription and user
+endpoints invalidate a user's entry when they write. Invalidation only
+reaches the worker process that made the write, so entries are also reloaded
+after ``entitlement_cache_ttl`` seconds. That bounds how long another worker
+can miss a new purchase.
+"""
+
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from database import engine
+from lru import LRU
+from schema import EntitlementRead, Purchase, User, UserSubscriptionLink
+from settings import get_settings
+
+
+def _merge(periods: Iterable[Tuple[datetime, datetime]]):
+    """Sorted starts and ends of the union of ``periods``."""
+    starts: List[datetime] = []
+    ends: List[datetime] = []
+    for start, end in sorted(periods):
+        if end <= start:
+            continue
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class Entitlements:
+    __slots__ = ("user_id", "purchased", "starts", "ends")
+
+    def __init__(
+        self,
+        user_id: int,
+        purchased: Iterable[int],
+        periods: Iterable[Tuple[datetime, datetime]],
+    ):
+        self.user_id = user_id
+        self.purchased = frozenset(purchased)
+        self.starts, self.ends = _merge(periods)
+
+    def subscribed_until(self, at: datetime) -> Optional[datetime]:
+        """End of the subscription period covering ``at``, if any."""
+        i = bisect_right(self.starts, at) - 1
+        if i >= 0 and at < self.ends[i]:
+            return self.ends[i]
+        return None
+
+    def check(self, audiobook_id: int, at: datetime) -> EntitlementRead:
+        if audiobook_id in self.purchased:
+            reason, expires_at = "purchase", None
+        else:
+            expires_at = self.subscribed_until(at)
+            reason = "subscription" if expires_at is not None else None
+        return EntitlementRead(
+            user_id=self.user_id,
+            audiobook_id=audiobook_id,
+            entitled=reason is not None,
+            reason=reason,
+            expires_at=expires_at,
+        )
+
+
+class EntitlementIndex:
+    """LRU of ``Entitlements`` by user id, invalidated by writes."""
+
+    def __init__(self, engine, max_entries: int, ttl: float):
+        self.engine = engine
+        self._entitlements = LRU(max_entries, ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entitlements)
+
+    def get(self, user_id: int) -> Optional[Entitlements]:
+        """The cached entitlements of ``user_id``; ``None`` means ``load``."""
+        with self._lock:
+            entitlements = self._entitlements.get(user_id)
+            if entitlements is not None:
+                self.hits += 1
+                return entitlements
+            self.misses += 1
+            return None
+
+    def load(self, user_id: int) -> Optional[Entitlements]:
+        """Read and cache the entitlements of ``user_id``; ``None`` if no such user."""
+        with self._lock:
+            generation = self._entitlements.generation
+        with Session(self.engine) as session:
+            if session.get(User, user_id) is None:
+                return None
+            purchased = session.exec(
+                select(Purchase.audiobook_id).where(Purchase.user_id == user_id)
+            ).all()
+            periods = session.exec(
+                select(
+                    UserSubscriptionLink.start_date, UserSubscriptionLink.end_date
+                ).where(UserSubscriptionLink.user_id == user_id)
+            ).all()
+        entitlements = Entitlements(user_id, purchased, periods)
+        with self._lock:
+            self._entitlements.store(user_id, entitlements, generation)
+        return entitlements
+
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            self._entitlements.invalidate(*user_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entitlements.clear()
+
+
+entitlement_index = EntitlementIndex(
+    engine, get_settings().entitlement_cache_size, get_settings().entitlement_cache_ttl
+)
+
+
+@event.listens_for(SQLModel.metadata, "after_drop")
+def clear_entitlements(target, connection, **kw):
+    entitlement_index.clear()
@@ -0,0 +1,73 @@
+"""Bounded least-recently-used mapping whose entries expire.
+
+The in-process caches (response bodies, resume positions, entitlements and
+chapter timelines) keep their entries in an ``LRU``. It does no locking:
+each owner guards it with its own lock, usually together with state of its
+own.
+
+A load that reads the database without holding that lock can race a write
+that invalidates what it read. ``generation`` counts invalidations: a load
+notes it before reading and stores its result with ``store``, which drops
+it if an invalidation came in between.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, Tuple
+
+class LRU:
+    """At most ``max_entries`` values, each expiring ``ttl`` seconds after it is set."""
+
+    def __init__(
+        self, max_entries: int, ttl: float = float("inf"), clock=time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.generation = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """The value of ``key``, now the most recently used, or ``default``."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[1] <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        self._entries[key] = (value, self._clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def store(self, key, value, generation: int) -> bool:
+        """``set`` a value loaded at ``generation``, unless invalidated since."""
+        if generation != self.generation:
+            return False
+        self.set(key, value)
+        return True
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        """Every key and value, expired or not, least recently used first."""
+        return ((key, entry[0]) for key, entry in self._entries.items())
+
+    def invalidate(self, *keys):
+        """Drop ``keys``; loads begun before are not stored, even with no keys."""
+        self.generation += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
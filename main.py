@@ -14,30 +14,85 @@ from routers import (
     review_router,
     rating_router,
     purchase_router,
+    search_router,
+    autocomplete_router,
+    cache_router,
+    export_router,
+    resume_router,
+    entitlement_router,
+    user_subscription_router,
+    metrics_router,
     web,
 )
-from database import create_db_and_tables
+from async_mode import asyncify_router
+from autocomplete import start_autocomplete_build
+from database import engine
+from migrations import ensure_schema
+from progress_ingest import progress_buffer
+from resume import resume_store
+from settings import get_settings
+from sql_instrumentation import QueryStatsMiddleware
+from metrics import MetricsMiddleware
+from profiling import ProfilingMiddleware
 
+settings = get_settings()
 app = FastAPI(title="Audio Book App")
+if settings.profiling_token or settings.profiling_sample_every:
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=settings.profiling_token,
+        sample_every=settings.profiling_sample_every,
+        interval_ms=settings.profiling_interval_ms,
+        directory=settings.profiling_dir,
+        max_files=settings.profiling_max_files,
+        max_file_kb=settings.profiling_max_file_kb,
+    )
+app.add_middleware(QueryStatsMiddleware)
+# Outermost, so its latency includes the other middleware.
+app.add_middleware(MetricsMiddleware)
 
-app.include_router(user_router.router, prefix="/users", tags=["users"])
-app.include_router(subscription_router.router, prefix="/subscriptions", tags=["subscriptions"])
-app.include_router(author_router.router, prefix="/authors", tags=["authors"])
-app.include_router(narrator_router.router, prefix="/narrators", tags=["narrators"])
-app.include_router(audiobook_router.router, prefix="/audiobooks", tags=["audiobooks"])
-app.include_router(chapter_router.router, prefix="/chapters", tags=["chapters"])
-app.include_router(category_router.router, prefix="/categories", tags=["categories"])
-app.include_router(listening_history_router.router, prefix="/listening_histories", tags=["listening_histories"])
-app.include_router(bookmark_router.router, prefix="/bookmarks", tags=["bookmarks"])
-app.include_router(review_router.router, prefix="/reviews", tags=["reviews"])
-app.include_router(rating_router.router, prefix="/ratings", tags=["ratings"])
-app.include_router(purchase_router.router, prefix="/purchases", tags=["purchases"])
+
+def include_router(router, **kwargs):
+    if settings.database_mode == "async":
+        router = asyncify_router(router)
+    app.include_router(router, **kwargs)
+
+
+include_router(user_router.router, prefix="/users", tags=["users"])
+include_router(resume_router.router, prefix="/users", tags=["resume"])
+include_router(entitlement_router.router, prefix="/users", tags=["entitlements"])
+include_router(subscription_router.router, prefix="/subscriptions", tags=["subscriptions"])
+include_router(user_subscription_router.router, prefix="/user_subscriptions", tags=["user_subscriptions"])
+include_router(author_router.router, prefix="/authors", tags=["authors"])
+include_router(narrator_router.router, prefix="/narrators", tags=["narrators"])
+include_router(audiobook_router.router, prefix="/audiobooks", tags=["audiobooks"])
+include_router(chapter_router.router, prefix="/chapters", tags=["chapters"])
+include_router(category_router.router, prefix="/categories", tags=["categories"])
+include_router(listening_history_router.router, prefix="/listening_histories", tags=["listening_histories"])
+include_router(bookmark_router.router, prefix="/bookmarks", tags=["bookmarks"])
+include_router(review_router.router, prefix="/reviews", tags=["reviews"])
+include_router(rating_router.router, prefix="/ratings", tags=["ratings"])
+include_router(purchase_router.router, prefix="/purchases", tags=["purchases"])
+include_router(search_router.router, prefix="/search", tags=["search"])
+include_router(autocomplete_router.router, prefix="/autocomplete", tags=["autocomplete"])
+include_router(cache_router.router, prefix="/cache", tags=["cache"])
+include_router(export_router.router, prefix="/export", tags=["export"])
+app.include_router(metrics_router.router)
 app.include_router(web.router)
 
 
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
+    ensure_schema(engine)
+    start_autocomplete_build(engine)
+    progress_buffer.start()
+    resume_store.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    progress_buffer.stop()
+    resume_store.stop()
 
 
 if __name__ == "__main__":
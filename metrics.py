@@ -0,0 +1,219 @@
+"""Prometheus metrics, exposed in the text format at ``GET /metrics``.
+
+``MetricsMiddleware`` records the latency of every request in a fixed-bucket
+histogram per method, route template and status code, and counts requests in
+flight. It runs on the event loop thread, as does the ``/metrics`` handler,
+so the counters are plain ints updated without locks: the hot path is a dict
+lookup, a ``bisect`` and two additions.
+
+Everything else is read when scraped: connection pool usage, the threadpool
+sync handlers run on, and the hit and miss counts of the response cache,
+chapter timelines, resume store and entitlements.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from anyio.to_thread import current_default_thread_limiter
+
+from database import engine, get_async_engine
+from entitlements import entitlement_index
+from response_cache import response_cache
+from resume import resume_store
+from sql_instrumentation import route_template
+from timeline import chapter_timelines
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds; a last, implicit bucket takes everything slower.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # counts[i] is the number of observations in (bounds[i-1], bounds[i]];
+        # rendering makes them cumulative, as Prometheus expects.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+def _family(name: str, kind: str, doc: str, samples: Iterable[Tuple[str, float]]):
+    lines = [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        sample = f"{name}{{{labels}}}" if labels else name
+        lines.append(f"{sample} {value}")
+    return lines
+
+
+class RequestMetrics:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.in_flight = 0
+        self.latency: Dict[Tuple[str, str, int], Histogram] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def render(self) -> List[str]:
+        name = "audiobook_http_request_duration_seconds"
+        lines = [
+            f"# HELP {name} Request latency by route template and status code.",
+            f"# TYPE {name} histogram",
+        ]
+        for (method, route, status), histogram in sorted(self.latency.items()):
+            labels = _labels(method=method, route=route, status=status)
+            cumulative = 0
+            for bound, count in zip((*histogram.bounds, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        lines += _family(
+            "audiobook_http_requests_in_flight",
+            "gauge",
+            "Requests being served.",
+            [("", self.in_flight)],
+        )
+        return lines
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """Time every HTTP request into ``request_metrics``."""
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        metrics = self.metrics
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        # An exception before the response started is a 500 to the client.
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            metrics.observe(
+                scope["method"],
+                route_template(scope),
+                status,
+                time.perf_counter() - start,
+            )
+
+
+def _pool_samples():
+    engines = [("sync", engine)]
+    if get_async_engine.cache_info().currsize:
+        engines.append(("async", get_async_engine().sync_engine))
+    for name, db_engine in engines:
+        pool = db_engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        yield name, pool
+
+
+def _pool_lines() -> List[str]:
+    pools = list(_pool_samples())
+    lines = []
+    for metric, doc, read in [
+        ("size", "Connections the pool keeps open.", lambda p: p.size()),
+        ("checked_out", "Connections in use.", lambda p: p.checkedout()),
+        ("checked_in", "Idle connections.", lambda p: p.checkedin()),
+        (
+            "overflow",
+            "Connections open beyond the pool size.",
+            lambda p: max(0, p.overflow()),
+        ),
+    ]:
+        lines += _family(
+            f"audiobook_db_pool_{metric}",
+            "gauge",
+            doc,
+            [(_labels(engine=name), read(pool)) for name, pool in pools],
+        )
+    return lines
+
+
+def _threadpool_lines() -> List[str]:
+    limiter = current_default_thread_limiter()
+    return _family(
+        "audiobook_threadpool_threads",
+        "gauge",
+        "Worker threads for sync handlers, by state.",
+        [
+            (_labels(state="busy"), limiter.borrowed_tokens),
+            (_labels(state="limit"), int(limiter.total_tokens)),
+        ],
+    )
+
+
+def _cache_lines() -> List[str]:
+    stats = response_cache.stats()
+    caches = [
+        ("response", stats.hits, stats.misses),
+        ("timeline", chapter_timelines.hits, chapter_timelines.misses),
+        ("resume", resume_store.hits, resume_store.misses),
+        ("entitlement", entitlement_index.hits, entitlement_index.misses),
+    ]
+    lines = _family(
+        "audiobook_cache_hits_total",
+        "counter",
+        "Cache lookups that found an entry.",
+        [(_labels(cache=name), hits) for name, hits, _ in caches],
+    )
+    lines += _family(
+        "audiobook_cache_misses_total",
+        "counter",
+        "Cache lookups that did not.",
+        [(_labels(cache=name), misses) for name, _, misses in caches],
+    )
+    lines += _family(
+        "audiobook_cache_hit_ratio",
+        "gauge",
+        "Hits over lookups since start.",
+        [
+            (_labels(cache=name), hits / (hits + misses) if hits + misses else 0.0)
+            for name, hits, misses in caches
+        ],
+    )
+    return lines
+
+
+def render_metrics(metrics: RequestMetrics = request_metrics) -> str:
+    """Every metric in the Prometheus text format; call on the event loop."""
+    lines = metrics.render()
+    lines += _pool_lines()
+    lines += _threadpool_lines()
+    lines += _cache_lines()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,371 @@
+"""Versioned schema migrations.
+
+Each migration brings an existing database one step closer to the models in
+``schema.py``; applied versions are recorded in ``schema_migrations``. On
+startup ``ensure_schema`` reads the current version, a single row, instead
+of reflecting every table as ``create_all`` does, and only does more when the
+database is new (``create_all``, then stamped as current) or behind (upgraded
+if ``migrate_on_startup``, refused otherwise). From the command line::
+
+    python migrations.py status
+    python migrations.py upgrade [--to VERSION]
+    python migrations.py stamp [VERSION]
+
+Migrations check what is already there before changing anything, so they
+are safe to re-run, and a database created by ``create_all`` before
+migrations existed upgrades cleanly. ``upgrade`` builds indexes one per
+transaction: in WAL mode readers are never blocked, and writers wait for at
+most one index build at a time (up to ``sqlite_busy_timeout_ms``). At
+startup, where several workers may find the same database behind,
+``ensure_schema`` instead runs the whole upgrade in one write transaction.
+"""
+
+import argparse
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel
+
+import search
+from database import engine
+from rating_aggregates import rebuild_rating_aggregates
+from schema import RatingAggregate
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def register(apply):
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+
+    return register
+
+
+# The current UTC time as SQLAlchemy stores a DateTime in SQLite, so it
+# compares and sorts correctly with the values written by the models.
+NOW = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+def _has_column(connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(connection).get_columns(table)}
+
+
+def _has_unique(connection, table: str, columns: List[str]) -> bool:
+    inspector = inspect(connection)
+    uniques = [c["column_names"] for c in inspector.get_unique_constraints(table)]
+    uniques += [i["column_names"] for i in inspector.get_indexes(table) if i["unique"]]
+    return columns in uniques
+
+
+def add_column(db_engine, table: str, column: str, definition: str, backfill=None):
+    """``ALTER TABLE ... ADD COLUMN`` unless present, then fill its NULLs with ``backfill``.
+
+    SQLite cannot add a column with a non-constant default, so timestamps are
+    added nullable and backfilled from an existing column. The backfill also
+    runs when the column is already there, so a re-run fills rows written
+    without it in between.
+    """
+    with db_engine.begin() as connection:
+        if not _has_column(connection, table, column):
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+            )
+        if backfill is not None:
+            connection.exec_driver_sql(
+                f"UPDATE {table} SET {column} = coalesce({backfill}, {NOW})"
+                f" WHERE {column} IS NULL"
+            )
+
+
+def create_indexes(db_engine, *names: str):
+    """Create the model indexes called ``names`` that do not exist yet."""
+    indexes = {
+        index.name: index
+        for table in SQLModel.metadata.tables.values()
+        for index in table.indexes
+    }
+    for name in names:
+        # One transaction per index keeps each write lock short.
+        with db_engine.begin() as connection:
+            indexes[name].create(connection, checkfirst=True)
+
+
+@migration(1, "Rating aggregates")
+def add_rating_aggregates(db_engine):
+    with db_engine.begin() as connection:
+        if inspect(connection).has_table(RatingAggregate.__tablename__):
+            return
+        RatingAggregate.__table__.create(connection)
+        with Session(bind=connection) as session:
+            rebuild_rating_aggregates(session)
+
+
+@migration(2, "Unique listening session key")
+def add_listening_session_key(db_engine):
+    columns = ["user_id", "audiobook_id", "started_at"]
+    with db_engine.begin() as connection:
+        if _has_unique(connection, "listeninghistory", columns):
+            return
+        # Fails on duplicate sessions, which have to be merged by hand first.
+        connection.exec_driver_sql(
+            "CREATE UNIQUE INDEX uq_listeninghistory_session"
+            f" ON listeninghistory ({', '.join(columns)})"
+        )
+
+
+@migration(3, "Catalog search index")
+def add_catalog_search(db_engine):
+    with db_engine.begin() as connection:
+        if connection.dialect.name != "sqlite":
+            return
+        exists = inspect(connection).has_table(next(iter(search.TABLES)))
+        for statement in search.DDL:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            with Session(bind=connection) as session:
+                search.rebuild_search_index(session)
+
+
+@migration(4, "updated_at on activity tables")
+def add_updated_at(db_engine):
+    for table, since in [
+        ("listeninghistory", "started_at"),
+        ("review", "created_at"),
+        ("rating", "created_at"),
+        ("purchase", "purchase_date"),
+    ]:
+        add_column(db_engine, table, "updated_at", "DATETIME", backfill=since)
+        create_indexes(db_engine, f"ix_{table}_updated_at")
+
+
+@migration(5, "Resume bookmarks")
+def add_resume_bookmarks(db_engine):
+    add_column(db_engine, "bookmark", "is_resume", "BOOLEAN NOT NULL DEFAULT 0")
+    add_column(db_engine, "bookmark", "updated_at", "DATETIME", backfill="created_at")
+    create_indexes(db_engine, "ix_bookmark_resume")
+
+
+@migration(6, "Foreign key and list filter indexes")
+def add_list_filter_indexes(db_engine):
+    create_indexes(
+        db_engine,
+        "ix_usersubscriptionlink_subscription_id",
+        "ix_audiobookcategorylink_category_id",
+        "ix_audiobook_author_id",
+        "ix_audiobook_narrator_id",
+        "ix_chapter_audiobook_position",
+        "ix_listeninghistory_started_at",
+        "ix_listeninghistory_user_started",
+        "ix_listeninghistory_audiobook_started",
+        "ix_bookmark_audiobook_id",
+        "ix_bookmark_chapter_id",
+        "ix_bookmark_user_audiobook",
+        "ix_review_created_at",
+        "ix_review_user_created",
+        "ix_review_audiobook_created",
+        "ix_rating_created_at",
+        "ix_rating_user_created",
+        "ix_rating_audiobook_created",
+        "ix_purchase_purchase_date",
+        "ix_purchase_user_date",
+        "ix_purchase_audiobook_date",
+    )
+
+
+@migration(7, "External-content catalog search index")
+def use_external_content_search(db_engine):
+    with db_engine.begin() as connection:
+        if connection.dialect.name != "sqlite":
+            return
+        table = next(iter(search.TABLES))
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = ?", (table,)
+        ).scalar()
+        if sql is not None and search.DOCUMENT in sql:
+            return
+        triggers = connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master"
+            " WHERE type = 'trigger' AND name LIKE 'catalog_search_%'"
+        ).scalars()
+        for trigger in list(triggers):
+            connection.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        search.drop_search_tables(connection)
+        for statement in search.DDL:
+            connection.exec_driver_sql(statement)
+        with Session(bind=connection) as session:
+            search.rebuild_search_index(session)
+
+
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(db_engine) -> Optional[int]:
+    """The applied version, ``None`` if the database has never been migrated."""
+    try:
+        with db_engine.connect() as connection:
+            return connection.exec_driver_sql(
+                "SELECT max(version) FROM schema_migrations"
+            ).scalar_one()
+    except OperationalError:
+        return None
+
+
+def _record(db_engine, migrations: List[Migration]):
+    with db_engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        applied = set(connection.execute(schema_migrations.select()).scalars())
+        rows = [
+            dict(version=m.version, description=m.description)
+            for m in migrations
+            if m.version not in applied
+        ]
+        if rows:
+            connection.execute(schema_migrations.insert(), rows)
+
+
+def _is_empty(db_engine) -> bool:
+    with db_engine.connect() as connection:
+        return not inspect(connection).get_table_names()
+
+
+class _Serialized:
+    """Stands in for the engine while ``ensure_schema`` holds the write lock.
+
+    ``connect`` and ``begin`` both hand out the one locked connection, so
+    every migration runs inside its transaction.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    @contextmanager
+    def connect(self):
+        yield self._connection
+
+    begin = connect
+
+
+@contextmanager
+def _serialized(db_engine):
+    """One ``BEGIN IMMEDIATE`` transaction, committed if the block succeeds.
+
+    Workers starting together queue here, one at a time; those waiting
+    longer than ``sqlite_busy_timeout_ms`` keep waiting.
+    """
+    with db_engine.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            while True:
+                try:
+                    connection.exec_driver_sql("BEGIN IMMEDIATE")
+                    break
+                except OperationalError as error:
+                    if "locked" not in str(error.orig):
+                        raise
+                    logger.info("Waiting for another process to migrate")
+        yield _Serialized(connection)
+        connection.commit()
+
+
+def upgrade(db_engine, target: int = HEAD) -> List[Migration]:
+    """Apply the migrations after the current version up to ``target``.
+
+    A database without any tables is created from the models instead and
+    stamped as ``HEAD``.
+    """
+    version = current_version(db_engine)
+    if version is None and _is_empty(db_engine):
+        with db_engine.begin() as connection:
+            SQLModel.metadata.create_all(connection)
+        stamp(db_engine)
+        return []
+    pending = [m for m in MIGRATIONS if (version or 0) < m.version <= target]
+    for m in pending:
+        logger.info("Applying migration %d: %s", m.version, m.description)
+        m.apply(db_engine)
+        _record(db_engine, [m])
+    return pending
+
+
+def stamp(db_engine, target: int = HEAD):
+    """Mark the migrations up to ``target`` as applied without running them."""
+    _record(db_engine, [m for m in MIGRATIONS if m.version <= target])
+
+
+def ensure_schema(db_engine, migrate: Optional[bool] = None) -> Optional[int]:
+    """Bring the database to ``HEAD`` at startup; returns the version found.
+
+    Unless the database is current, the version is read again and the
+    upgrade applied in one write transaction, so workers starting together
+    take turns and all but the first find nothing left to do.
+    """
+    version = current_version(db_engine)
+    if version == HEAD:
+        return version
+    with _serialized(db_engine) as locked:
+        version = current_version(locked)
+        if version == HEAD:
+            return version
+        if version is not None and version > HEAD:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than this code ({HEAD})"
+            )
+        if migrate is None:
+            migrate = get_settings().migrate_on_startup
+        if not migrate and (version is not None or not _is_empty(locked)):
+            raise RuntimeError(
+                f"Database schema version {version or 0} is behind {HEAD};"
+                " run `python migrations.py upgrade`"
+            )
+        upgrade(locked)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the database schema.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="show applied and pending migrations")
+    upgrade_parser = subparsers.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--to", type=int, default=HEAD, metavar="VERSION")
+    stamp_parser = subparsers.add_parser(
+        "stamp", help="mark migrations as applied without running them"
+    )
+    stamp_parser.add_argument("version", type=int, nargs="?", default=HEAD)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.to)
+        print(f"Applied {len(applied)} migrations")
+    elif args.command == "stamp":
+        stamp(engine, args.version)
+    version = current_version(engine) or 0
+    for m in MIGRATIONS:
+        state = "applied" if m.version <= version else "pending"
+        print(f"{m.version:4d}  {state:8s} {m.description}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import base64
+import binascii
+import json
+from typing import List, Optional
+
+from fastapi import HTTPException, Response
+from sqlmodel import Session, SQLModel
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(value) -> str:
+    payload = json.dumps({"after": value}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        value = json.loads(base64.urlsafe_b64decode(padded))["after"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Every list is keyed by an integer id; anything else would reach the SQL.
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+
+def paginate(
+    session: Session,
+    statement,
+    key,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> List[SQLModel]:
+    """Run a list query ordered by ``key`` with keyset or offset paging.
+
+    With ``cursor`` the page starts right after the row the cursor points at,
+    so it costs O(limit) however deep it is; without it ``skip``/``limit``
+    behave as before. Either way, when more rows follow, the cursor for the
+    next page is returned in the ``X-Next-Cursor`` header. A negative
+    ``limit`` still means no limit, as it does in SQLite: every remaining row
+    is returned and there is no next page.
+    """
+    statement = statement.order_by(key)
+    if cursor is not None:
+        statement = statement.where(key > decode_cursor(cursor))
+    else:
+        statement = statement.offset(skip)
+    if limit < 0:
+        return session.exec(statement.limit(limit)).all()
+    rows = session.exec(statement.limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if rows:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                getattr(rows[-1], key.key)
+            )
+    return rows
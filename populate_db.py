@@ -1,327 +1,455 @@
-from sqlmodel import Session, create_engine, SQLModel
-from schema import (
-    User,
-    Subscription,
-    Author,
-    Narrator,
-    Audiobook,
-    Chapter,
-    Category,
-    ListeningHistory,
-    Bookmark,
-    Review,
-    Rating,
-    Purchase,
-    UserSubscriptionLink,
-    AudiobookCategoryLink,
-)
-from datetime import datetime
-
-# Database URL for SQLite
-DATABASE_URL = "sqlite:///test_audiobook_app.db"
-
-# Create a new SQLite engine instance
-engine = create_engine(DATABASE_URL, echo=True)
-
-# Create all tables in the database
-SQLModel.metadata.create_all(engine)
-
-# Create a new session
-with Session(engine) as session:
-    # Adding sample users
-    user1 = User(
-        username="user1",
-        name="John Doe",
-        email="john@example.com",
-        password="password1",
-        created_at=datetime.utcnow(),
-    )
-    user2 = User(
-        username="user2",
-        name="Jane Smith",
-        email="jane@example.com",
-        password="password2",
-        created_at=datetime.utcnow(),
-    )
-    user3 = User(
-        username="user3",
-        name="Alice Johnson",
-        email="alice@example.com",
-        password="password3",
-        created_at=datetime.utcnow(),
-    )
-
-    session.add(user1)
-    session.add(user2)
-    session.add(user3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample subscriptions
-    subscription1 = Subscription(
-        name="Monthly Plan", price=9.99, duration_days=30, created_at=datetime.utcnow()
-    )
-    subscription2 = Subscription(
-        name="Quarterly Plan",
-        price=27.99,
-        duration_days=90,
-        created_at=datetime.utcnow(),
-    )
-    subscription3 = Subscription(
-        name="Yearly Plan", price=99.99, duration_days=365, created_at=datetime.utcnow()
-    )
-
-    session.add(subscription1)
-    session.add(subscription2)
-    session.add(subscription3)
-    session.flush()  # Ensure IDs are populated
-
-    # Linking users to subscriptions
-    user_sub1 = UserSubscriptionLink(
-        user_id=user1.user_id,
-        subscription_id=subscription1.subscription_id,
-        start_date=datetime(2023, 1, 1),
-        end_date=datetime(2023, 12, 31),
-    )
-    user_sub2 = UserSubscriptionLink(
-        user_id=user2.user_id,
-        subscription_id=subscription2.subscription_id,
-        start_date=datetime(2023, 1, 1),
-        end_date=datetime(2023, 12, 31),
-    )
-    user_sub3 = UserSubscriptionLink(
-        user_id=user3.user_id,
-        subscription_id=subscription3.subscription_id,
-        start_date=datetime(2023, 1, 1),
-        end_date=datetime(2023, 12, 31),
-    )
-
-    session.add(user_sub1)
-    session.add(user_sub2)
-    session.add(user_sub3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample authors
-    author1 = Author(name="Author One", created_at=datetime.utcnow())
-    author2 = Author(name="Author Two", created_at=datetime.utcnow())
-    author3 = Author(name="Author Three", created_at=datetime.utcnow())
-
-    session.add(author1)
-    session.add(author2)
-    session.add(author3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample narrators
-    narrator1 = Narrator(name="Narrator One", created_at=datetime.utcnow())
-    narrator2 = Narrator(name="Narrator Two", created_at=datetime.utcnow())
-    narrator3 = Narrator(name="Narrator Three", created_at=datetime.utcnow())
-
-    session.add(narrator1)
-    session.add(narrator2)
-    session.add(narrator3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample audiobooks
-    audiobook1 = Audiobook(
-        title="Audiobook One",
-        author_id=author1.author_id,
-        narrator_id=narrator1.narrator_id,
-        duration=600,
-        created_at=datetime.utcnow(),
-    )
-    audiobook2 = Audiobook(
-        title="Audiobook Two",
-        author_id=author2.author_id,
-        narrator_id=narrator2.narrator_id,
-        duration=1200,
-        created_at=datetime.utcnow(),
-    )
-    audiobook3 = Audiobook(
-        title="Audiobook Three",
-        author_id=author3.author_id,
-        narrator_id=narrator3.narrator_id,
-        duration=1800,
-        created_at=datetime.utcnow(),
-    )
-
-    session.add(audiobook1)
-    session.add(audiobook2)
-    session.add(audiobook3)
-    session.flush()  # Ensure IDs are populated
-
-    # Linking audiobooks to categories
-    category1 = Category(name="Category One", created_at=datetime.utcnow())
-    category2 = Category(name="Category Two", created_at=datetime.utcnow())
-    category3 = Category(name="Category Three", created_at=datetime.utcnow())
-
-    session.add(category1)
-    session.add(category2)
-    session.add(category3)
-    session.flush()  # Ensure IDs are populated
-
-    audiobook_category1 = AudiobookCategoryLink(
-        audiobook_id=audiobook1.audiobook_id, category_id=category1.category_id
-    )
-    audiobook_category2 = AudiobookCategoryLink(
-        audiobook_id=audiobook2.audiobook_id, category_id=category2.category_id
-    )
-    audiobook_category3 = AudiobookCategoryLink(
-        audiobook_id=audiobook3.audiobook_id, category_id=category3.category_id
-    )
-
-    session.add(audiobook_category1)
-    session.add(audiobook_category2)
-    session.add(audiobook_category3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample chapters
-    chapter1 = Chapter(
-        audiobook_id=audiobook1.audiobook_id,
-        title="Chapter One",
-        duration=300,
-        position=1,
-        created_at=datetime.utcnow(),
-    )
-    chapter2 = Chapter(
-        audiobook_id=audiobook2.audiobook_id,
-        title="Chapter Two",
-        duration=300,
-        position=1,
-        created_at=datetime.utcnow(),
-    )
-    chapter3 = Chapter(
-        audiobook_id=audiobook3.audiobook_id,
-        title="Chapter Three",
-        duration=300,
-        position=1,
-        created_at=datetime.utcnow(),
-    )
-
-    session.add(chapter1)
-    session.add(chapter2)
-    session.add(chapter3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample listening histories
-    history1 = ListeningHistory(
-        user_id=user1.user_id,
-        audiobook_id=audiobook1.audiobook_id,
-        started_at=datetime.utcnow(),
-    )
-    history2 = ListeningHistory(
-        user_id=user2.user_id,
-        audiobook_id=audiobook2.audiobook_id,
-        started_at=datetime.utcnow(),
-    )
-    history3 = ListeningHistory(
-        user_id=user3.user_id,
-        audiobook_id=audiobook3.audiobook_id,
-        started_at=datetime.utcnow(),
-    )
-
-    session.add(history1)
-    session.add(history2)
-    session.add(history3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample bookmarks
-    bookmark1 = Bookmark(
-        user_id=user1.user_id,
-        audiobook_id=audiobook1.audiobook_id,
-        chapter_id=chapter1.chapter_id,
-        position=150,
-        created_at=datetime.utcnow(),
-    )
-    bookmark2 = Bookmark(
-        user_id=user2.user_id,
-        audiobook_id=audiobook2.audiobook_id,
-        chapter_id=chapter2.chapter_id,
-        position=150,
-        created_at=datetime.utcnow(),
-    )
-    bookmark3 = Bookmark(
-        user_id=user3.user_id,
-        audiobook_id=audiobook3.audiobook_id,
-        chapter_id=chapter3.chapter_id,
-        position=150,
-        created_at=datetime.utcnow(),
-    )
-
-    session.add(bookmark1)
-    session.add(bookmark2)
-    session.add(bookmark3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample reviews
-    review1 = Review(
-        user_id=user1.user_id,
-        audiobook_id=audiobook1.audiobook_id,
-        review_text="Great audiobook!",
-        created_at=datetime.utcnow(),
-    )
-    review2 = Review(
-        user_id=user2.user_id,
-        audiobook_id=audiobook2.audiobook_id,
-        review_text="Amazing audiobook!",
-        created_at=datetime.utcnow(),
-    )
-    review3 = Review(
-        user_id=user3.user_id,
-        audiobook_id=audiobook3.audiobook_id,
-        review_text="Loved it!",
-        created_at=datetime.utcnow(),
-    )
-
-    session.add(review1)
-    session.add(review2)
-    session.add(review3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample ratings
-    rating1 = Rating(
-        user_id=user1.user_id,
-        audiobook_id=audiobook1.audiobook_id,
-        rating=5,
-        created_at=datetime.utcnow(),
-    )
-    rating2 = Rating(
-        user_id=user2.user_id,
-        audiobook_id=audiobook2.audiobook_id,
-        rating=4,
-        created_at=datetime.utcnow(),
-    )
-    rating3 = Rating(
-        user_id=user3.user_id,
-        audiobook_id=audiobook3.audiobook_id,
-        rating=5,
-        created_at=datetime.utcnow(),
-    )
-
-    session.add(rating1)
-    session.add(rating2)
-    session.add(rating3)
-    session.flush()  # Ensure IDs are populated
-
-    # Adding sample purchases
-    purchase1 = Purchase(
-        user_id=user1.user_id,
-        audiobook_id=audiobook1.audiobook_id,
-        purchase_date=datetime.utcnow(),
-    )
-    purchase2 = Purchase(
-        user_id=user2.user_id,
-        audiobook_id=audiobook2.audiobook_id,
-        purchase_date=datetime.utcnow(),
-    )
-    purchase3 = Purchase(
-        user_id=user3.user_id,
-        audiobook_id=audiobook3.audiobook_id,
-        purchase_date=datetime.utcnow(),
-    )
-
-    session.add(purchase1)
-    session.add(purchase2)
-    session.add(purchase3)
-
-    session.commit()
-
-print("Database populated with sample data.")
+"""Generate a large, realistic catalog and activity history to test against.
+
+Usage::
+
+    python populate_db.py [--listening-histories 10000000] [--users 200000]
+                          [--audiobooks 50000] [--seed 1] [--reset]
+
+Writes to ``AUDIOBOOK_DATABASE_URL``, the database the app uses, which has
+to be empty unless ``--reset`` drops what is there. Everything is drawn from
+one seeded ``random.Random``, so a seed always produces the same database.
+
+Activity is skewed the way it is in production: audiobook popularity
+follows a Zipf distribution (``--zipf``), as does how much each user
+listens, ratings lean positive and books have from a handful to dozens of
+chapters. Bookmarks, purchases, ratings and reviews are sized relative to
+``--listening-histories``.
+
+Rows go in through ``executemany`` in transactions of ``--batch`` rows with
+``synchronous=OFF``. Tables are created without their secondary indexes,
+search triggers and the listening-session key, which are built once the data
+is in, followed by the search index, rating aggregates and ``ANALYZE``. The
+database is then stamped with the current migration version.
+"""
+
+import argparse
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import MetaData, UniqueConstraint
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateTable
+from sqlmodel import Session, SQLModel, inspect
+
+import search
+from database import create_db_engine
+from migrations import add_listening_session_key, schema_migrations, stamp
+from rating_aggregates import rebuild_rating_aggregates
+from settings import Settings, get_settings
+
+CATEGORIES = [
+    "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Horror",
+    "Historical Fiction", "Literary Fiction", "Biography", "Memoir", "History",
+    "Science", "Self-Help", "Business", "Psychology", "Philosophy", "Poetry",
+    "Travel", "True Crime", "Young Adult", "Children", "Humor", "Health",
+    "Religion", "Politics", "Sports", "Music", "Drama", "Classics", "Comics",
+]  # fmt: skip
+FIRST_NAMES = [
+    "Ada", "Ben", "Chloe", "Dmitri", "Elena", "Farid", "Grace", "Hiro", "Ines",
+    "Jonas", "Kemi", "Liam", "Maya", "Nils", "Olga", "Priya", "Quinn", "Rosa",
+    "Sven", "Tariq", "Uma", "Victor", "Wen", "Ximena", "Yusuf", "Zoe",
+]  # fmt: skip
+LAST_NAMES = [
+    "Adams", "Bauer", "Costa", "Dubois", "Eriksen", "Fischer", "Garcia", "Hall",
+    "Ivanova", "Jensen", "Kowalski", "Lopez", "Moreau", "Nakamura", "Okafor",
+    "Petrov", "Rossi", "Schmidt", "Tanaka", "Usman", "Vargas", "Weber", "Young",
+]  # fmt: skip
+TITLE_WORDS = [
+    "Shadow", "River", "Empire", "Garden", "Winter", "Machine", "Silence",
+    "Crown", "Harbor", "Storm", "Mirror", "Desert", "Forest", "Signal", "Ember",
+    "Orbit", "Lantern", "Citadel", "Tide", "Archive", "Fox", "Glass", "Iron",
+]  # fmt: skip
+REVIEWS = [
+    "Couldn't stop listening.", "The narration carried it.", "Slow start, great "
+    "ending.", "Not for me.", "Wonderful performance by the narrator.",
+    "Too long by half.", "Listened twice already.", "Great for commutes.",
+]  # fmt: skip
+# Rating stars 1-5 lean positive, as on every review site.
+RATING_WEIGHTS = [4, 6, 15, 35, 40]
+NOW = datetime(2024, 6, 1)
+HISTORY_DAYS = 730
+
+
+def timestamp(moment: datetime) -> str:
+    # The format SQLAlchemy stores DATETIME columns in on SQLite.
+    return moment.isoformat(" ", "microseconds")
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.start = NOW - timedelta(days=HISTORY_DAYS)
+
+    def moment(self) -> datetime:
+        return self.start + timedelta(seconds=self.rng.random() * HISTORY_DAYS * 86400)
+
+    def popularity(self, count: int, exponent: float):
+        """Ids 1..count ranked by a shuffle and their cumulative Zipf weights.
+
+        Shuffling ranks onto ids keeps the most popular rows from all being
+        the oldest ones.
+        """
+        ids = list(range(1, count + 1))
+        self.rng.shuffle(ids)
+        weights = itertools.accumulate(
+            1 / rank**exponent for rank in range(1, count + 1)
+        )
+        return ids, list(weights)
+
+    def picks(self, popularity, k: int):
+        """``k`` ids drawn from ``popularity``."""
+        ids, cum_weights = popularity
+        return self.rng.choices(ids, cum_weights=cum_weights, k=k)
+
+    def name(self) -> str:
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    # One generator of row tuples per table, in insertion order.
+
+    def users(self):
+        for i in range(1, self.args.users + 1):
+            created = timestamp(self.moment())
+            yield (f"user{i}", self.name(), f"user{i}@example.com", "x", created)
+
+    def subscriptions(self):
+        yield ("Monthly Plan", 9.99, 30, timestamp(self.start))
+        yield ("Quarterly Plan", 27.99, 90, timestamp(self.start))
+        yield ("Yearly Plan", 99.99, 365, timestamp(self.start))
+
+    def user_subscriptions(self):
+        for user_id in range(1, self.args.users + 1):
+            if self.rng.random() < 0.3:
+                subscription_id = self.rng.randint(1, 3)
+                start = self.moment()
+                days = (30, 90, 365)[subscription_id - 1]
+                end = start + timedelta(days=days)
+                yield (user_id, subscription_id, timestamp(start), timestamp(end))
+
+    def authors(self):
+        for _ in range(self.authors_count):
+            yield (self.name(), None, timestamp(self.start))
+
+    def narrators(self):
+        for _ in range(self.narrators_count):
+            yield (self.name(), None, timestamp(self.start))
+
+    def categories(self):
+        for name in CATEGORIES:
+            yield (name, timestamp(self.start))
+
+    def audiobooks(self):
+        # Chapter counts and durations are decided here so the audiobook's
+        # duration is the sum of its chapters'.
+        self.chapters_of = []
+        for i in range(1, self.args.audiobooks + 1):
+            count = min(80, max(3, int(self.rng.lognormvariate(2.7, 0.6))))
+            durations = [self.rng.randint(300, 3600) for _ in range(count)]
+            self.chapters_of.append(durations)
+            title = " ".join(self.rng.sample(TITLE_WORDS, 2))
+            yield (
+                f"The {title} {i}",
+                self.rng.randint(1, self.authors_count),
+                self.rng.randint(1, self.narrators_count),
+                sum(durations),
+                None,
+                timestamp(self.moment()),
+                timestamp(self.start),
+            )
+
+    def chapters(self):
+        self.first_chapter = []
+        chapter_id = 1
+        for audiobook_id, durations in enumerate(self.chapters_of, 1):
+            self.first_chapter.append(chapter_id)
+            for position, duration in enumerate(durations, 1):
+                yield (
+                    audiobook_id,
+                    f"Chapter {position}",
+                    duration,
+                    position,
+                    timestamp(self.start),
+                )
+            chapter_id += len(durations)
+
+    def audiobook_categories(self):
+        for audiobook_id in range(1, self.args.audiobooks + 1):
+            for category_id in self.rng.sample(
+                range(1, len(CATEGORIES) + 1), self.rng.randint(1, 3)
+            ):
+                yield (audiobook_id, category_id)
+
+    def activity(self, count: int):
+        """``(user_id, audiobook_id, moment)`` for ``count`` skewed events."""
+        user_ids = self.picks(self.user_popularity, count)
+        audiobook_ids = self.picks(self.audiobook_popularity, count)
+        for user_id, audiobook_id in zip(user_ids, audiobook_ids):
+            yield user_id, audiobook_id, self.moment()
+
+    def in_batches(self, rows_of, total: int):
+        # Draws activity a batch at a time to bound memory at 10M rows.
+        batch = self.args.batch
+        for offset in range(0, total, batch):
+            yield from rows_of(self.activity(min(batch, total - offset)))
+
+    def listening_histories(self):
+        def rows(events):
+            for user_id, audiobook_id, started in events:
+                finished = None
+                updated = started
+                if self.rng.random() < 0.6:
+                    length = sum(self.chapters_of[audiobook_id - 1])
+                    updated = started + timedelta(seconds=length * 1.2)
+                    finished = timestamp(updated)
+                yield (
+                    user_id,
+                    audiobook_id,
+                    timestamp(started),
+                    finished,
+                    timestamp(updated),
+                )
+
+        return self.in_batches(rows, self.args.listening_histories)
+
+    def bookmarks(self):
+        def rows(events):
+            for user_id, audiobook_id, created in events:
+                durations = self.chapters_of[audiobook_id - 1]
+                index = self.rng.randrange(len(durations))
+                created = timestamp(created)
+                yield (
+                    user_id,
+                    audiobook_id,
+                    self.first_chapter[audiobook_id - 1] + index,
+                    sum(durations[:index]) + self.rng.randrange(durations[index]),
+                    False,
+                    created,
+                    created,
+                )
+
+        return self.in_batches(rows, self.args.listening_histories // 4)
+
+    def reviews(self):
+        def rows(events):
+            for user_id, audiobook_id, created in events:
+                created = timestamp(created)
+                yield (
+                    user_id,
+                    audiobook_id,
+                    self.rng.choice(REVIEWS),
+                    created,
+                    created,
+                )
+
+        return self.in_batches(rows, self.args.listening_histories // 50)
+
+    def ratings(self):
+        def rows(events):
+            stars = self.rng.choices(range(1, 6), RATING_WEIGHTS, k=self.args.batch)
+            for (user_id, audiobook_id, created), rating in zip(events, stars):
+                created = timestamp(created)
+                yield (user_id, audiobook_id, rating, created, created)
+
+        return self.in_batches(rows, self.args.listening_histories // 20)
+
+    def purchases(self):
+        def rows(events):
+            for user_id, audiobook_id, purchased in events:
+                purchased = timestamp(purchased)
+                yield (user_id, audiobook_id, purchased, purchased)
+
+        return self.in_batches(rows, self.args.listening_histories // 10)
+
+    def tables(self):
+        """``(table, columns, rows)`` in insertion order."""
+        self.authors_count = max(1, self.args.audiobooks // 5)
+        self.narrators_count = max(1, self.args.audiobooks // 10)
+        self.user_popularity = self.popularity(self.args.users, 0.8)
+        self.audiobook_popularity = self.popularity(
+            self.args.audiobooks, self.args.zipf
+        )
+        return [
+            ("user", "username name email password created_at", self.users),
+            (
+                "subscription",
+                "name price duration_days created_at",
+                self.subscriptions,
+            ),
+            (
+                "usersubscriptionlink",
+                "user_id subscription_id start_date end_date",
+                self.user_subscriptions,
+            ),
+            ("author", "name bio created_at", self.authors),
+            ("narrator", "name bio created_at", self.narrators),
+            ("category", "name created_at", self.categories),
+            (
+                "audiobook",
+                "title author_id narrator_id duration description release_date"
+                " created_at",
+                self.audiobooks,
+            ),
+            (
+                "chapter",
+                "audiobook_id title duration position created_at",
+                self.chapters,
+            ),
+            (
+                "audiobookcategorylink",
+                "audiobook_id category_id",
+                self.audiobook_categories,
+            ),
+            (
+                "listeninghistory",
+                "user_id audiobook_id started_at finished_at updated_at",
+                self.listening_histories,
+            ),
+            (
+                "bookmark",
+                "user_id audiobook_id chapter_id position is_resume created_at"
+                " updated_at",
+                self.bookmarks,
+            ),
+            (
+                "review",
+                "user_id audiobook_id review_text created_at updated_at",
+                self.reviews,
+            ),
+            (
+                "rating",
+                "user_id audiobook_id rating created_at updated_at",
+                self.ratings,
+            ),
+            (
+                "purchase",
+                "user_id audiobook_id purchase_date updated_at",
+                self.purchases,
+            ),
+        ]
+
+
+def create_bare_tables(db_engine):
+    """The model tables without secondary indexes or multi-column unique keys."""
+    metadata = MetaData()
+    with db_engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            bare = table.to_metadata(metadata)
+            for constraint in list(bare.constraints):
+                if (
+                    isinstance(constraint, UniqueConstraint)
+                    and len(constraint.columns) > 1
+                ):
+                    bare.constraints.remove(constraint)
+            connection.execute(CreateTable(bare))
+
+
+def timed(label: str, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<46} {time.perf_counter() - start:8.1f} s")
+    return result
+
+
+def load(db_engine, generator: Generator, batch: int) -> int:
+    connection = db_engine.raw_connection()
+    total = 0
+    try:
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA synchronous=OFF")
+        for table, columns, rows in generator.tables():
+            columns = columns.split()
+            statement = (
+                f'INSERT INTO "{table}" ({", ".join(columns)})'
+                f' VALUES ({", ".join("?" * len(columns))})'
+            )
+            start = time.perf_counter()
+            count = 0
+            rows = rows()
+            while True:
+                chunk = list(itertools.islice(rows, batch))
+                if not chunk:
+                    break
+                cursor.executemany(statement, chunk)
+                connection.commit()
+                count += len(chunk)
+            elapsed = time.perf_counter() - start
+            rate = count / elapsed if elapsed else 0
+            print(
+                f"{table:<22} {count:>11,} rows {elapsed:8.1f} s {rate:>10,.0f} rows/s"
+            )
+            total += count
+    finally:
+        connection.close()
+    return total
+
+
+def finish(db_engine):
+    """Everything the bare tables left out, built over the loaded data."""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            with db_engine.begin() as connection:
+                timed(f"index {index.name}", lambda: index.create(connection))
+    timed(
+        "index uq_listeninghistory_session",
+        lambda: add_listening_session_key(db_engine),
+    )
+
+    def build_search():
+        with db_engine.begin() as connection:
+            for statement in search.DDL:
+                connection.exec_driver_sql(statement)
+            with Session(bind=connection) as session:
+                search.rebuild_search_index(session)
+
+    def build_rating_aggregates():
+        with db_engine.begin() as connection:
+            with Session(bind=connection) as session:
+                rebuild_rating_aggregates(session)
+
+    timed("catalog search index", build_search)
+    timed("rating aggregates", build_rating_aggregates)
+    with db_engine.begin() as connection:
+        timed("ANALYZE", lambda: connection.exec_driver_sql("ANALYZE"))
+    stamp(db_engine)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listening-histories", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--audiobooks", type=int, default=20_000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="popularity skew")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch", type=int, default=200_000, help="rows per commit")
+    parser.add_argument("--database-url", default=get_settings().database_url)
+    parser.add_argument("--reset", action="store_true", help="drop existing tables")
+    args = parser.parse_args(argv)
+
+    db_engine = create_db_engine(Settings(database_url=args.database_url))
+    if make_url(args.database_url).get_backend_name() != "sqlite":
+        parser.error("the generator writes SQLite databases only")
+    if inspect(db_engine).get_table_names():
+        if not args.reset:
+            parser.error(f"{args.database_url} is not empty; pass --reset to drop it")
+        SQLModel.metadata.drop_all(db_engine)
+        schema_migrations.drop(db_engine, checkfirst=True)
+
+    start = time.perf_counter()
+    create_bare_tables(db_engine)
+    rows = load(db_engine, Generator(args), args.batch)
+    loaded = time.perf_counter() - start
+    print(
+        f"{'loaded':<22} {rows:>11,} rows {loaded:8.1f} s {rows / loaded:>10,.0f} rows/s"
+    )
+    finish(db_engine)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'total':<22} {rows:>11,} rows {elapsed:8.1f} s {rows / elapsed:>10,.0f} rows/s"
+    )
+    db_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
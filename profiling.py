@@ -0,0 +1,236 @@
+"""On-demand request profiling, written as collapsed stacks for flame graphs.
+
+``ProfilingMiddleware`` profiles a request when it carries the secret
+``profiling_token``, as an ``X-Profile`` header or ``?profile=`` query
+parameter, and every ``profiling_sample_every``-th request when that is set.
+``main`` only installs it when one of the two is configured, so with
+profiling off requests do not pass through it at all.
+
+While a request is profiled a ``StackSampler`` thread records the Python
+stack of every other thread each ``profiling_interval_ms``, skipping threads
+that are idle waiting on a lock, queue or socket. Sampling sees the
+threadpool workers sync handlers run on, which a per-thread profiler such as
+cProfile would miss. The profile covers the whole process for the duration
+of the request, so concurrent requests show up in it too, each stack rooted
+at the name of its thread. The interval is a floor: a sampler competing for
+the GIL with busy threads gets to run every switch interval (5 ms).
+
+Profiles are written to ``profiling_dir`` as one ``stack count`` line per
+distinct stack, the format ``flamegraph.pl`` and speedscope read::
+
+    curl -H "X-Profile: $TOKEN" http://127.0.0.1:8000/audiobooks/
+    flamegraph.pl profiles/<X-Profile header of the response> > flame.svg
+
+A requested profile's file name is returned in the ``X-Profile`` response
+header. Only the newest ``profiling_max_files`` profiles are kept, and a
+profile is cut to its heaviest stacks that fit in ``profiling_max_file_kb``.
+Stopping the sampler and writing happen on the threadpool, not the loop.
+"""
+
+import hmac
+import itertools
+import logging
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.concurrency import run_in_threadpool
+
+from sql_instrumentation import route_template
+
+logger = logging.getLogger(__name__)
+
+STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+HEADER = b"x-profile"
+SUFFIX = ".collapsed"
+QUERY_PARAMETER = "profile"
+# Innermost Python frames of a thread that is waiting rather than working.
+IDLE = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+
+@lru_cache(maxsize=None)
+def _label(code) -> str:
+    filename = code.co_filename
+    if "site-packages" in filename:
+        filename = filename.rsplit("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(STDLIB):
+        filename = filename[len(STDLIB) :]
+    elif filename.startswith(os.getcwd()):
+        filename = os.path.relpath(filename)
+    # ";" separates frames in the collapsed format.
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    """Labels of ``frame`` and its callers, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class StackSampler:
+    """Count the stacks of every other thread until stopped."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or _is_idle(frame):
+                    continue
+                thread = names.get(ident, str(ident)).replace(";", ",")
+                self.stacks[(thread, *_stack(frame))] += 1
+            self.samples += 1
+
+    def collapsed(self, max_bytes: Optional[int] = None) -> str:
+        """One ``frame;frame;... count`` line per stack, heaviest first.
+
+        With ``max_bytes``, the lightest stacks that do not fit are left out.
+        """
+        lines = []
+        size = 0
+        for stack, count in self.stacks.most_common():
+            line = f"{';'.join(stack)} {count}\n"
+            size += len(line.encode())
+            if max_bytes is not None and size > max_bytes:
+                break
+            lines.append(line)
+        return "".join(lines)
+
+
+class ProfilingMiddleware:
+    """Profile the requests asking for it with the token, and 1 in N others."""
+
+    def __init__(
+        self,
+        app,
+        token: Optional[str] = None,
+        sample_every: int = 0,
+        interval_ms: float = 1.0,
+        directory: str = "profiles",
+        max_files: int = 100,
+        max_file_kb: int = 1024,
+    ):
+        self.app = app
+        self.token = token.encode() if token else None
+        self.sample_every = sample_every
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_file_kb * 1024
+        # Writes from different threadpool workers; see _write.
+        self._write_lock = threading.Lock()
+        self._requests = itertools.count(1)
+
+    def _requested(self, scope) -> bool:
+        if self.token is None:
+            return False
+        supplied = dict(scope["headers"]).get(HEADER)
+        if supplied is None:
+            query = parse_qsl(scope.get("query_string", b"").decode())
+            supplied = dict(query).get(QUERY_PARAMETER, "").encode()
+        return hmac.compare_digest(supplied, self.token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        number = next(self._requests)
+        requested = self._requested(scope)
+        sampled = self.sample_every and number % self.sample_every == 0
+        if not (requested or sampled):
+            return await self.app(scope, receive, send)
+
+        name = None
+
+        def filename():
+            # Named once routed, after the template of the matched route.
+            nonlocal name
+            if name is None:
+                route = re.sub(r"[^\w]+", "_", route_template(scope)).strip("_")
+                name = (
+                    f"{datetime.utcnow():%Y%m%dT%H%M%S}-{scope['method']}"
+                    f"-{route or 'root'}-{number}{SUFFIX}"
+                )
+            return name
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start" and requested:
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (HEADER, filename().encode()),
+                ]
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            elapsed = time.perf_counter() - start
+            await run_in_threadpool(self._finish, filename(), sampler, elapsed)
+
+    def _finish(self, name: str, sampler: StackSampler, elapsed: float):
+        sampler.stop()
+        self._write(name, sampler, elapsed)
+
+    def _write(self, name: str, sampler: StackSampler, elapsed: float):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with self._write_lock:
+            with open(path, "w") as f:
+                f.write(sampler.collapsed(self.max_bytes))
+            self._rotate()
+        logger.info(
+            "Profiled %s: %d samples in %.1f ms", path, sampler.samples, elapsed * 1000
+        )
+
+    def _rotate(self):
+        """Delete all but the newest ``max_files`` profiles."""
+        with os.scandir(self.directory) as entries:
+            profiles = sorted(
+                (entry for entry in entries if entry.name.endswith(SUFFIX)),
+                key=lambda entry: entry.stat().st_mtime_ns,
+            )
+        for entry in profiles[: max(0, len(profiles) - self.max_files)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                # Rotated by another worker sharing the directory.
+                pass
@@ -0,0 +1,177 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from autocomplete import record_listens
+from database import engine
+from schema import ListeningHistory, ListeningProgressEvent
+from settings import get_settings
+from timeutil import naive_utc
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[int, int, datetime]
+
+
+class ProgressBuffer:
+    """Bounded in-process buffer that writes listening progress behind requests.
+
+    Heartbeats for the same listening session (user, audiobook, started_at)
+    are coalesced in memory, keeping the latest ``reported_at``, and a
+    background thread upserts them into ``ListeningHistory.finished_at`` in
+    one transaction per batch. A flush happens once ``batch_size`` sessions
+    are pending or every ``flush_interval`` seconds, whichever comes first,
+    and ``stop()`` drains whatever is left. After a flush, the sessions it
+    started are counted by audiobook id and passed to ``on_new_sessions``
+    along with a connection.
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        on_new_sessions: Optional[Callable[..., None]] = None,
+    ):
+        self.engine = engine
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_new_sessions = on_new_sessions
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self._pending: Dict[SessionKey, datetime] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def offer(self, events: Iterable[ListeningProgressEvent]) -> bool:
+        """Queue ``events``; ``False`` (and nothing queued) if the buffer is full."""
+        now = datetime.utcnow()
+        updates = {}
+        for event in events:
+            key = (event.user_id, event.audiobook_id, naive_utc(event.started_at))
+            reported_at = naive_utc(event.reported_at or now)
+            if key not in updates or updates[key] < reported_at:
+                updates[key] = reported_at
+        with self._lock:
+            new_sessions = sum(1 for key in updates if key not in self._pending)
+            if len(self._pending) + new_sessions > self.max_size:
+                self.rejected += len(updates)
+                return False
+            for key, reported_at in updates.items():
+                if key not in self._pending or self._pending[key] < reported_at:
+                    self._pending[key] = reported_at
+            self.accepted += len(updates)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+        return True
+
+    def flush(self) -> int:
+        """Write every pending session in one transaction; returns rows written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        rows = [
+            dict(
+                user_id=user_id,
+                audiobook_id=audiobook_id,
+                started_at=started_at,
+                finished_at=reported_at,
+            )
+            for (user_id, audiobook_id, started_at), reported_at in batch.items()
+        ]
+        statement = insert(ListeningHistory)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "audiobook_id", "started_at"],
+            set_={
+                "finished_at": statement.excluded.finished_at,
+                "updated_at": statement.excluded.updated_at,
+            },
+        )
+        statement = statement.returning(
+            ListeningHistory.history_id, ListeningHistory.audiobook_id
+        )
+        try:
+            with self.engine.begin() as connection:
+                # Row ids only grow, so the sessions inserted rather than
+                # updated are the ones returned with a higher id than this.
+                last_id = connection.scalar(
+                    select(func.max(ListeningHistory.history_id))
+                )
+                written = connection.execute(statement, rows).all()
+        except Exception:
+            logger.exception("Failed to flush %d listening sessions", len(batch))
+            self._requeue(batch)
+            return 0
+        self.flushed += len(rows)
+        started = Counter(
+            audiobook_id
+            for history_id, audiobook_id in written
+            if history_id > (last_id or 0)
+        )
+        if started and self.on_new_sessions is not None:
+            try:
+                with self.engine.connect() as connection:
+                    self.on_new_sessions(connection, started)
+            except Exception:
+                logger.exception(
+                    "Failed to record %d new listening sessions", sum(started.values())
+                )
+        return len(rows)
+
+    def _requeue(self, batch: Dict[SessionKey, datetime]):
+        with self._lock:
+            for key, reported_at in batch.items():
+                if key in self._pending:
+                    continue
+                if len(self._pending) >= self.max_size:
+                    logger.error("Dropped unflushed progress for %s", key)
+                    continue
+                self._pending[key] = reported_at
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="progress-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and drain the buffer."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+settings = get_settings()
+progress_buffer = ProgressBuffer(
+    engine,
+    max_size=settings.progress_buffer_size,
+    batch_size=settings.progress_batch_size,
+    flush_interval=settings.progress_flush_interval,
+    on_new_sessions=record_listens,
+)
@@ -0,0 +1,100 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Type, get_args
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, SQLModel, select
+
+from timeutil import naive_utc
+
+
+def _nested_model(annotation) -> Optional[Type[SQLModel]]:
+    """Return the SQLModel class wrapped by a field annotation, if any.
+
+    Handles plain ``AuthorRead`` as well as ``Optional[NarratorRead]`` and
+    ``List[ChapterRead]``.
+    """
+    if isinstance(annotation, type) and issubclass(annotation, SQLModel):
+        return annotation
+    for arg in get_args(annotation):
+        nested = _nested_model(arg)
+        if nested is not None:
+            return nested
+    return None
+
+
+def _loader_options(model, response_model, parent=None) -> list:
+    mapper = inspect(model)
+    options = []
+    for name, field in response_model.model_fields.items():
+        nested = _nested_model(field.annotation)
+        if nested is None or name not in mapper.relationships:
+            continue
+        relationship = mapper.relationships[name]
+        attribute = getattr(model, name)
+        # Scalar relationships ride along in the same SELECT; collections get
+        # one extra SELECT ... WHERE fk IN (...) for the whole page.
+        strategy = selectinload if relationship.uselist else joinedload
+        if parent is None:
+            option = strategy(attribute)
+        else:
+            option = getattr(parent, strategy.__name__)(attribute)
+        options.append(option)
+        options.extend(_loader_options(relationship.mapper.class_, nested, option))
+    return options
+
+
+@lru_cache(maxsize=None)
+def eager_options(model, response_model) -> tuple:
+    """Loader options for every relationship ``response_model`` nests.
+
+    A response model declares what it needs simply by having a field named
+    after a relationship on ``model`` whose type is another SQLModel (e.g.
+    ``AudiobookRead.author: AuthorRead``). Those relationships are loaded up
+    front so serialization never triggers a lazy load.
+    """
+    return tuple(_loader_options(model, response_model))
+
+
+def select_for(model, response_model):
+    """``select(model)`` with the relationships of ``response_model`` eager-loaded."""
+    return select(model).options(*eager_options(model, response_model))
+
+
+def get_for(session: Session, model, response_model, ident):
+    """``session.get`` with the relationships of ``response_model`` eager-loaded."""
+    return session.get(model, ident, options=list(eager_options(model, response_model)))
+
+
+def get_many_for(session: Session, model, response_model, idents) -> dict:
+    """Rows of ``model`` with primary key in ``idents``, by primary key.
+
+    One ``SELECT ... WHERE pk IN (...)``, with the relationships of
+    ``response_model`` eager-loaded as in ``select_for``.
+    """
+    (pk,) = inspect(model).primary_key
+    statement = select_for(model, response_model).where(pk.in_(idents))
+    return {getattr(row, pk.key): row for row in session.exec(statement)}
+
+
+def filter_by(statement, filters: dict, period=None, since=None, until=None):
+    """Narrow a list query to the filters a client passed.
+
+    ``filters`` maps columns to requested values; ``None`` means not given.
+    ``since`` (inclusive) and ``until`` (exclusive) bound the ``period``
+    column, which holds naive UTC like every timestamp. Each combination
+    has an index; see test_indexes.py.
+    """
+    for column, value in filters.items():
+        if value is not None:
+            statement = statement.where(column == value)
+    if since is None and until is None:
+        return statement
+    # SQLite guesses a one-sided range matches a quarter of the table and
+    # would rather walk the primary key in page order; closing the range
+    # makes it search the period index instead.
+    return statement.where(
+        period >= (naive_utc(since) or datetime.min),
+        period < (naive_utc(until) or datetime.max),
+    )
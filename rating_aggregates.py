@@ -0,0 +1,76 @@
+"""Maintenance of the per-audiobook ``RatingAggregate`` rows.
+
+Rebuild every aggregate from the ``Rating`` table with::
+
+    python rating_aggregates.py rebuild
+"""
+
+import argparse
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session
+
+from database import engine
+from schema import Rating, RatingAggregate
+
+STAR_COLUMNS = [f"stars_{stars}" for stars in range(1, 6)]
+
+
+def apply_rating(session: Session, audiobook_id: int, rating: int, delta: int):
+    """Add (``delta=1``) or remove (``delta=-1``) one rating from an aggregate.
+
+    Runs as a single UPSERT in the caller's transaction, so the aggregate
+    commits or rolls back together with the rating row itself.
+    """
+    star_column = f"stars_{rating}"
+    statement = insert(RatingAggregate).values(
+        audiobook_id=audiobook_id,
+        rating_count=delta,
+        rating_sum=delta * rating,
+        **{star_column: delta},
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["audiobook_id"],
+        set_={
+            "rating_count": RatingAggregate.rating_count + delta,
+            "rating_sum": RatingAggregate.rating_sum + delta * rating,
+            star_column: getattr(RatingAggregate, star_column) + delta,
+        },
+    )
+    session.execute(statement)
+
+
+def rebuild_rating_aggregates(session: Session) -> int:
+    """Recompute every aggregate from ``Rating`` in one grouped scan."""
+    session.execute(delete(RatingAggregate))
+    totals = select(
+        Rating.audiobook_id,
+        func.count(),
+        func.sum(Rating.rating),
+        *[
+            func.sum(case((Rating.rating == stars, 1), else_=0))
+            for stars in range(1, 6)
+        ],
+    ).group_by(Rating.audiobook_id)
+    result = session.execute(
+        insert(RatingAggregate).from_select(
+            ["audiobook_id", "rating_count", "rating_sum", *STAR_COLUMNS], totals
+        )
+    )
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage rating aggregates.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    with Session(engine) as session:
+        rebuilt = rebuild_rating_aggregates(session)
+        session.commit()
+    print(f"Rebuilt rating aggregates for {rebuilt} audiobooks")
+
+
+if __name__ == "__main__":
+    main()
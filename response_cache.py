@@ -0,0 +1,465 @@
+"""Cache of serialized responses for the catalog read endpoints.
+
+``GET /audiobooks/{id}`` and the other single-entity reads of rarely
+changing catalog data go through ``response_cache.fetch``, which returns the
+JSON bytes of an earlier response while they are fresh and otherwise loads,
+serializes and stores a new one. The PUT and DELETE handlers of each
+router call ``response_cache.invalidate`` with the keys of every response
+their write changes, after committing.
+
+Concurrent misses on the same key, such as the burst of reads when a
+popular title launches, are coalesced so that only one of them queries the
+database (see ``single_flight.py``; ``AUDIOBOOK_RESPONSE_CACHE_SINGLE_FLIGHT``
+turns this off). A load that an invalidation of its key overtakes is
+returned but not stored, so it cannot put back what the write replaced.
+
+Two backends are available, chosen by ``AUDIOBOOK_RESPONSE_CACHE_BACKEND``:
+
+``memory``
+    An LRU dictionary with a TTL in each worker process. Invalidations only
+    reach the worker that made the write, so with several workers the TTL
+    bounds how stale another worker's entries can get.
+``shared``
+    A SQLite file every worker on the host opens, standing in for a shared
+    cache such as Redis: entries and invalidations are seen by all workers.
+    Only invalidations in the same worker stop a load from being stored, so
+    the TTL also bounds how long a load racing another worker's write lasts.
+
+``none`` disables caching.
+"""
+
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Response
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from lru import LRU
+from schema import Audiobook, CacheStats
+from serialization import MEDIA_TYPE, encoder_for
+from settings import Settings, get_settings
+from single_flight import SingleFlight
+
+CACHE_STATUS_HEADER = "X-Cache"
+
+
+def cache_key(entity: str, entity_id) -> str:
+    return f"{entity}:{entity_id}"
+
+
+def audiobook_keys(session: Session, condition) -> List[str]:
+    """Keys of the audiobooks matching ``condition``.
+
+    Audiobook responses embed the author, narrator and rating aggregate, so
+    writes to those invalidate the audiobooks referencing them too.
+    """
+    audiobook_ids = session.exec(select(Audiobook.audiobook_id).where(condition))
+    return [cache_key("audiobook", audiobook_id) for audiobook_id in audiobook_ids]
+
+
+class CacheBackend(ABC):
+    """Bytes store with hit, miss and eviction counters."""
+
+    name: str
+    evictions = 0
+    expirations = 0
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, bytes]):
+        for key, value in items.items():
+            self.set(key, value)
+
+    @abstractmethod
+    def clear(self): ...
+
+    @abstractmethod
+    def __len__(self): ...
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            backend=self.name,
+            entries=len(self),
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+        )
+
+
+class NullCache(CacheBackend):
+    name = "none"
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache whose entries also expire ``ttl`` seconds after being set."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl: float, clock=time.monotonic):
+        super().__init__()
+        self._entries = LRU(max_entries, ttl, clock)
+        self._lock = threading.Lock()
+
+    @property
+    def evictions(self):
+        return self._entries.evictions
+
+    @property
+    def expirations(self):
+        return self._entries.expirations
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.set(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.invalidate(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCache(CacheBackend):
+    """Cache in a SQLite file shared by every worker process on the host.
+
+    Like Redis with ``maxmemory-policy volatile-ttl``, it evicts the entries
+    closest to expiry, which here are the oldest written. The counters are
+    per process.
+
+    Counting the entries is a scan of the table, so a process only counts
+    once the entries it knows of plus those it wrote since could exceed
+    ``max_entries``, and then evicts a tenth more than the excess, so it can
+    write that many before counting again. With several workers the table
+    can briefly hold more than ``max_entries``, up to that headroom each.
+    """
+
+    name = "shared"
+
+    def __init__(self, path: str, max_entries: int, ttl: float, clock=time.time):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._headroom = max_entries // 10
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS response_cache_expires_at"
+            " ON response_cache (expires_at)"
+        )
+        # Entries at the last count, and upper bound of those written since.
+        self._counted = len(self)
+        self._written = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("PRAGMA busy_timeout = 5000")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            )
+            .fetchone()
+        )
+        if row is not None and row[1] <= self._clock():
+            self.delete(key)
+            self.expirations += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def get_many(self, keys):
+        placeholders = ", ".join("?" * len(keys))
+        cursor = self._connection().execute(
+            "SELECT key, value, expires_at FROM response_cache"
+            f" WHERE key IN ({placeholders})",
+            keys,
+        )
+        rows = {key: (value, expires_at) for key, value, expires_at in cursor}
+        now = self._clock()
+        values = []
+        for key in keys:
+            row = rows.get(key)
+            if row is not None and row[1] <= now:
+                self.delete(key)
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                values.append(None)
+            else:
+                self.hits += 1
+                values.append(row[0])
+        return values
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        connection = self._connection()
+        expires_at = self._clock() + self.ttl
+        connection.executemany(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at)"
+            " VALUES (?, ?, ?)",
+            [(key, value, expires_at) for key, value in items.items()],
+        )
+        with self._lock:
+            self._written += len(items)
+            if self._counted + self._written <= self.max_entries:
+                return
+            count = len(self)
+            excess = count - self.max_entries
+            if excess > 0:
+                excess += self._headroom
+                evicted = connection.execute(
+                    "DELETE FROM response_cache WHERE rowid IN (SELECT rowid FROM"
+                    " response_cache ORDER BY expires_at LIMIT ?)",
+                    (excess,),
+                ).rowcount
+                self.evictions += evicted
+                count -= evicted
+            self._counted, self._written = count, 0
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM response_cache")
+        with self._lock:
+            self._counted, self._written = 0, 0
+
+    def __len__(self):
+        return (
+            self._connection()
+            .execute("SELECT count(*) FROM response_cache")
+            .fetchone()[0]
+        )
+
+
+def _json_response(body: bytes, status: str) -> Response:
+    return Response(
+        content=body,
+        media_type=MEDIA_TYPE,
+        headers={CACHE_STATUS_HEADER: status},
+    )
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend, single_flight: bool = True):
+        self.backend = backend
+        # Concurrent misses on one key share a single load and serialization.
+        self.flights = SingleFlight() if single_flight else None
+        # [generation, loads in flight] of the keys being loaded. Invalidating
+        # a key bumps its generation, so a load that raced it is not stored.
+        self._loads: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _begin(self, keys: List[str]) -> List[int]:
+        with self._lock:
+            generations = []
+            for key in keys:
+                load = self._loads.setdefault(key, [0, 0])
+                load[1] += 1
+                generations.append(load[0])
+            return generations
+
+    def _store(self, items: Dict[str, bytes], generations: Dict[str, int]):
+        """Store the ``items`` no invalidation overtook and end their loads.
+
+        The backend is written outside the lock, so fills do not queue behind
+        each other's IO. An invalidation landing during the write may delete
+        before it, so the generations are checked again afterwards and what
+        such an invalidation overtook is deleted.
+        """
+        with self._lock:
+            fresh = {
+                key: items[key]
+                for key, generation in generations.items()
+                if key in items and self._loads[key][0] == generation
+            }
+        try:
+            if fresh:
+                self.backend.set_many(fresh)
+        finally:
+            with self._lock:
+                stale = []
+                for key, generation in generations.items():
+                    load = self._loads[key]
+                    if key in fresh and load[0] != generation:
+                        stale.append(key)
+                    load[1] -= 1
+                    if not load[1]:
+                        del self._loads[key]
+            for key in stale:
+                self.backend.delete(key)
+
+    def fetch(self, key: str, response_model, load: Callable) -> Response:
+        """The cached response for ``key``, or the serialized result of ``load()``.
+
+        ``load`` returns the object to validate against ``response_model``;
+        errors it raises, such as a 404 ``HTTPException``, are not cached.
+        """
+        body = self.backend.get(key)
+        if body is not None:
+            return _json_response(body, "HIT")
+        fill = partial(self._fill, key, response_model, load)
+        body = fill() if self.flights is None else self.flights.do(key, fill)
+        return _json_response(body, "MISS")
+
+    def _fill(self, key: str, response_model, load: Callable) -> bytes:
+        (generation,) = self._begin([key])
+        body = None
+        try:
+            body = encoder_for(response_model)(load())
+        finally:
+            self._store({} if body is None else {key: body}, {key: generation})
+        return body
+
+    def fetch_many(
+        self, entity: str, ids: List, response_model, load: Callable
+    ) -> Dict[Any, bytes]:
+        """Response bodies for the distinct ``ids`` of ``entity`` that exist.
+
+        Cached bodies are used as they are; ``load(missing_ids)`` returns the
+        rest as a dict of objects by id, in one call, and their serialized
+        forms are stored. Batched misses are not coalesced with other
+        requests.
+        """
+        ids = list(dict.fromkeys(ids))
+        keys = [cache_key(entity, entity_id) for entity_id in ids]
+        cached = self.backend.get_many(keys) if keys else []
+        bodies = {
+            entity_id: body for entity_id, body in zip(ids, cached) if body is not None
+        }
+        missing = [entity_id for entity_id in ids if entity_id not in bodies]
+        if missing:
+            missing_keys = [cache_key(entity, entity_id) for entity_id in missing]
+            generations = dict(zip(missing_keys, self._begin(missing_keys)))
+            loaded = {}
+            try:
+                encode = encoder_for(response_model)
+                loaded = {
+                    entity_id: encode(row) for entity_id, row in load(missing).items()
+                }
+            finally:
+                self._store(
+                    {
+                        cache_key(entity, entity_id): body
+                        for entity_id, body in loaded.items()
+                    },
+                    generations,
+                )
+            bodies.update(loaded)
+        return bodies
+
+    def invalidate(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                if key in self._loads:
+                    self._loads[key][0] += 1
+        for key in keys:
+            self.backend.delete(key)
+
+    def clear(self):
+        with self._lock:
+            for load in self._loads.values():
+                load[0] += 1
+        self.backend.clear()
+
+    def stats(self) -> CacheStats:
+        stats = self.backend.stats()
+        if self.flights is not None:
+            stats.coalesced = self.flights.coalesced
+        return stats
+
+
+def create_response_cache(settings: Optional[Settings] = None) -> ResponseCache:
+    settings = settings or get_settings()
+    if settings.response_cache_backend == "memory":
+        backend = MemoryCache(
+            settings.response_cache_max_entries, settings.response_cache_ttl
+        )
+    elif settings.response_cache_backend == "shared":
+        backend = SharedCache(
+            settings.response_cache_path,
+            settings.response_cache_max_entries,
+            settings.response_cache_ttl,
+        )
+    else:
+        backend = NullCache()
+    return ResponseCache(backend, settings.response_cache_single_flight)
+
+
+response_cache = create_response_cache()
+
+
+@event.listens_for(SQLModel.metadata, "after_drop")
+def clear_response_cache(target, connection, **kw):
+    # Ids are reused once the tables are recreated.
+    response_cache.clear()
@@ -0,0 +1,241 @@
+"""In-memory store of the latest playback position per (user, audiobook).
+
+Apps ask for the resume position every time they open a book, so
+``GET /users/{user_id}/resume/{audiobook_id}`` is answered from memory. An
+LRU holds the positions of the ``resume_store_size`` most recently used
+pairs; a miss reads the newest bookmark, resume or not, from the database
+once and remembers the answer, including that there is none, for
+``resume_store_ttl`` seconds. The bookmark endpoints invalidate the pairs
+they write, so a bookmark created after a miss is found by the next read;
+the TTL bounds how long another worker keeps serving a position it read
+before a write elsewhere.
+
+``PUT`` only touches memory. A background thread writes the changed
+positions to the pair's resume ``Bookmark`` (``is_resume``) every
+``resume_flush_interval`` seconds in one transaction. Updates are
+last-writer-wins on ``updated_at``, both in memory and in the upsert, so
+several workers, or a flush arriving after a newer one, cannot move a
+position back in time.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, SQLModel, select
+
+from database import engine
+from lru import LRU
+from schema import Bookmark, ResumePositionRead
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+ResumeKey = Tuple[int, int]
+# Marks a pair the store knows nothing about, as opposed to ``None``: known to
+# have no position.
+UNKNOWN = object()
+
+
+class ResumeStore:
+    """Bounded LRU of resume positions with write-behind to ``Bookmark``.
+
+    Pending writes are kept apart from the LRU so eviction never loses one,
+    and do not expire; remembered positions expire ``ttl`` seconds after
+    being stored. ``put`` refuses new pairs once ``max_pending`` writes are
+    waiting.
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_size: int,
+        max_pending: int,
+        flush_interval: float,
+        ttl: float = float("inf"),
+        clock=time.monotonic,
+    ):
+        self.engine = engine
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.flushed = 0
+        self.hits = 0
+        self.misses = 0
+        self._positions = LRU(max_size, ttl, clock)
+        self._pending: Dict[ResumeKey, ResumePositionRead] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def get(self, user_id: int, audiobook_id: int):
+        """The position in memory: a ``ResumePositionRead``, ``None`` or ``UNKNOWN``."""
+        key = (user_id, audiobook_id)
+        with self._lock:
+            position = self._known(key)
+            if position is UNKNOWN:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return position
+
+    def _known(self, key: ResumeKey):
+        """The position of ``key`` in memory, or ``UNKNOWN``; needs ``_lock``."""
+        if key in self._pending:
+            return self._pending[key]
+        return self._positions.get(key, UNKNOWN)
+
+    def load(self, user_id: int, audiobook_id: int) -> Optional[ResumePositionRead]:
+        """Read a pair's position from the database and remember it."""
+        with self._lock:
+            generation = self._positions.generation
+        statement = (
+            select(Bookmark)
+            .where(Bookmark.user_id == user_id, Bookmark.audiobook_id == audiobook_id)
+            .order_by(Bookmark.updated_at.desc(), Bookmark.bookmark_id.desc())
+            .limit(1)
+        )
+        with Session(self.engine) as session:
+            bookmark = session.exec(statement).first()
+        position = None
+        if bookmark is not None:
+            position = ResumePositionRead(
+                user_id=user_id,
+                audiobook_id=audiobook_id,
+                position=bookmark.position,
+                chapter_id=bookmark.chapter_id,
+                updated_at=bookmark.updated_at,
+            )
+        key = (user_id, audiobook_id)
+        with self._lock:
+            # A put while we were reading is newer than what we read.
+            known = self._known(key)
+            if known is not UNKNOWN:
+                return known
+            self._positions.store(key, position, generation)
+            return position
+
+    def put(self, position: ResumePositionRead) -> Optional[ResumePositionRead]:
+        """Store ``position`` unless a newer one is known.
+
+        Returns the position now current, or ``None`` if too many writes are
+        pending to take another pair.
+        """
+        key = (position.user_id, position.audiobook_id)
+        with self._lock:
+            current = self._known(key)
+            if (
+                current is not None
+                and current is not UNKNOWN
+                and current.updated_at > position.updated_at
+            ):
+                return current
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                return None
+            self._pending[key] = position
+            self._positions.set(key, position)
+        return position
+
+    def flush(self) -> int:
+        """Write every pending position in one transaction; returns rows written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        rows = [
+            dict(
+                user_id=position.user_id,
+                audiobook_id=position.audiobook_id,
+                chapter_id=position.chapter_id,
+                position=position.position,
+                is_resume=True,
+                updated_at=position.updated_at,
+            )
+            for position in batch.values()
+        ]
+        statement = insert(Bookmark)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "audiobook_id"],
+            index_where=Bookmark.is_resume,
+            set_={
+                "chapter_id": statement.excluded.chapter_id,
+                "position": statement.excluded.position,
+                "updated_at": statement.excluded.updated_at,
+            },
+            where=Bookmark.updated_at <= statement.excluded.updated_at,
+        )
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(statement, rows)
+        except Exception:
+            logger.exception("Failed to flush %d resume positions", len(batch))
+            self._requeue(batch)
+            return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    def _requeue(self, batch: Dict[ResumeKey, ResumePositionRead]):
+        with self._lock:
+            for key, position in batch.items():
+                # Anything put since is newer.
+                if key not in self._pending:
+                    self._pending[key] = position
+
+    def invalidate(self, *keys: ResumeKey):
+        """Forget the positions of ``keys``, so the next read loads them.
+
+        Pending positions are kept: they are newer than any bookmark write
+        they race with, and the flush only moves a position forward.
+        """
+        with self._lock:
+            self._positions.invalidate(*keys)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self._pending.clear()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="resume-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is pending."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+settings = get_settings()
+resume_store = ResumeStore(
+    engine,
+    max_size=settings.resume_store_size,
+    max_pending=settings.resume_max_pending,
+    flush_interval=settings.resume_flush_interval,
+    ttl=settings.resume_store_ttl,
+)
+
+
+@event.listens_for(SQLModel.metadata, "after_drop")
+def clear_resume_store(target, connection, **kw):
+    resume_store.clear()
@@ -1,9 +1,30 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Audiobook, AudiobookCreate, AudiobookRead
-from database import get_session
+from schema import (
+    Audiobook,
+    AudiobookBatchRead,
+    AudiobookCreate,
+    AudiobookRead,
+    BatchRequest,
+    BulkResult,
+    RatingAggregate,
+    RatingAggregateRead,
+    TimelineChapter,
+    TimelinePosition,
+    TimelineRead,
+)
+from database import engine, get_session
+from batch import parse_ids, read_batch
+from bulk import OnConflict, bulk_create, bulk_openapi
+from autocomplete import autocomplete_index
+from pagination import paginate
+from queries import filter_by, get_for, select_for
+from serialization import json_response
+from settings import get_settings
+from timeline import Timeline, chapter_timelines
+from response_cache import cache_key, response_cache
 
 
 router = APIRouter()
@@ -17,23 +38,136 @@ def create_audiobook(
     session.add(db_audiobook)
     session.commit()
     session.refresh(db_audiobook)
+    autocomplete_index.upsert(
+        "audiobook", db_audiobook.audiobook_id, db_audiobook.title
+    )
     return db_audiobook
 
 
+def _after_bulk_write(written, updated):
+    autocomplete_index.upsert_many(
+        "audiobook",
+        [(audiobook_id, values["title"]) for audiobook_id, values in written],
+    )
+    response_cache.invalidate(
+        *[cache_key("audiobook", audiobook_id) for audiobook_id in updated]
+    )
+
+
+@router.post(
+    "/bulk", response_model=BulkResult, openapi_extra=bulk_openapi(AudiobookCreate)
+)
+async def bulk_create_audiobooks(request: Request, on_conflict: OnConflict = "fail"):
+    return await bulk_create(
+        request,
+        engine,
+        Audiobook,
+        AudiobookCreate,
+        on_conflict,
+        get_settings().bulk_max_items,
+        _after_bulk_write,
+    )
+
+
+@router.get("/batch", response_model=AudiobookBatchRead)
+def read_audiobooks_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Audiobook, AudiobookRead, parse_ids(ids), "audiobook")
+
+
+@router.post("/batch", response_model=AudiobookBatchRead)
+def read_audiobooks_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Audiobook, AudiobookRead, batch.ids, "audiobook")
+
+
 @router.get("/{audiobook_id}", response_model=AudiobookRead)
 def read_audiobook(audiobook_id: int, session: Session = Depends(get_session)):
-    audiobook = session.get(Audiobook, audiobook_id)
-    if not audiobook:
+    def load():
+        audiobook = get_for(session, Audiobook, AudiobookRead, audiobook_id)
+        if not audiobook:
+            raise HTTPException(status_code=404, detail="Audiobook not found")
+        return audiobook
+
+    return response_cache.fetch(
+        cache_key("audiobook", audiobook_id), AudiobookRead, load
+    )
+
+
+@router.get("/{audiobook_id}/rating", response_model=RatingAggregateRead)
+def read_audiobook_rating(audiobook_id: int, session: Session = Depends(get_session)):
+    aggregate = session.get(RatingAggregate, audiobook_id)
+    if aggregate is None:
+        if not session.get(Audiobook, audiobook_id):
+            raise HTTPException(status_code=404, detail="Audiobook not found")
+        aggregate = RatingAggregate(audiobook_id=audiobook_id)
+    return aggregate
+
+
+def _timeline(session: Session, audiobook_id: int) -> Timeline:
+    timeline = chapter_timelines.get(session, audiobook_id)
+    if not timeline and not session.get(Audiobook, audiobook_id):
         raise HTTPException(status_code=404, detail="Audiobook not found")
-    return audiobook
+    return timeline
+
+
+@router.get("/{audiobook_id}/timeline", response_model=TimelineRead)
+def read_audiobook_timeline(audiobook_id: int, session: Session = Depends(get_session)):
+    return _timeline(session, audiobook_id).read()
+
+
+@router.get("/{audiobook_id}/timeline/at", response_model=TimelinePosition)
+def read_audiobook_timeline_position(
+    audiobook_id: int,
+    offset: float = Query(..., ge=0),
+    session: Session = Depends(get_session),
+):
+    timeline = _timeline(session, audiobook_id)
+    i = timeline.chapter_at(offset)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Offset is past the last chapter")
+    chapter = timeline.chapter(i)
+    return TimelinePosition(
+        offset=offset, chapter=chapter, offset_in_chapter=offset - chapter.start
+    )
+
+
+@router.get(
+    "/{audiobook_id}/timeline/chapters/{chapter_id}", response_model=TimelineChapter
+)
+def read_audiobook_timeline_chapter(
+    audiobook_id: int, chapter_id: int, session: Session = Depends(get_session)
+):
+    timeline = _timeline(session, audiobook_id)
+    i = timeline.index_of(chapter_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    return timeline.chapter(i)
 
 
 @router.get("/", response_model=List[AudiobookRead])
 def list_audiobooks(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    author_id: Optional[int] = None,
+    narrator_id: Optional[int] = None,
+    session: Session = Depends(get_session),
 ):
-    audiobooks = session.exec(select(Audiobook).offset(skip).limit(limit)).all()
-    return audiobooks
+    audiobooks = paginate(
+        session,
+        filter_by(
+            select_for(Audiobook, AudiobookRead),
+            {Audiobook.author_id: author_id, Audiobook.narrator_id: narrator_id},
+        ),
+        Audiobook.audiobook_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[AudiobookRead], audiobooks, response)
 
 
 @router.put("/{audiobook_id}", response_model=AudiobookRead)
@@ -50,7 +184,11 @@ def update_audiobook(
         setattr(db_audiobook, key, value)
     session.add(db_audiobook)
     session.commit()
+    response_cache.invalidate(cache_key("audiobook", audiobook_id))
     session.refresh(db_audiobook)
+    autocomplete_index.upsert(
+        "audiobook", db_audiobook.audiobook_id, db_audiobook.title
+    )
     return db_audiobook
 
 
@@ -61,4 +199,7 @@ def delete_audiobook(audiobook_id: int, session: Session = Depends(get_session))
         raise HTTPException(status_code=404, detail="Audiobook not found")
     session.delete(audiobook)
     session.commit()
+    response_cache.invalidate(cache_key("audiobook", audiobook_id))
+    autocomplete_index.remove("audiobook", audiobook_id)
+    chapter_timelines.invalidate([audiobook_id])
     return {"ok": True}
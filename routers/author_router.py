@@ -1,9 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Author, AuthorCreate, AuthorRead
-from database import get_session
+from schema import (
+    Audiobook,
+    Author,
+    AuthorBatchRead,
+    AuthorCreate,
+    AuthorRead,
+    BatchRequest,
+    BulkResult,
+)
+from database import engine, get_session
+from batch import parse_ids, read_batch
+from bulk import OnConflict, bulk_create, bulk_openapi
+from autocomplete import autocomplete_index
+from pagination import paginate
+from queries import get_for, select_for
+from serialization import json_response
+from settings import get_settings
+from response_cache import audiobook_keys, cache_key, response_cache
 
 router = APIRouter()
 
@@ -14,23 +30,77 @@ def create_author(author: AuthorCreate, session: Session = Depends(get_session))
     session.add(db_author)
     session.commit()
     session.refresh(db_author)
+    autocomplete_index.upsert("author", db_author.author_id, db_author.name)
     return db_author
 
 
+def _after_bulk_write(written, updated):
+    autocomplete_index.upsert_many(
+        "author", [(author_id, values["name"]) for author_id, values in written]
+    )
+    if updated:
+        with Session(engine) as session:
+            stale = audiobook_keys(session, Audiobook.author_id.in_(updated))
+        stale += [cache_key("author", author_id) for author_id in updated]
+        response_cache.invalidate(*stale)
+
+
+@router.post(
+    "/bulk", response_model=BulkResult, openapi_extra=bulk_openapi(AuthorCreate)
+)
+async def bulk_create_authors(request: Request, on_conflict: OnConflict = "fail"):
+    return await bulk_create(
+        request,
+        engine,
+        Author,
+        AuthorCreate,
+        on_conflict,
+        get_settings().bulk_max_items,
+        _after_bulk_write,
+    )
+
+
+@router.get("/batch", response_model=AuthorBatchRead)
+def read_authors_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Author, AuthorRead, parse_ids(ids), "author")
+
+
+@router.post("/batch", response_model=AuthorBatchRead)
+def read_authors_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Author, AuthorRead, batch.ids, "author")
+
+
 @router.get("/{author_id}", response_model=AuthorRead)
 def read_author(author_id: int, session: Session = Depends(get_session)):
-    author = session.get(Author, author_id)
-    if not author:
-        raise HTTPException(status_code=404, detail="Author not found")
-    return author
+    def load():
+        author = get_for(session, Author, AuthorRead, author_id)
+        if not author:
+            raise HTTPException(status_code=404, detail="Author not found")
+        return author
+
+    return response_cache.fetch(cache_key("author", author_id), AuthorRead, load)
 
 
 @router.get("/", response_model=List[AuthorRead])
 def list_authors(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
 ):
-    authors = session.exec(select(Author).offset(skip).limit(limit)).all()
-    return authors
+    authors = paginate(
+        session,
+        select_for(Author, AuthorRead),
+        Author.author_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[AuthorRead], authors, response)
 
 
 @router.put("/{author_id}", response_model=AuthorRead)
@@ -40,12 +110,16 @@ def update_author(
     db_author = session.get(Author, author_id)
     if not db_author:
         raise HTTPException(status_code=404, detail="Author not found")
+    stale = [cache_key("author", author_id)]
+    stale += audiobook_keys(session, Audiobook.author_id == author_id)
     author_data = author.dict(exclude_unset=True)
     for key, value in author_data.items():
         setattr(db_author, key, value)
     session.add(db_author)
     session.commit()
+    response_cache.invalidate(*stale)
     session.refresh(db_author)
+    autocomplete_index.upsert("author", db_author.author_id, db_author.name)
     return db_author
 
 
@@ -54,6 +128,10 @@ def delete_author(author_id: int, session: Session = Depends(get_session)):
     author = session.get(Author, author_id)
     if not author:
         raise HTTPException(status_code=404, detail="Author not found")
+    stale = [cache_key("author", author_id)]
+    stale += audiobook_keys(session, Audiobook.author_id == author_id)
     session.delete(author)
     session.commit()
+    response_cache.invalidate(*stale)
+    autocomplete_index.remove("author", author_id)
     return {"ok": True}
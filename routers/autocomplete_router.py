@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Query
+from typing import List, Literal, Optional
+
+from schema import Completion
+from autocomplete import TOP_K, autocomplete_index
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[Completion])
+async def autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=TOP_K),
+    kind: Optional[Literal["audiobook", "author", "narrator"]] = None,
+):
+    # Served from memory, so no session and no trip to the threadpool.
+    return autocomplete_index.complete(q, limit, kind)
@@ -1,9 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Bookmark, BookmarkCreate, BookmarkRead
+from schema import (
+    BatchRequest,
+    Bookmark,
+    BookmarkBatchRead,
+    BookmarkCreate,
+    BookmarkRead,
+)
 from database import get_session
+from batch import parse_ids, read_batch
+from pagination import paginate
+from queries import filter_by, get_for, select_for
+from resume import resume_store
+from serialization import json_response
 
 router = APIRouter()
 
@@ -14,23 +25,53 @@ def create_bookmark(bookmark: BookmarkCreate, session: Session = Depends(get_ses
     session.add(db_bookmark)
     session.commit()
     session.refresh(db_bookmark)
+    resume_store.invalidate((db_bookmark.user_id, db_bookmark.audiobook_id))
     return db_bookmark
 
 
+@router.get("/batch", response_model=BookmarkBatchRead)
+def read_bookmarks_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Bookmark, BookmarkRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=BookmarkBatchRead)
+def read_bookmarks_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Bookmark, BookmarkRead, batch.ids)
+
+
 @router.get("/{bookmark_id}", response_model=BookmarkRead)
 def read_bookmark(bookmark_id: int, session: Session = Depends(get_session)):
-    bookmark = session.get(Bookmark, bookmark_id)
+    bookmark = get_for(session, Bookmark, BookmarkRead, bookmark_id)
     if not bookmark:
         raise HTTPException(status_code=404, detail="Bookmark not found")
-    return bookmark
+    return json_response(BookmarkRead, bookmark)
 
 
 @router.get("/", response_model=List[BookmarkRead])
 def list_bookmarks(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    audiobook_id: Optional[int] = None,
+    session: Session = Depends(get_session),
 ):
-    bookmarks = session.exec(select(Bookmark).offset(skip).limit(limit)).all()
-    return bookmarks
+    bookmarks = paginate(
+        session,
+        filter_by(
+            select_for(Bookmark, BookmarkRead),
+            {Bookmark.user_id: user_id, Bookmark.audiobook_id: audiobook_id},
+        ),
+        Bookmark.bookmark_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[BookmarkRead], bookmarks, response)
 
 
 @router.put("/{bookmark_id}", response_model=BookmarkRead)
@@ -40,12 +81,14 @@ def update_bookmark(
     db_bookmark = session.get(Bookmark, bookmark_id)
     if not db_bookmark:
         raise HTTPException(status_code=404, detail="Bookmark not found")
+    previous = (db_bookmark.user_id, db_bookmark.audiobook_id)
     bookmark_data = bookmark.dict(exclude_unset=True)
     for key, value in bookmark_data.items():
         setattr(db_bookmark, key, value)
     session.add(db_bookmark)
     session.commit()
     session.refresh(db_bookmark)
+    resume_store.invalidate(previous, (db_bookmark.user_id, db_bookmark.audiobook_id))
     return db_bookmark
 
 
@@ -54,6 +97,8 @@ def delete_bookmark(bookmark_id: int, session: Session = Depends(get_session)):
     bookmark = session.get(Bookmark, bookmark_id)
     if not bookmark:
         raise HTTPException(status_code=404, detail="Bookmark not found")
+    key = (bookmark.user_id, bookmark.audiobook_id)
     session.delete(bookmark)
     session.commit()
+    resume_store.invalidate(key)
     return {"ok": True}
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from schema import CacheStats
+from response_cache import response_cache
+
+router = APIRouter()
+
+
+@router.get("/stats", response_model=CacheStats)
+def read_cache_stats():
+    return response_cache.stats()
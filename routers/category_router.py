@@ -1,9 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Category, CategoryCreate, CategoryRead
-from database import get_session
+from schema import (
+    BatchRequest,
+    BulkResult,
+    Category,
+    CategoryBatchRead,
+    CategoryCreate,
+    CategoryRead,
+)
+from database import engine, get_session
+from batch import parse_ids, read_batch
+from bulk import OnConflict, bulk_create, bulk_openapi
+from pagination import paginate
+from queries import get_for, select_for
+from serialization import json_response
+from settings import get_settings
+from response_cache import cache_key, response_cache
 
 router = APIRouter()
 
@@ -17,20 +31,68 @@ def create_category(category: CategoryCreate, session: Session = Depends(get_ses
     return db_category
 
 
+def _after_bulk_write(written, updated):
+    response_cache.invalidate(
+        *[cache_key("category", category_id) for category_id in updated]
+    )
+
+
+@router.post(
+    "/bulk", response_model=BulkResult, openapi_extra=bulk_openapi(CategoryCreate)
+)
+async def bulk_create_categories(request: Request, on_conflict: OnConflict = "fail"):
+    return await bulk_create(
+        request,
+        engine,
+        Category,
+        CategoryCreate,
+        on_conflict,
+        get_settings().bulk_max_items,
+        _after_bulk_write,
+    )
+
+
+@router.get("/batch", response_model=CategoryBatchRead)
+def read_categories_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Category, CategoryRead, parse_ids(ids), "category")
+
+
+@router.post("/batch", response_model=CategoryBatchRead)
+def read_categories_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Category, CategoryRead, batch.ids, "category")
+
+
 @router.get("/{category_id}", response_model=CategoryRead)
 def read_category(category_id: int, session: Session = Depends(get_session)):
-    category = session.get(Category, category_id)
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-    return category
+    def load():
+        category = get_for(session, Category, CategoryRead, category_id)
+        if not category:
+            raise HTTPException(status_code=404, detail="Category not found")
+        return category
+
+    return response_cache.fetch(cache_key("category", category_id), CategoryRead, load)
 
 
 @router.get("/", response_model=List[CategoryRead])
 def list_categories(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
 ):
-    categories = session.exec(select(Category).offset(skip).limit(limit)).all()
-    return categories
+    categories = paginate(
+        session,
+        select_for(Category, CategoryRead),
+        Category.category_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[CategoryRead], categories, response)
 
 
 @router.put("/{category_id}", response_model=CategoryRead)
@@ -45,6 +107,7 @@ def update_category(
         setattr(db_category, key, value)
     session.add(db_category)
     session.commit()
+    response_cache.invalidate(cache_key("category", category_id))
     session.refresh(db_category)
     return db_category
 
@@ -56,4 +119,5 @@ def delete_category(category_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Category not found")
     session.delete(category)
     session.commit()
+    response_cache.invalidate(cache_key("category", category_id))
     return {"ok": True}
@@ -1,9 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Chapter, ChapterCreate, ChapterRead
-from database import get_session
+from schema import (
+    BatchRequest,
+    BulkResult,
+    Chapter,
+    ChapterBatchRead,
+    ChapterCreate,
+    ChapterRead,
+)
+from database import engine, get_session
+from batch import parse_ids, read_batch
+from bulk import OnConflict, bulk_create, bulk_openapi
+from pagination import paginate
+from queries import filter_by, get_for, select_for
+from serialization import json_response
+from settings import get_settings
+from timeline import chapter_timelines
+from response_cache import cache_key, response_cache
 
 router = APIRouter()
 
@@ -14,23 +29,78 @@ def create_chapter(chapter: ChapterCreate, session: Session = Depends(get_sessio
     session.add(db_chapter)
     session.commit()
     session.refresh(db_chapter)
+    chapter_timelines.upsert(db_chapter)
     return db_chapter
 
 
+def _after_bulk_write(written, updated):
+    chapter_timelines.invalidate(
+        {values["audiobook_id"] for _, values in written}, updated
+    )
+    response_cache.invalidate(
+        *[cache_key("chapter", chapter_id) for chapter_id in updated]
+    )
+
+
+@router.post(
+    "/bulk", response_model=BulkResult, openapi_extra=bulk_openapi(ChapterCreate)
+)
+async def bulk_create_chapters(request: Request, on_conflict: OnConflict = "fail"):
+    return await bulk_create(
+        request,
+        engine,
+        Chapter,
+        ChapterCreate,
+        on_conflict,
+        get_settings().bulk_max_items,
+        _after_bulk_write,
+    )
+
+
+@router.get("/batch", response_model=ChapterBatchRead)
+def read_chapters_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Chapter, ChapterRead, parse_ids(ids), "chapter")
+
+
+@router.post("/batch", response_model=ChapterBatchRead)
+def read_chapters_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Chapter, ChapterRead, batch.ids, "chapter")
+
+
 @router.get("/{chapter_id}", response_model=ChapterRead)
 def read_chapter(chapter_id: int, session: Session = Depends(get_session)):
-    chapter = session.get(Chapter, chapter_id)
-    if not chapter:
-        raise HTTPException(status_code=404, detail="Chapter not found")
-    return chapter
+    def load():
+        chapter = get_for(session, Chapter, ChapterRead, chapter_id)
+        if not chapter:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        return chapter
+
+    return response_cache.fetch(cache_key("chapter", chapter_id), ChapterRead, load)
 
 
 @router.get("/", response_model=List[ChapterRead])
 def list_chapters(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    audiobook_id: Optional[int] = None,
+    session: Session = Depends(get_session),
 ):
-    chapters = session.exec(select(Chapter).offset(skip).limit(limit)).all()
-    return chapters
+    chapters = paginate(
+        session,
+        filter_by(
+            select_for(Chapter, ChapterRead), {Chapter.audiobook_id: audiobook_id}
+        ),
+        Chapter.chapter_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[ChapterRead], chapters, response)
 
 
 @router.put("/{chapter_id}", response_model=ChapterRead)
@@ -40,12 +110,15 @@ def update_chapter(
     db_chapter = session.get(Chapter, chapter_id)
     if not db_chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
+    previous_audiobook_id = db_chapter.audiobook_id
     chapter_data = chapter.dict(exclude_unset=True)
     for key, value in chapter_data.items():
         setattr(db_chapter, key, value)
     session.add(db_chapter)
     session.commit()
+    response_cache.invalidate(cache_key("chapter", chapter_id))
     session.refresh(db_chapter)
+    chapter_timelines.upsert(db_chapter, previous_audiobook_id)
     return db_chapter
 
 
@@ -54,6 +127,9 @@ def delete_chapter(chapter_id: int, session: Session = Depends(get_session)):
     chapter = session.get(Chapter, chapter_id)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
+    audiobook_id = chapter.audiobook_id
     session.delete(chapter)
     session.commit()
+    response_cache.invalidate(cache_key("chapter", chapter_id))
+    chapter_timelines.remove(audiobook_id, chapter_id)
     return {"ok": True}
@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from batch import parse_ids
+from entitlements import entitlement_index
+from schema import BatchRequest, EntitlementBatchRead, EntitlementRead
+from settings import get_settings
+from timeutil import naive_utc
+
+router = APIRouter()
+
+
+async def _entitlements(user_id: int):
+    # Served from memory; only the first check of a user goes to the database.
+    entitlements = entitlement_index.get(user_id)
+    if entitlements is None:
+        entitlements = await run_in_threadpool(entitlement_index.load, user_id)
+    if entitlements is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return entitlements
+
+
+def _moment(at: Optional[datetime]) -> datetime:
+    # Subscription periods are stored as naive UTC.
+    return datetime.utcnow() if at is None else naive_utc(at)
+
+
+async def _check_many(
+    user_id: int, audiobook_ids: List[int], at: Optional[datetime]
+) -> EntitlementBatchRead:
+    max_ids = get_settings().batch_max_ids
+    if len(audiobook_ids) > max_ids:
+        raise HTTPException(
+            status_code=413, detail=f"At most {max_ids} ids per request"
+        )
+    entitlements = await _entitlements(user_id)
+    moment = _moment(at)
+    return EntitlementBatchRead(
+        user_id=user_id,
+        items=[entitlements.check(ident, moment) for ident in audiobook_ids],
+    )
+
+
+@router.get("/{user_id}/entitlements/batch", response_model=EntitlementBatchRead)
+async def read_entitlements_batch(
+    user_id: int, ids: str, at: Optional[datetime] = None
+):
+    return await _check_many(user_id, parse_ids(ids), at)
+
+
+@router.post("/{user_id}/entitlements/batch", response_model=EntitlementBatchRead)
+async def read_entitlements_batch_by_body(
+    user_id: int, batch: BatchRequest, at: Optional[datetime] = None
+):
+    return await _check_many(user_id, batch.ids, at)
+
+
+@router.get("/{user_id}/entitlements/{audiobook_id}", response_model=EntitlementRead)
+async def read_entitlement(
+    user_id: int, audiobook_id: int, at: Optional[datetime] = None
+):
+    entitlements = await _entitlements(user_id)
+    return entitlements.check(audiobook_id, _moment(at))
@@ -0,0 +1,31 @@
+from datetime import datetime
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+
+from database import engine
+from export import EXPORTS, MEDIA_TYPES, stream_export
+from settings import get_settings
+
+router = APIRouter()
+
+
+@router.get("/{table}", response_class=StreamingResponse)
+async def export_table(
+    table: Literal["listening_histories", "ratings", "reviews", "purchases"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    updated_since: Optional[datetime] = None,
+):
+    # The generator runs on the threadpool as the response is sent.
+    chunks = stream_export(
+        engine,
+        EXPORTS[table],
+        format,
+        updated_since,
+        get_settings().export_chunk_size,
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
@@ -1,42 +1,115 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from datetime import datetime
 
-from schema import ListeningHistory, ListeningHistoryCreate, ListeningHistoryRead
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from typing import List, Optional
+
+from autocomplete import record_listens
+from backpressure import retry_later
+from schema import (
+    BatchRequest,
+    ListeningHistory,
+    ListeningHistoryBatchRead,
+    ListeningHistoryCreate,
+    ListeningHistoryRead,
+    ListeningProgressAccepted,
+    ListeningProgressEvent,
+)
 from database import get_session
+from batch import parse_ids, read_batch
+from pagination import paginate
+from progress_ingest import progress_buffer
+from queries import filter_by, get_for, select_for
+from serialization import json_response
 
 router = APIRouter()
 
 
+def _commit(session: Session):
+    try:
+        session.commit()
+    except IntegrityError:
+        # (user_id, audiobook_id, started_at) identifies a listening session.
+        session.rollback()
+        raise HTTPException(status_code=409, detail="ListeningHistory already exists")
+
+
 @router.post("/", response_model=ListeningHistoryRead)
 def create_listening_history(
     listening_history: ListeningHistoryCreate, session: Session = Depends(get_session)
 ):
     db_listening_history = ListeningHistory.from_orm(listening_history)
     session.add(db_listening_history)
-    session.commit()
+    _commit(session)
     session.refresh(db_listening_history)
+    record_listens(session, {db_listening_history.audiobook_id: 1})
     return db_listening_history
 
 
+@router.post("/progress", response_model=ListeningProgressAccepted, status_code=202)
+async def ingest_listening_progress(events: List[ListeningProgressEvent]):
+    # Buffered in memory and written behind the request; see ProgressBuffer.
+    if not progress_buffer.offer(events):
+        raise retry_later("Progress buffer is full", progress_buffer.flush_interval)
+    return ListeningProgressAccepted(accepted=len(events))
+
+
+@router.get("/batch", response_model=ListeningHistoryBatchRead)
+def read_listening_histories_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, ListeningHistory, ListeningHistoryRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=ListeningHistoryBatchRead)
+def read_listening_histories_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, ListeningHistory, ListeningHistoryRead, batch.ids)
+
+
 @router.get("/{listening_history_id}", response_model=ListeningHistoryRead)
 def read_listening_history(
     listening_history_id: int, session: Session = Depends(get_session)
 ):
-    listening_history = session.get(ListeningHistory, listening_history_id)
+    listening_history = get_for(
+        session, ListeningHistory, ListeningHistoryRead, listening_history_id
+    )
     if not listening_history:
         raise HTTPException(status_code=404, detail="ListeningHistory not found")
-    return listening_history
+    return json_response(ListeningHistoryRead, listening_history)
 
 
 @router.get("/", response_model=List[ListeningHistoryRead])
 def list_listening_histories(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    audiobook_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    session: Session = Depends(get_session),
 ):
-    listening_histories = session.exec(
-        select(ListeningHistory).offset(skip).limit(limit)
-    ).all()
-    return listening_histories
+    listening_histories = paginate(
+        session,
+        filter_by(
+            select_for(ListeningHistory, ListeningHistoryRead),
+            {
+                ListeningHistory.user_id: user_id,
+                ListeningHistory.audiobook_id: audiobook_id,
+            },
+            ListeningHistory.started_at,
+            since,
+            until,
+        ),
+        ListeningHistory.history_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[ListeningHistoryRead], listening_histories, response)
 
 
 @router.put("/{listening_history_id}", response_model=ListeningHistoryRead)
@@ -48,12 +121,18 @@ def update_listening_history(
     db_listening_history = session.get(ListeningHistory, listening_history_id)
     if not db_listening_history:
         raise HTTPException(status_code=404, detail="ListeningHistory not found")
+    previous_audiobook_id = db_listening_history.audiobook_id
     listening_history_data = listening_history.dict(exclude_unset=True)
     for key, value in listening_history_data.items():
         setattr(db_listening_history, key, value)
     session.add(db_listening_history)
-    session.commit()
+    _commit(session)
     session.refresh(db_listening_history)
+    if db_listening_history.audiobook_id != previous_audiobook_id:
+        record_listens(
+            session,
+            {previous_audiobook_id: -1, db_listening_history.audiobook_id: 1},
+        )
     return db_listening_history
 
 
@@ -64,6 +143,8 @@ def delete_listening_history(
     listening_history = session.get(ListeningHistory, listening_history_id)
     if not listening_history:
         raise HTTPException(status_code=404, detail="ListeningHistory not found")
+    audiobook_id = listening_history.audiobook_id
     session.delete(listening_history)
     session.commit()
+    record_listens(session, {audiobook_id: -1})
     return {"ok": True}
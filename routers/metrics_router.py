@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # async, so it runs on the event loop like the middleware updating them
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
@@ -1,9 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Narrator, NarratorCreate, NarratorRead
-from database import get_session
+from schema import (
+    Audiobook,
+    BatchRequest,
+    BulkResult,
+    Narrator,
+    NarratorBatchRead,
+    NarratorCreate,
+    NarratorRead,
+)
+from database import engine, get_session
+from batch import parse_ids, read_batch
+from bulk import OnConflict, bulk_create, bulk_openapi
+from autocomplete import autocomplete_index
+from pagination import paginate
+from queries import get_for, select_for
+from serialization import json_response
+from settings import get_settings
+from response_cache import audiobook_keys, cache_key, response_cache
 
 router = APIRouter()
 
@@ -14,23 +30,77 @@ def create_narrator(narrator: NarratorCreate, session: Session = Depends(get_ses
     session.add(db_narrator)
     session.commit()
     session.refresh(db_narrator)
+    autocomplete_index.upsert("narrator", db_narrator.narrator_id, db_narrator.name)
     return db_narrator
 
 
+def _after_bulk_write(written, updated):
+    autocomplete_index.upsert_many(
+        "narrator", [(narrator_id, values["name"]) for narrator_id, values in written]
+    )
+    if updated:
+        with Session(engine) as session:
+            stale = audiobook_keys(session, Audiobook.narrator_id.in_(updated))
+        stale += [cache_key("narrator", narrator_id) for narrator_id in updated]
+        response_cache.invalidate(*stale)
+
+
+@router.post(
+    "/bulk", response_model=BulkResult, openapi_extra=bulk_openapi(NarratorCreate)
+)
+async def bulk_create_narrators(request: Request, on_conflict: OnConflict = "fail"):
+    return await bulk_create(
+        request,
+        engine,
+        Narrator,
+        NarratorCreate,
+        on_conflict,
+        get_settings().bulk_max_items,
+        _after_bulk_write,
+    )
+
+
+@router.get("/batch", response_model=NarratorBatchRead)
+def read_narrators_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Narrator, NarratorRead, parse_ids(ids), "narrator")
+
+
+@router.post("/batch", response_model=NarratorBatchRead)
+def read_narrators_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Narrator, NarratorRead, batch.ids, "narrator")
+
+
 @router.get("/{narrator_id}", response_model=NarratorRead)
 def read_narrator(narrator_id: int, session: Session = Depends(get_session)):
-    narrator = session.get(Narrator, narrator_id)
-    if not narrator:
-        raise HTTPException(status_code=404, detail="Narrator not found")
-    return narrator
+    def load():
+        narrator = get_for(session, Narrator, NarratorRead, narrator_id)
+        if not narrator:
+            raise HTTPException(status_code=404, detail="Narrator not found")
+        return narrator
+
+    return response_cache.fetch(cache_key("narrator", narrator_id), NarratorRead, load)
 
 
 @router.get("/", response_model=List[NarratorRead])
 def list_narrators(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
 ):
-    narrators = session.exec(select(Narrator).offset(skip).limit(limit)).all()
-    return narrators
+    narrators = paginate(
+        session,
+        select_for(Narrator, NarratorRead),
+        Narrator.narrator_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[NarratorRead], narrators, response)
 
 
 @router.put("/{narrator_id}", response_model=NarratorRead)
@@ -40,10 +110,14 @@ def update_narrator(
     db_narrator = session.get(Narrator, narrator_id)
     if not db_narrator:
         raise HTTPException(status_code=404, detail="Narrator not found")
+    stale = [cache_key("narrator", narrator_id)]
+    stale += audiobook_keys(session, Audiobook.narrator_id == narrator_id)
     narrator_data = narrator.dict(exclude_unset=True)
     for key, value in narrator_data.items():
         setattr(db_narrator, key, value)
     session.add(db_narrator)
     session.commit()
+    response_cache.invalidate(*stale)
     session.refresh(db_narrator)
+    autocomplete_index.upsert("narrator", db_narrator.narrator_id, db_narrator.name)
     return db_narrator
@@ -1,9 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from datetime import datetime
 
-from schema import Purchase, PurchaseCreate, PurchaseRead
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlmodel import Session
+from typing import List, Optional
+
+from schema import (
+    BatchRequest,
+    Purchase,
+    PurchaseBatchRead,
+    PurchaseCreate,
+    PurchaseRead,
+)
 from database import get_session
+from batch import parse_ids, read_batch
+from entitlements import entitlement_index
+from pagination import paginate
+from queries import filter_by, get_for, select_for
+from serialization import json_response
 
 router = APIRouter()
 
@@ -14,23 +27,58 @@ def create_purchase(purchase: PurchaseCreate, session: Session = Depends(get_ses
     session.add(db_purchase)
     session.commit()
     session.refresh(db_purchase)
+    entitlement_index.invalidate(db_purchase.user_id)
     return db_purchase
 
 
+@router.get("/batch", response_model=PurchaseBatchRead)
+def read_purchases_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Purchase, PurchaseRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=PurchaseBatchRead)
+def read_purchases_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Purchase, PurchaseRead, batch.ids)
+
+
 @router.get("/{purchase_id}", response_model=PurchaseRead)
 def read_purchase(purchase_id: int, session: Session = Depends(get_session)):
-    purchase = session.get(Purchase, purchase_id)
+    purchase = get_for(session, Purchase, PurchaseRead, purchase_id)
     if not purchase:
         raise HTTPException(status_code=404, detail="Purchase not found")
-    return purchase
+    return json_response(PurchaseRead, purchase)
 
 
 @router.get("/", response_model=List[PurchaseRead])
 def list_purchases(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    audiobook_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    session: Session = Depends(get_session),
 ):
-    purchases = session.exec(select(Purchase).offset(skip).limit(limit)).all()
-    return purchases
+    purchases = paginate(
+        session,
+        filter_by(
+            select_for(Purchase, PurchaseRead),
+            {Purchase.user_id: user_id, Purchase.audiobook_id: audiobook_id},
+            Purchase.purchase_date,
+            since,
+            until,
+        ),
+        Purchase.purchase_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[PurchaseRead], purchases, response)
 
 
 @router.put("/{purchase_id}", response_model=PurchaseRead)
@@ -40,12 +88,14 @@ def update_purchase(
     db_purchase = session.get(Purchase, purchase_id)
     if not db_purchase:
         raise HTTPException(status_code=404, detail="Purchase not found")
+    previous_user_id = db_purchase.user_id
     purchase_data = purchase.dict(exclude_unset=True)
     for key, value in purchase_data.items():
         setattr(db_purchase, key, value)
     session.add(db_purchase)
     session.commit()
     session.refresh(db_purchase)
+    entitlement_index.invalidate(previous_user_id, db_purchase.user_id)
     return db_purchase
 
 
@@ -54,6 +104,8 @@ def delete_purchase(purchase_id: int, session: Session = Depends(get_session)):
     purchase = session.get(Purchase, purchase_id)
     if not purchase:
         raise HTTPException(status_code=404, detail="Purchase not found")
+    user_id = purchase.user_id
     session.delete(purchase)
     session.commit()
+    entitlement_index.invalidate(user_id)
     return {"ok": True}
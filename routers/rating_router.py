@@ -1,9 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from datetime import datetime
 
-from schema import Rating, RatingCreate, RatingRead
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlmodel import Session
+from typing import List, Optional
+
+from schema import BatchRequest, Rating, RatingBatchRead, RatingCreate, RatingRead
 from database import get_session
+from batch import parse_ids, read_batch
+from pagination import paginate
+from queries import filter_by, get_for, select_for
+from serialization import json_response
+from rating_aggregates import apply_rating
+from response_cache import cache_key, response_cache
 
 router = APIRouter()
 
@@ -12,25 +20,62 @@ router = APIRouter()
 def create_rating(rating: RatingCreate, session: Session = Depends(get_session)):
     db_rating = Rating.from_orm(rating)
     session.add(db_rating)
+    apply_rating(session, db_rating.audiobook_id, db_rating.rating, 1)
     session.commit()
+    # Audiobook responses embed the rating aggregate.
+    response_cache.invalidate(cache_key("audiobook", db_rating.audiobook_id))
     session.refresh(db_rating)
     return db_rating
 
 
+@router.get("/batch", response_model=RatingBatchRead)
+def read_ratings_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Rating, RatingRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=RatingBatchRead)
+def read_ratings_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Rating, RatingRead, batch.ids)
+
+
 @router.get("/{rating_id}", response_model=RatingRead)
 def read_rating(rating_id: int, session: Session = Depends(get_session)):
-    rating = session.get(Rating, rating_id)
+    rating = get_for(session, Rating, RatingRead, rating_id)
     if not rating:
         raise HTTPException(status_code=404, detail="Rating not found")
-    return rating
+    return json_response(RatingRead, rating)
 
 
 @router.get("/", response_model=List[RatingRead])
 def list_ratings(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    audiobook_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    session: Session = Depends(get_session),
 ):
-    ratings = session.exec(select(Rating).offset(skip).limit(limit)).all()
-    return ratings
+    ratings = paginate(
+        session,
+        filter_by(
+            select_for(Rating, RatingRead),
+            {Rating.user_id: user_id, Rating.audiobook_id: audiobook_id},
+            Rating.created_at,
+            since,
+            until,
+        ),
+        Rating.rating_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[RatingRead], ratings, response)
 
 
 @router.put("/{rating_id}", response_model=RatingRead)
@@ -40,11 +85,16 @@ def update_rating(
     db_rating = session.get(Rating, rating_id)
     if not db_rating:
         raise HTTPException(status_code=404, detail="Rating not found")
+    stale = [cache_key("audiobook", db_rating.audiobook_id)]
+    apply_rating(session, db_rating.audiobook_id, db_rating.rating, -1)
     rating_data = rating.dict(exclude_unset=True)
     for key, value in rating_data.items():
         setattr(db_rating, key, value)
     session.add(db_rating)
+    apply_rating(session, db_rating.audiobook_id, db_rating.rating, 1)
+    stale.append(cache_key("audiobook", db_rating.audiobook_id))
     session.commit()
+    response_cache.invalidate(*stale)
     session.refresh(db_rating)
     return db_rating
 
@@ -55,5 +105,7 @@ def delete_rating(rating_id: int, session: Session = Depends(get_session)):
     if not rating:
         raise HTTPException(status_code=404, detail="Rating not found")
     session.delete(rating)
+    apply_rating(session, rating.audiobook_id, rating.rating, -1)
     session.commit()
+    response_cache.invalidate(cache_key("audiobook", rating.audiobook_id))
     return {"ok": True}
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from backpressure import retry_later
+from resume import UNKNOWN, resume_store
+from schema import ResumePositionRead, ResumePositionUpdate
+from timeutil import naive_utc
+
+router = APIRouter()
+
+
+@router.get("/{user_id}/resume/{audiobook_id}", response_model=ResumePositionRead)
+async def read_resume_position(user_id: int, audiobook_id: int):
+    # Served from memory; only the first read of a pair goes to the database.
+    position = resume_store.get(user_id, audiobook_id)
+    if position is UNKNOWN:
+        position = await run_in_threadpool(resume_store.load, user_id, audiobook_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="Resume position not found")
+    return position
+
+
+@router.put("/{user_id}/resume/{audiobook_id}", response_model=ResumePositionRead)
+async def update_resume_position(
+    user_id: int, audiobook_id: int, update: ResumePositionUpdate
+):
+    now = datetime.utcnow()
+    # A client clock ahead of ours must not block every later write, as
+    # updates are last-writer-wins on updated_at.
+    updated_at = min(naive_utc(update.updated_at) or now, now)
+    # Written behind the request; see ResumeStore.
+    position = resume_store.put(
+        ResumePositionRead(
+            user_id=user_id,
+            audiobook_id=audiobook_id,
+            position=update.position,
+            chapter_id=update.chapter_id,
+            updated_at=updated_at,
+        )
+    )
+    if position is None:
+        raise retry_later(
+            "Too many resume positions pending", resume_store.flush_interval
+        )
+    return position
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from datetime import datetime
 
-from schema import Review, ReviewCreate, ReviewRead
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlmodel import Session
+from typing import List, Optional
+
+from schema import BatchRequest, Review, ReviewBatchRead, ReviewCreate, ReviewRead
 from database import get_session
+from batch import parse_ids, read_batch
+from pagination import paginate
+from queries import filter_by, get_for, select_for
+from serialization import json_response
 
 router = APIRouter()
 
@@ -17,20 +23,54 @@ def create_review(review: ReviewCreate, session: Session = Depends(get_session))
     return db_review
 
 
+@router.get("/batch", response_model=ReviewBatchRead)
+def read_reviews_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Review, ReviewRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=ReviewBatchRead)
+def read_reviews_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Review, ReviewRead, batch.ids)
+
+
 @router.get("/{review_id}", response_model=ReviewRead)
 def read_review(review_id: int, session: Session = Depends(get_session)):
-    review = session.get(Review, review_id)
+    review = get_for(session, Review, ReviewRead, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
-    return review
+    return json_response(ReviewRead, review)
 
 
 @router.get("/", response_model=List[ReviewRead])
 def list_reviews(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    audiobook_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    session: Session = Depends(get_session),
 ):
-    reviews = session.exec(select(Review).offset(skip).limit(limit)).all()
-    return reviews
+    reviews = paginate(
+        session,
+        filter_by(
+            select_for(Review, ReviewRead),
+            {Review.user_id: user_id, Review.audiobook_id: audiobook_id},
+            Review.created_at,
+            since,
+            until,
+        ),
+        Review.review_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[ReviewRead], reviews, response)
 
 
 @router.put("/{review_id}", response_model=ReviewRead)
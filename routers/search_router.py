@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from typing import List
+
+from schema import SearchResult
+from database import get_session
+from search import search_catalog
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[SearchResult])
+def search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    session: Session = Depends(get_session),
+):
+    return search_catalog(session, q, limit)
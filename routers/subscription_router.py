@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import Subscription, SubscriptionCreate, SubscriptionRead
+from schema import (
+    BatchRequest,
+    Subscription,
+    SubscriptionBatchRead,
+    SubscriptionCreate,
+    SubscriptionRead,
+)
 from database import get_session
+from batch import parse_ids, read_batch
+from pagination import paginate
+from queries import get_for, select_for
+from serialization import json_response
 
 router = APIRouter()
 
@@ -19,20 +29,44 @@ def create_subscription(
     return db_subscription
 
 
+@router.get("/batch", response_model=SubscriptionBatchRead)
+def read_subscriptions_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, Subscription, SubscriptionRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=SubscriptionBatchRead)
+def read_subscriptions_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, Subscription, SubscriptionRead, batch.ids)
+
+
 @router.get("/{subscription_id}", response_model=SubscriptionRead)
 def read_subscription(subscription_id: int, session: Session = Depends(get_session)):
-    subscription = session.get(Subscription, subscription_id)
+    subscription = get_for(session, Subscription, SubscriptionRead, subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
-    return subscription
+    return json_response(SubscriptionRead, subscription)
 
 
 @router.get("/", response_model=List[SubscriptionRead])
 def list_subscriptions(
-    skip: int = 0, limit: int = 10, session: Session = Depends(get_session)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
 ):
-    subscriptions = session.exec(select(Subscription).offset(skip).limit(limit)).all()
-    return subscriptions
+    subscriptions = paginate(
+        session,
+        select_for(Subscription, SubscriptionRead),
+        Subscription.subscription_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[SubscriptionRead], subscriptions, response)
 
 
 @router.put("/{subscription_id}", response_model=SubscriptionRead)
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Response
+from sqlmodel import Session
+from typing import List, Optional
 
-from schema import User, UserCreate, UserRead
+from schema import BatchRequest, User, UserBatchRead, UserCreate, UserRead
 from database import get_session
+from batch import parse_ids, read_batch
+from entitlements import entitlement_index
+from pagination import paginate
+from queries import get_for, select_for
+from serialization import json_response
 
 router = APIRouter()
 
@@ -17,18 +22,44 @@ def create_user(user: UserCreate, session: Session = Depends(get_session)):
     return db_user
 
 
+@router.get("/batch", response_model=UserBatchRead)
+def read_users_batch(ids: str, session: Session = Depends(get_session)):
+    return read_batch(session, User, UserRead, parse_ids(ids))
+
+
+@router.post("/batch", response_model=UserBatchRead)
+def read_users_batch_by_body(
+    batch: BatchRequest, session: Session = Depends(get_session)
+):
+    return read_batch(session, User, UserRead, batch.ids)
+
+
 @router.get("/{user_id}", response_model=UserRead)
 def read_user(user_id: int, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+    user = get_for(session, User, UserRead, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return json_response(UserRead, user)
 
 
 @router.get("/", response_model=List[UserRead])
-def list_users(skip: int = 0, limit: int = 10, session: Session = Depends(get_session)):
-    users = session.exec(select(User).offset(skip).limit(limit)).all()
-    return users
+def list_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    users = paginate(
+        session,
+        select_for(User, UserRead),
+        User.user_id,
+        response,
+        skip,
+        limit,
+        cursor,
+    )
+    return json_response(List[UserRead], users, response)
 
 
 @router.put("/{user_id}", response_model=UserRead)
@@ -54,4 +85,5 @@ def delete_user(user_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="User not found")
     session.delete(user)
     session.commit()
+    entitlement_index.invalidate(user_id)
     return {"ok": True}
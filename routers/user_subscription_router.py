@@ -0,0 +1,87 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlmodel import Session, select
+from typing import List
+
+from schema import (
+    Subscription,
+    User,
+    UserSubscriptionBase,
+    UserSubscriptionCreate,
+    UserSubscriptionLink,
+    UserSubscriptionRead,
+)
+from database import get_session
+from entitlements import entitlement_index
+from timeutil import naive_utc
+
+router = APIRouter()
+
+
+def _check_period(period: UserSubscriptionBase):
+    # EntitlementIndex checks periods against naive UTC.
+    period.start_date = naive_utc(period.start_date)
+    period.end_date = naive_utc(period.end_date)
+    if period.end_date <= period.start_date:
+        raise HTTPException(status_code=422, detail="end_date must be after start_date")
+
+
+@router.post("/", response_model=UserSubscriptionRead)
+def create_user_subscription(
+    user_subscription: UserSubscriptionCreate, session: Session = Depends(get_session)
+):
+    _check_period(user_subscription)
+    if not session.get(User, user_subscription.user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    if not session.get(Subscription, user_subscription.subscription_id):
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    key = (user_subscription.user_id, user_subscription.subscription_id)
+    if session.get(UserSubscriptionLink, key):
+        raise HTTPException(status_code=409, detail="User subscription already exists")
+    db_user_subscription = UserSubscriptionLink.from_orm(user_subscription)
+    session.add(db_user_subscription)
+    session.commit()
+    session.refresh(db_user_subscription)
+    entitlement_index.invalidate(db_user_subscription.user_id)
+    return db_user_subscription
+
+
+@router.get("/{user_id}", response_model=List[UserSubscriptionRead])
+def read_user_subscriptions(user_id: int, session: Session = Depends(get_session)):
+    return session.exec(
+        select(UserSubscriptionLink)
+        .where(UserSubscriptionLink.user_id == user_id)
+        .order_by(UserSubscriptionLink.start_date)
+    ).all()
+
+
+@router.put("/{user_id}/{subscription_id}", response_model=UserSubscriptionRead)
+def update_user_subscription(
+    user_id: int,
+    subscription_id: int,
+    period: UserSubscriptionBase,
+    session: Session = Depends(get_session),
+):
+    _check_period(period)
+    db_user_subscription = session.get(UserSubscriptionLink, (user_id, subscription_id))
+    if not db_user_subscription:
+        raise HTTPException(status_code=404, detail="User subscription not found")
+    for key, value in period.dict(exclude_unset=True).items():
+        setattr(db_user_subscription, key, value)
+    session.add(db_user_subscription)
+    session.commit()
+    session.refresh(db_user_subscription)
+    entitlement_index.invalidate(user_id)
+    return db_user_subscription
+
+
+@router.delete("/{user_id}/{subscription_id}")
+def delete_user_subscription(
+    user_id: int, subscription_id: int, session: Session = Depends(get_session)
+):
+    user_subscription = session.get(UserSubscriptionLink, (user_id, subscription_id))
+    if not user_subscription:
+        raise HTTPException(status_code=404, detail="User subscription not found")
+    session.delete(user_subscription)
+    session.commit()
+    entitlement_index.invalidate(user_id)
+    return {"ok": True}
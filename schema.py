@@ -1,5 +1,6 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
+from sqlalchemy import Index, UniqueConstraint, text
 from sqlmodel import SQLModel, Field, Relationship, create_engine, Session
 
 
@@ -8,7 +9,10 @@ class UserSubscriptionLink(SQLModel, table=True):
         default=None, foreign_key="user.user_id", primary_key=True
     )
     subscription_id: Optional[int] = Field(
-        default=None, foreign_key="subscription.subscription_id", primary_key=True
+        default=None,
+        foreign_key="subscription.subscription_id",
+        primary_key=True,
+        index=True,
     )
     start_date: datetime
     end_date: datetime
@@ -19,7 +23,7 @@ class AudiobookCategoryLink(SQLModel, table=True):
         default=None, foreign_key="audiobook.audiobook_id", primary_key=True
     )
     category_id: Optional[int] = Field(
-        default=None, foreign_key="category.category_id", primary_key=True
+        default=None, foreign_key="category.category_id", primary_key=True, index=True
     )
 
 
@@ -74,8 +78,10 @@ class Narrator(SQLModel, table=True):
 class Audiobook(SQLModel, table=True):
     audiobook_id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(..., max_length=255)
-    author_id: int = Field(default=None, foreign_key="author.author_id")
-    narrator_id: Optional[int] = Field(default=None, foreign_key="narrator.narrator_id")
+    author_id: int = Field(default=None, foreign_key="author.author_id", index=True)
+    narrator_id: Optional[int] = Field(
+        default=None, foreign_key="narrator.narrator_id", index=True
+    )
     duration: int = Field(...)  # in seconds
     description: Optional[str] = None
     release_date: Optional[datetime] = None
@@ -94,9 +100,18 @@ class Audiobook(SQLModel, table=True):
     reviews: List["Review"] = Relationship(back_populates="audiobook")
     ratings: List["Rating"] = Relationship(back_populates="audiobook")
     purchases: List["Purchase"] = Relationship(back_populates="audiobook")
+    rating_aggregate: Optional["RatingAggregate"] = Relationship(
+        back_populates="audiobook",
+        sa_relationship_kwargs={"uselist": False, "cascade": "all, delete-orphan"},
+    )
 
 
 class Chapter(SQLModel, table=True):
+    # An audiobook's chapters in playback order (timelines, ?audiobook_id=).
+    __table_args__ = (
+        Index("ix_chapter_audiobook_position", "audiobook_id", "position"),
+    )
+
     chapter_id: Optional[int] = Field(default=None, primary_key=True)
     audiobook_id: int = Field(default=None, foreign_key="audiobook.audiobook_id")
     title: Optional[str] = Field(..., max_length=255)
@@ -118,23 +133,60 @@ class Category(SQLModel, table=True):
 
 
 class ListeningHistory(SQLModel, table=True):
+    # A listening session is identified by who started which book when;
+    # progress heartbeats upsert onto this key. It also serves ?user_id=;
+    # the indexes below serve the other list filters.
+    __table_args__ = (
+        UniqueConstraint("user_id", "audiobook_id", "started_at"),
+        Index("ix_listeninghistory_user_started", "user_id", "started_at"),
+        Index("ix_listeninghistory_audiobook_started", "audiobook_id", "started_at"),
+    )
+
     history_id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(default=None, foreign_key="user.user_id")
     audiobook_id: int = Field(default=None, foreign_key="audiobook.audiobook_id")
-    started_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     finished_at: Optional[datetime] = None
+    # Bumped on every write so /export can pull changes incrementally; the
+    # same column is on Rating, Review and Purchase.
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
 
     user: "User" = Relationship(back_populates="listening_histories")
     audiobook: "Audiobook" = Relationship(back_populates="listening_histories")
 
 
 class Bookmark(SQLModel, table=True):
+    # A user has at most one resume bookmark per audiobook, written by the
+    # resume store (see resume.py) and upserted onto this index.
+    __table_args__ = (
+        Index(
+            "ix_bookmark_resume",
+            "user_id",
+            "audiobook_id",
+            unique=True,
+            sqlite_where=text("is_resume"),
+        ),
+        Index("ix_bookmark_user_audiobook", "user_id", "audiobook_id"),
+    )
+
     bookmark_id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(default=None, foreign_key="user.user_id")
-    audiobook_id: int = Field(default=None, foreign_key="audiobook.audiobook_id")
-    chapter_id: Optional[int] = Field(default=None, foreign_key="chapter.chapter_id")
+    audiobook_id: int = Field(
+        default=None, foreign_key="audiobook.audiobook_id", index=True
+    )
+    chapter_id: Optional[int] = Field(
+        default=None, foreign_key="chapter.chapter_id", index=True
+    )
     position: int = Field(...)  # in seconds
+    is_resume: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow}
+    )
 
     user: "User" = Relationship(back_populates="bookmarks")
     audiobook: "Audiobook" = Relationship(back_populates="bookmarks")
@@ -142,32 +194,95 @@ class Bookmark(SQLModel, table=True):
 
 
 class Review(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_review_user_created", "user_id", "created_at"),
+        Index("ix_review_audiobook_created", "audiobook_id", "created_at"),
+    )
+
     review_id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(default=None, foreign_key="user.user_id")
     audiobook_id: int = Field(default=None, foreign_key="audiobook.audiobook_id")
     review_text: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
 
     user: "User" = Relationship(back_populates="reviews")
     audiobook: "Audiobook" = Relationship(back_populates="reviews")
 
 
 class Rating(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_rating_user_created", "user_id", "created_at"),
+        Index("ix_rating_audiobook_created", "audiobook_id", "created_at"),
+    )
+
     rating_id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(default=None, foreign_key="user.user_id")
     audiobook_id: int = Field(default=None, foreign_key="audiobook.audiobook_id")
     rating: int = Field(...)  # out of 5
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
 
     user: "User" = Relationship(back_populates="ratings")
     audiobook: "Audiobook" = Relationship(back_populates="ratings")
 
 
+class RatingAggregate(SQLModel, table=True):
+    """Running count, sum and star histogram of an audiobook's ratings."""
+
+    audiobook_id: Optional[int] = Field(
+        default=None, foreign_key="audiobook.audiobook_id", primary_key=True
+    )
+    rating_count: int = Field(default=0)
+    rating_sum: int = Field(default=0)
+    stars_1: int = Field(default=0)
+    stars_2: int = Field(default=0)
+    stars_3: int = Field(default=0)
+    stars_4: int = Field(default=0)
+    stars_5: int = Field(default=0)
+
+    audiobook: "Audiobook" = Relationship(back_populates="rating_aggregate")
+
+    @property
+    def average(self) -> Optional[float]:
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def histogram(self) -> Dict[int, int]:
+        return {
+            1: self.stars_1,
+            2: self.stars_2,
+            3: self.stars_3,
+            4: self.stars_4,
+            5: self.stars_5,
+        }
+
+
 class Purchase(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_purchase_user_date", "user_id", "purchase_date"),
+        Index("ix_purchase_audiobook_date", "audiobook_id", "purchase_date"),
+    )
+
     purchase_id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(default=None, foreign_key="user.user_id")
     audiobook_id: int = Field(default=None, foreign_key="audiobook.audiobook_id")
-    purchase_date: datetime = Field(default_factory=datetime.utcnow)
+    purchase_date: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        index=True,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
 
     user: "User" = Relationship(back_populates="purchases")
     audiobook: "Audiobook" = Relationship(back_populates="purchases")
@@ -204,6 +319,13 @@ class UserRead(UserBase):
         orm_mode = True
 
 
+class UserBatchRead(SQLModel):
+    # One entry per requested id, in request order, null where not found.
+    items: List[Optional[UserRead]]
+    # Requested ids that were not found
+    missing: List[int]
+
+
 # Subscription Models
 class SubscriptionBase(SQLModel):
     name: str
@@ -223,6 +345,11 @@ class SubscriptionRead(SubscriptionBase):
         orm_mode = True
 
 
+class SubscriptionBatchRead(SQLModel):
+    items: List[Optional[SubscriptionRead]]
+    missing: List[int]
+
+
 # UserSubscription Models
 class UserSubscriptionBase(SQLModel):
     start_date: datetime
@@ -235,14 +362,29 @@ class UserSubscriptionCreate(UserSubscriptionBase):
 
 
 class UserSubscriptionRead(UserSubscriptionBase):
-    user_subscription_id: int
-    user: UserRead
-    subscription: SubscriptionRead
+    user_id: int
+    subscription_id: int
 
     class Config:
         orm_mode = True
 
 
+# Entitlement Models
+class EntitlementRead(SQLModel):
+    user_id: int
+    audiobook_id: int
+    entitled: bool
+    # "purchase" or "subscription" when entitled
+    reason: Optional[str] = None
+    # End of the subscription period that entitles the user
+    expires_at: Optional[datetime] = None
+
+
+class EntitlementBatchRead(SQLModel):
+    user_id: int
+    items: List[EntitlementRead]
+
+
 # Author Models
 class AuthorBase(SQLModel):
     name: str
@@ -261,6 +403,11 @@ class AuthorRead(AuthorBase):
         orm_mode = True
 
 
+class AuthorBatchRead(SQLModel):
+    items: List[Optional[AuthorRead]]
+    missing: List[int]
+
+
 # Narrator Models
 class NarratorBase(SQLModel):
     name: str
@@ -279,6 +426,22 @@ class NarratorRead(NarratorBase):
         orm_mode = True
 
 
+class NarratorBatchRead(SQLModel):
+    items: List[Optional[NarratorRead]]
+    missing: List[int]
+
+
+# RatingAggregate Models
+class RatingAggregateRead(SQLModel):
+    audiobook_id: int
+    rating_count: int
+    average: Optional[float] = None
+    histogram: Dict[int, int]
+
+    class Config:
+        orm_mode = True
+
+
 # Audiobook Models
 class AudiobookBase(SQLModel):
     title: str
@@ -298,11 +461,17 @@ class AudiobookRead(AudiobookBase):
     created_at: datetime
     author: AuthorRead
     narrator: Optional[NarratorRead] = None
+    rating_aggregate: Optional[RatingAggregateRead] = None
 
     class Config:
         orm_mode = True
 
 
+class AudiobookBatchRead(SQLModel):
+    items: List[Optional[AudiobookRead]]
+    missing: List[int]
+
+
 # Chapter Models
 class ChapterBase(SQLModel):
     audiobook_id: int
@@ -323,6 +492,11 @@ class ChapterRead(ChapterBase):
         orm_mode = True
 
 
+class ChapterBatchRead(SQLModel):
+    items: List[Optional[ChapterRead]]
+    missing: List[int]
+
+
 # Category Models
 class CategoryBase(SQLModel):
     name: str
@@ -340,6 +514,11 @@ class CategoryRead(CategoryBase):
         orm_mode = True
 
 
+class CategoryBatchRead(SQLModel):
+    items: List[Optional[CategoryRead]]
+    missing: List[int]
+
+
 # AudiobookCategory Models
 class AudiobookCategoryBase(SQLModel):
     audiobook_id: int
@@ -376,6 +555,23 @@ class ListeningHistoryRead(ListeningHistoryBase):
         orm_mode = True
 
 
+class ListeningHistoryBatchRead(SQLModel):
+    items: List[Optional[ListeningHistoryRead]]
+    missing: List[int]
+
+
+# ListeningProgress Models
+class ListeningProgressEvent(SQLModel):
+    user_id: int
+    audiobook_id: int
+    started_at: datetime
+    reported_at: Optional[datetime] = None  # defaults to when the server got it
+
+
+class ListeningProgressAccepted(SQLModel):
+    accepted: int
+
+
 # Bookmark Models
 class BookmarkBase(SQLModel):
     user_id: int
@@ -396,6 +592,28 @@ class BookmarkRead(BookmarkBase):
         orm_mode = True
 
 
+class BookmarkBatchRead(SQLModel):
+    items: List[Optional[BookmarkRead]]
+    missing: List[int]
+
+
+# Resume Models
+class ResumePositionUpdate(SQLModel):
+    position: int
+    chapter_id: Optional[int] = None
+    # When the client was at this position; defaults to when the server got
+    # it. Older updates than the stored one are ignored.
+    updated_at: Optional[datetime] = None
+
+
+class ResumePositionRead(SQLModel):
+    user_id: int
+    audiobook_id: int
+    position: int
+    chapter_id: Optional[int] = None
+    updated_at: datetime
+
+
 # Review Models
 class ReviewBase(SQLModel):
     user_id: int
@@ -415,11 +633,16 @@ class ReviewRead(ReviewBase):
         orm_mode = True
 
 
+class ReviewBatchRead(SQLModel):
+    items: List[Optional[ReviewRead]]
+    missing: List[int]
+
+
 # Rating Models
 class RatingBase(SQLModel):
     user_id: int
     audiobook_id: int
-    rating: int  # out of 5
+    rating: int = Field(..., ge=1, le=5)  # out of 5
 
 
 class RatingCreate(RatingBase):
@@ -434,6 +657,11 @@ class RatingRead(RatingBase):
         orm_mode = True
 
 
+class RatingBatchRead(SQLModel):
+    items: List[Optional[RatingRead]]
+    missing: List[int]
+
+
 # Purchase Models
 class PurchaseBase(SQLModel):
     user_id: int
@@ -452,6 +680,84 @@ class PurchaseRead(PurchaseBase):
         orm_mode = True
 
 
+class PurchaseBatchRead(SQLModel):
+    items: List[Optional[PurchaseRead]]
+    missing: List[int]
+
+
+# Search Models
+class SearchResult(SQLModel):
+    audiobook_id: int
+    title: str
+    author: Optional[str] = None
+    narrator: Optional[str] = None
+    snippet: str
+    score: float
+
+
+# Autocomplete Models
+class Completion(SQLModel):
+    kind: str
+    id: int
+    text: str
+    popularity: int
+
+
+# Response Cache Models
+class CacheStats(SQLModel):
+    backend: str
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    # misses answered by another request's in-flight load
+    coalesced: int = 0
+
+
+# Timeline Models
+class TimelineChapter(SQLModel):
+    chapter_id: int
+    title: Optional[str] = None
+    position: int
+    # offset in seconds from the start of the audiobook
+    start: int
+    duration: int
+
+
+class TimelineRead(SQLModel):
+    audiobook_id: int
+    duration: int
+    chapters: List[TimelineChapter]
+
+
+class TimelinePosition(SQLModel):
+    offset: float
+    chapter: TimelineChapter
+    offset_in_chapter: float
+
+
+# Batch Models
+class BatchRequest(SQLModel):
+    ids: List[int]
+
+
+# Bulk Models
+class BulkItemResult(SQLModel):
+    index: int
+    # created, updated, skipped, conflict or invalid
+    status: str
+    id: Optional[int] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+
+class BulkResult(SQLModel):
+    created: int
+    updated: int
+    skipped: int
+    results: List[BulkItemResult]
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
 
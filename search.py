@@ -0,0 +1,330 @@
+"""Full-text catalog search on SQLite FTS5 tables.
+
+Two FTS5 tables index one document per audiobook (rowid = ``audiobook_id``):
+``catalog_search_header`` the short fields (title, author, narrator and
+category names) and ``catalog_search`` additionally the description. Both
+are external-content tables over the ``catalog_search_document`` view, so
+they hold the index only and read the text from the catalog tables. Triggers
+on the catalog tables keep them in sync with every write path, so nothing in
+the routers has to remember to index. They are created alongside the
+regular tables by ``create_all``; an existing database can be backfilled
+with::
+
+    python search.py rebuild
+"""
+
+import argparse
+import re
+from collections import defaultdict
+from typing import List
+
+from sqlalchemy import event, text
+from sqlmodel import Session, SQLModel
+
+from database import engine
+from schema import SearchResult
+from settings import get_settings
+
+# Indexed columns of each table and their relative weight in BM25 ranking.
+# Matches on the header fields are the most relevant, and the header table is
+# a fraction of the size of the full one.
+TABLES = {
+    "catalog_search_header": {
+        "title": 10.0,
+        "author": 5.0,
+        "narrator": 3.0,
+        "category": 2.0,
+    },
+    "catalog_search": {
+        "title": 10.0,
+        "description": 1.0,
+        "author": 5.0,
+        "narrator": 3.0,
+        "category": 2.0,
+    },
+}
+
+DOCUMENT = "catalog_search_document"
+
+# The last word of a query is matched as a prefix once it is this long;
+# shorter prefixes match too much of the catalog to rank quickly.
+MIN_PREFIX = 3
+
+# External-content FTS5 tables only accept a delete with exactly the values
+# that were indexed, so every column of the view has to be deterministic:
+# category names are concatenated in category_id order.
+_DOCUMENT_VIEW = f"""
+    CREATE VIEW IF NOT EXISTS {DOCUMENT} AS
+    SELECT a.audiobook_id AS audiobook_id,
+           a.title AS title,
+           coalesce(a.description, '') AS description,
+           coalesce(au.name, '') AS author,
+           coalesce(n.name, '') AS narrator,
+           coalesce((SELECT group_concat(name, ' ') FROM (
+                         SELECT c.name AS name
+                         FROM audiobookcategorylink l
+                         JOIN category c ON c.category_id = l.category_id
+                         WHERE l.audiobook_id = a.audiobook_id
+                         ORDER BY c.category_id)), '') AS category
+    FROM audiobook a
+    LEFT JOIN author au ON au.author_id = a.author_id
+    LEFT JOIN narrator n ON n.narrator_id = a.narrator_id
+"""
+
+
+def _index(books: str) -> List[str]:
+    """Statements adding the audiobooks selected by ``books`` to every table."""
+    statements = []
+    for table, columns in TABLES.items():
+        names = ", ".join(columns)
+        statements.append(
+            f"INSERT INTO {table} (rowid, {names}) "
+            f"SELECT audiobook_id, {names} FROM {DOCUMENT}"
+            f" WHERE audiobook_id IN ({books})"
+        )
+    return statements
+
+
+def _unindex(books: str) -> List[str]:
+    """Statements removing the audiobooks selected by ``books`` from every table.
+
+    They read the indexed values from the view, so they have to run before
+    the catalog row changes.
+    """
+    statements = []
+    for table, columns in TABLES.items():
+        names = ", ".join(columns)
+        statements.append(
+            f"INSERT INTO {table} ({table}, rowid, {names}) "
+            f"SELECT 'delete', audiobook_id, {names} FROM {DOCUMENT}"
+            f" WHERE audiobook_id IN ({books})"
+        )
+    return statements
+
+
+def _trigger(name: str, event_clause: str, statements: List[str]) -> str:
+    body = "".join(f"{statement};\n" for statement in statements)
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS catalog_search_{name}
+    {event_clause} BEGIN
+        {body}
+    END
+    """
+
+
+def _reindex_triggers(name: str, event_clause: str, old: str, new: str) -> List[str]:
+    """Triggers unindexing ``old`` books before and indexing ``new`` after a write."""
+    return [
+        _trigger(f"{name}_before", f"BEFORE {event_clause}", _unindex(old)),
+        _trigger(name, f"AFTER {event_clause}", _index(new)),
+    ]
+
+
+def _virtual_table(table: str, columns: dict) -> str:
+    return f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+        {", ".join(columns)},
+        content = '{DOCUMENT}',
+        content_rowid = 'audiobook_id',
+        prefix = '{MIN_PREFIX} {MIN_PREFIX + 1}',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """
+
+
+def _books_of(column: str, key: str, table: str = "audiobook") -> str:
+    return f"SELECT audiobook_id FROM {table} WHERE {column} = {key}"
+
+
+DDL = [_DOCUMENT_VIEW]
+DDL += [_virtual_table(table, columns) for table, columns in TABLES.items()]
+DDL += [
+    _trigger(
+        "audiobook_insert",
+        "AFTER INSERT ON audiobook",
+        _index("SELECT NEW.audiobook_id"),
+    ),
+    *_reindex_triggers(
+        "audiobook_update",
+        "UPDATE ON audiobook",
+        "SELECT OLD.audiobook_id",
+        "SELECT NEW.audiobook_id",
+    ),
+    _trigger(
+        "audiobook_delete",
+        "BEFORE DELETE ON audiobook",
+        _unindex("SELECT OLD.audiobook_id"),
+    ),
+    *_reindex_triggers(
+        "author_update",
+        "UPDATE OF name ON author",
+        _books_of("author_id", "OLD.author_id"),
+        _books_of("author_id", "NEW.author_id"),
+    ),
+    *_reindex_triggers(
+        "author_delete",
+        "DELETE ON author",
+        _books_of("author_id", "OLD.author_id"),
+        _books_of("author_id", "OLD.author_id"),
+    ),
+    *_reindex_triggers(
+        "narrator_update",
+        "UPDATE OF name ON narrator",
+        _books_of("narrator_id", "OLD.narrator_id"),
+        _books_of("narrator_id", "NEW.narrator_id"),
+    ),
+    *_reindex_triggers(
+        "narrator_delete",
+        "DELETE ON narrator",
+        _books_of("narrator_id", "OLD.narrator_id"),
+        _books_of("narrator_id", "OLD.narrator_id"),
+    ),
+    *_reindex_triggers(
+        "category_update",
+        "UPDATE OF name ON category",
+        _books_of("category_id", "OLD.category_id", "audiobookcategorylink"),
+        _books_of("category_id", "NEW.category_id", "audiobookcategorylink"),
+    ),
+    *_reindex_triggers(
+        "category_link_insert",
+        "INSERT ON audiobookcategorylink",
+        "SELECT NEW.audiobook_id",
+        "SELECT NEW.audiobook_id",
+    ),
+    *_reindex_triggers(
+        "category_link_delete",
+        "DELETE ON audiobookcategorylink",
+        "SELECT OLD.audiobook_id",
+        "SELECT OLD.audiobook_id",
+    ),
+]
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def create_search_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in DDL:
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(SQLModel.metadata, "before_drop")
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    drop_search_tables(connection)
+
+
+def drop_search_tables(connection):
+    """Drop the FTS tables and their view; the triggers go with the catalog tables."""
+    for table in TABLES:
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+    connection.exec_driver_sql(f"DROP VIEW IF EXISTS {DOCUMENT}")
+
+
+def rebuild_search_index(session: Session) -> int:
+    """Re-index every audiobook from the catalog tables."""
+    connection = session.connection()
+    for table in TABLES:
+        connection.exec_driver_sql(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+    return connection.exec_driver_sql(f"SELECT count(*) FROM {DOCUMENT}").scalar_one()
+
+
+def match_expression(query: str) -> str:
+    """Turn free text into an FTS5 query matching every word.
+
+    Only the last word, the one still being typed, is matched as a prefix,
+    and only once it has ``MIN_PREFIX`` characters: that keeps the set of
+    matches, all of which get ranked, small. Words are quoted so FTS5
+    operators and punctuation in user input are taken literally.
+    """
+    terms = [f'"{word}"' for word in re.findall(r"\w+", query)]
+    if terms and len(terms[-1]) - 2 >= MIN_PREFIX:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _search_statement(table: str, columns: dict) -> str:
+    # FTS5 ranks every match by ``rank`` and keeps the best :candidates; the
+    # merge in search_catalog needs more than the top :limit of each table.
+    weights = ", ".join(map(str, columns.values()))
+    return f"""
+        SELECT rowid AS audiobook_id, title, author, narrator,
+               snippet({table}, -1, '<b>', '</b>', '…', 12) AS snippet,
+               rank AS score
+        FROM {table}
+        WHERE {table} MATCH :match AND rank MATCH 'bm25({weights})'
+        ORDER BY rank
+        LIMIT :candidates
+    """
+
+
+# Both tables in one round trip; ``source`` tells their rows apart.
+_SEARCH = text(
+    " UNION ALL ".join(
+        f"SELECT {source} AS source, * FROM ({_search_statement(table, columns)})"
+        for source, (table, columns) in enumerate(TABLES.items())
+    )
+)
+
+
+def search_catalog(session: Session, query: str, limit: int = 10) -> List[SearchResult]:
+    """Top ``limit`` audiobooks matching every word of ``query``.
+
+    The best ``search_candidate_limit`` matches of each table are merged.
+    BM25 scores of different tables are not comparable, so each is divided
+    by the best score in its table first, which puts it in [0, 1]; a book's
+    score is the sum over the tables it matched in.
+    A match on the header fields, found in both tables, therefore usually
+    ranks above one on the description alone, but not always.
+    """
+    match = match_expression(query)
+    if not match:
+        return []
+    rows = session.execute(
+        _SEARCH,
+        {
+            "match": match,
+            "candidates": max(limit, get_settings().search_candidate_limit),
+        },
+    ).all()
+    # bm25() is lower-is-better and negative, so the best score is the least
+    best = {}
+    for row in rows:
+        best[row.source] = min(best.get(row.source, 0.0), row.score)
+    scores = defaultdict(float)
+    # the row shown for each book: the one with its best normalized score
+    shown = {}
+    for row in rows:
+        score = row.score / (best[row.source] or -1.0)
+        scores[row.audiobook_id] += score
+        if row.audiobook_id not in shown or score > shown[row.audiobook_id][0]:
+            shown[row.audiobook_id] = (score, row)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [
+        SearchResult(
+            audiobook_id=audiobook_id,
+            title=shown[audiobook_id][1].title,
+            author=shown[audiobook_id][1].author or None,
+            narrator=shown[audiobook_id][1].narrator or None,
+            snippet=shown[audiobook_id][1].snippet,
+            score=scores[audiobook_id],
+        )
+        for audiobook_id in ranked
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the catalog search index.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        indexed = rebuild_search_index(session)
+        session.commit()
+    print(f"Indexed {indexed} audiobooks")
+
+
+if __name__ == "__main__":
+    main()
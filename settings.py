@@ -0,0 +1,109 @@
+from functools import lru_cache
+from typing import Literal, Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Deployment settings, read from ``AUDIOBOOK_*`` environment variables or ``.env``."""
+
+    model_config = SettingsConfigDict(env_prefix="AUDIOBOOK_", env_file=".env")
+
+    database_url: str = "sqlite:///test/test_audiobook_app.db"
+    sql_echo: bool = False
+    # "async" serves every router from async handlers over an AsyncSession
+    database_mode: Literal["sync", "async"] = "sync"
+    # Apply pending migrations on startup; when off, a database behind the
+    # code refuses to start until `python migrations.py upgrade` has run.
+    migrate_on_startup: bool = True
+
+    # Connection pool. Keep pool_size + max_overflow above the 40 worker
+    # threads FastAPI runs sync handlers on: a thread waiting for a connection
+    # can otherwise starve the threads that would close sessions and return one.
+    pool_size: int = 20
+    max_overflow: int = 40
+    pool_timeout: float = 30.0
+    pool_pre_ping: bool = True
+
+    # SQL instrumentation; see sql_instrumentation.py. Statements slower
+    # than slow_query_ms, and requests spending slow_request_db_ms in the
+    # database or running slow_request_queries statements, are logged to
+    # "sql.slow"; 0 turns a check off. Parameters are logged as their type
+    # unless sql_log_parameters, and never for sensitive bind names.
+    server_timing: bool = True
+    slow_query_ms: float = 100.0
+    slow_request_db_ms: float = 500.0
+    slow_request_queries: int = 50
+    sql_log_parameters: bool = False
+    sql_sensitive_parameters: str = "password|email|token|secret"
+
+    # SQLite pragmas applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 64 * 1024
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+
+    # Listening-progress write-behind buffer. At most progress_buffer_size
+    # heartbeats, or progress_flush_interval seconds of them, are lost if
+    # the process dies without a clean shutdown.
+    progress_buffer_size: int = 10000
+    progress_batch_size: int = 500
+    progress_flush_interval: float = 1.0
+
+    # Resume positions: the latest position per (user, audiobook) is kept
+    # in memory for resume_store_size pairs and written to Bookmark every
+    # resume_flush_interval seconds; at most resume_max_pending writes wait.
+    # A position read from the database is reloaded after resume_store_ttl
+    # seconds, which bounds how stale another worker's copy can be.
+    resume_store_size: int = 100000
+    resume_store_ttl: float = 60.0
+    resume_max_pending: int = 10000
+    resume_flush_interval: float = 1.0
+
+    # Catalog search merges this many of the best-ranked matches per table;
+    # see search.search_catalog.
+    search_candidate_limit: int = 100
+
+    # Cache of single-entity catalog reads; see response_cache.py.
+    response_cache_backend: Literal["memory", "shared", "none"] = "memory"
+    response_cache_max_entries: int = 10000
+    response_cache_ttl: float = 300.0
+    response_cache_single_flight: bool = True
+    # SQLite file of the "shared" backend
+    response_cache_path: str = "response_cache.db"
+
+    # Rows per chunk of a streaming /export response.
+    export_chunk_size: int = 1000
+
+    # Items accepted by one POST /{entity}/bulk request.
+    bulk_max_items: int = 10000
+    # Ids accepted by one /{entity}/batch read.
+    batch_max_ids: int = 1000
+
+    # Audiobooks whose chapter timeline is kept in memory.
+    timeline_cache_size: int = 10000
+
+    # Users whose entitlements are kept in memory; see entitlements.py. An
+    # entry is reloaded after entitlement_cache_ttl seconds, which bounds how
+    # stale another worker's cache can be after a purchase.
+    entitlement_cache_size: int = 100000
+    entitlement_cache_ttl: float = 60.0
+
+    # On-demand profiling; see profiling.py. The middleware is only installed
+    # when profiling_token or profiling_sample_every is set. A request
+    # carrying the token is profiled, as is every profiling_sample_every-th
+    # request; stacks are sampled every profiling_interval_ms and written
+    # to profiling_dir, which keeps the newest profiling_max_files profiles
+    # of at most profiling_max_file_kb each.
+    profiling_token: Optional[str] = None
+    profiling_sample_every: int = 0
+    profiling_interval_ms: float = 1.0
+    profiling_dir: str = "profiles"
+    profiling_max_files: int = 100
+    profiling_max_file_kb: int = 1024
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
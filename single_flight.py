@@ -0,0 +1,105 @@
+"""Single-flight execution: concurrent calls for the same key share one result.
+
+The first caller for a key (the leader) runs the function; callers arriving
+while it runs wait for and return the leader's result, or raise its error,
+instead of running the function themselves. Nothing is remembered once the
+leader finishes; callers that must not repeat the work afterwards consult a
+cache first (see ``response_cache.py``).
+
+``do`` serves sync code both on worker threads and inside
+``AsyncSession.run_sync``, where the handler body runs in a greenlet on the
+event loop: there a follower awaits the result instead of blocking the loop
+the leader needs to make progress. ``do_async`` is the coroutine version.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        # Calls that ran the function, and calls that shared another's run.
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _finish(self, key, call: _Call, result=None, error=None):
+        with self._lock:
+            del self._calls[key]
+            call.result, call.error = result, error
+            call.done.set()
+            futures, call.futures = call.futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _future(self, call: _Call) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if call.done.is_set():
+                future.set_result(None)
+            else:
+                call.futures.append((loop, future))
+        return future
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        call, leader = self._join(key)
+        if not leader:
+            if in_greenlet():
+                await_only(self._future(call))
+            else:
+                call.done.wait()
+            return call.outcome()
+        try:
+            result = fn()
+        except BaseException as error:
+            self._finish(key, call, error=error)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call, leader = self._join(key)
+        if not leader:
+            await self._future(call)
+            return call.outcome()
+        try:
+            result = await fn()
+        except BaseException as error:
+            self._finish(key, call, error=error)
+            raise
+        self._finish(key, call, result=result)
+        return result
@@ -0,0 +1,195 @@
+"""Per-request SQL accounting: query count, DB time and the slowest statement.
+
+``instrument(engine)`` hooks the cursor events of an engine; ``database``
+instruments the sync engine and the sync side of the async one.
+``QueryStatsMiddleware`` gives every request a ``QueryStats`` through a
+context variable, which follows the request into the threadpool and into
+``AsyncSession.run_sync``, so each statement is charged to the request that
+ran it. Statements outside a request (the write-behind flushers, startup)
+are only checked against the slow-query threshold.
+
+The totals go out in a ``Server-Timing`` header, visible in the browser's
+network panel::
+
+    Server-Timing: db;dur=3.42;desc="5 queries", db-slowest;dur=1.87
+
+Slow statements, and requests over the DB time or query count budgets, are
+logged as one JSON object per line on the ``sql.slow`` logger. Parameters are
+logged as their type unless ``sql_log_parameters`` is on, and those bound to
+columns matching ``sql_sensitive_parameters`` are always masked.
+"""
+
+import logging
+import re
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+from sqlalchemy import event
+
+from settings import get_settings
+
+logger = logging.getLogger("sql.slow")
+
+
+class QueryStats:
+    __slots__ = ("count", "duration", "slowest", "slowest_statement")
+
+    def __init__(self):
+        self.count = 0
+        # seconds
+        self.duration = 0.0
+        self.slowest = 0.0
+        self.slowest_statement: Optional[str] = None
+
+    def add(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        if duration > self.slowest:
+            self.slowest = duration
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries",'
+            f" db-slowest;dur={self.slowest * 1000:.2f}"
+        )
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+# The ASGI scope of the request; the router adds the matched route to it.
+_current_scope: ContextVar[Optional[dict]] = ContextVar("query_scope", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    """The ``QueryStats`` of the request being served, if any."""
+    return _current.get()
+
+
+def route_template(scope) -> str:
+    """The path template of the route that served ``scope``, e.g. ``/users/{user_id}``."""
+    route = scope.get("route")
+    return route.path if route is not None else "<unmatched>"
+
+
+def _bind_names(context, count: int):
+    compiled = getattr(context, "compiled", None)
+    names = getattr(compiled, "positiontup", None)
+    if names is None or len(names) != count:
+        return [None] * count
+    return names
+
+
+def redact(context, parameters):
+    """``parameters`` of one statement as they may be logged."""
+    settings = get_settings()
+    sensitive = re.compile(settings.sql_sensitive_parameters, re.IGNORECASE)
+    if isinstance(parameters, dict):
+        items = list(parameters.items())
+    else:
+        parameters = list(parameters or ())
+        items = list(zip(_bind_names(context, len(parameters)), parameters))
+    redacted = []
+    for name, value in items:
+        if name is not None and sensitive.search(name):
+            value = "***"
+        elif not settings.sql_log_parameters:
+            value = f"<{type(value).__name__}>"
+        redacted.append(value if name is None else {name: value})
+    return redacted
+
+
+def _log(record: dict):
+    logger.warning(orjson.dumps(record, default=str).decode())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_started
+    stats = _current.get()
+    if stats is not None:
+        stats.add(statement, duration)
+    threshold = get_settings().slow_query_ms
+    if threshold and duration * 1000 >= threshold:
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        scope = _current_scope.get()
+        _log(
+            {
+                "event": "slow_query",
+                "route": route_template(scope) if scope is not None else None,
+                "duration_ms": round(duration * 1000, 3),
+                "statement": statement,
+                "parameters": redact(context, parameters),
+                "executemany": executemany,
+            }
+        )
+
+
+def instrument(db_engine):
+    """Time every statement ``db_engine`` (a sync ``Engine``) runs."""
+    if not event.contains(db_engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+    return db_engine
+
+
+class QueryStatsMiddleware:
+    """Collect ``QueryStats`` per request and report them.
+
+    A plain ASGI middleware rather than ``BaseHTTPMiddleware``, which would
+    run the app in a separate task and buffer streaming responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = QueryStats()
+        stats_token = _current.set(stats)
+        scope_token = _current_scope.set(scope)
+        settings = get_settings()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.server_timing:
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"server-timing", stats.server_timing().encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(stats_token)
+            _current_scope.reset(scope_token)
+            self._check_budget(scope, stats, settings)
+
+    @staticmethod
+    def _check_budget(scope, stats: QueryStats, settings):
+        over_time = (
+            settings.slow_request_db_ms
+            and stats.duration * 1000 >= settings.slow_request_db_ms
+        )
+        over_count = (
+            settings.slow_request_queries
+            and stats.count >= settings.slow_request_queries
+        )
+        if over_time or over_count:
+            _log(
+                {
+                    "event": "slow_request",
+                    "route": route_template(scope),
+                    "method": scope["method"],
+                    "queries": stats.count,
+                    "db_ms": round(stats.duration * 1000, 3),
+                    "slowest_ms": round(stats.slowest * 1000, 3),
+                    "slowest_statement": stats.slowest_statement,
+                }
+            )
@@ -0,0 +1,203 @@
+"""Performance budgets for endpoint calls.
+
+The ``budget`` fixture measures the SQL statements, peak traced memory and
+wall time of a block, usually one request, and fails the test when it goes
+over the limits it declares::
+
+    async with budget("list_audiobooks", max_queries=2, max_memory_kb=512):
+        response = await async_client.get("/audiobooks/")
+
+A budget works as ``with`` in sync tests too. Every measurement is listed at
+the end of the run, the ones closest to a limit first, and written as JSON
+with ``--budget-report=PATH``.
+"""
+
+import math
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import orjson
+import pytest
+from sqlalchemy import event
+
+from database import engine, get_async_engine
+
+_results = pytest.StashKey[List[dict]]()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--budget-report",
+        metavar="PATH",
+        help="write the measurements of `budget` blocks to PATH as JSON",
+    )
+
+
+def pytest_configure(config):
+    config.stash[_results] = []
+
+
+class Budget:
+    """One measured block; ``None`` limits are measured but not enforced."""
+
+    def __init__(
+        self,
+        name: str,
+        max_queries: Optional[int] = None,
+        max_memory_kb: Optional[float] = None,
+        max_ms: Optional[float] = None,
+    ):
+        self.name = name
+        self.limits = {
+            "queries": max_queries,
+            "memory_kb": max_memory_kb,
+            "ms": max_ms,
+        }
+        self.statements: List[str] = []
+        self.measured: Dict[str, float] = {}
+
+    def _before_cursor_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def _engines(self):
+        engines = [engine]
+        if get_async_engine.cache_info().currsize:
+            engines.append(get_async_engine().sync_engine)
+        return engines
+
+    def __enter__(self):
+        for db_engine in self._engines():
+            event.listen(
+                db_engine, "before_cursor_execute", self._before_cursor_execute
+            )
+        self._tracing = tracemalloc.is_tracing()
+        if not self._tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._baseline, _ = tracemalloc.get_traced_memory()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        _, peak = tracemalloc.get_traced_memory()
+        if not self._tracing:
+            tracemalloc.stop()
+        for db_engine in self._engines():
+            if event.contains(
+                db_engine, "before_cursor_execute", self._before_cursor_execute
+            ):
+                event.remove(
+                    db_engine, "before_cursor_execute", self._before_cursor_execute
+                )
+        self.measured = {
+            "queries": len(self.statements),
+            "memory_kb": round((peak - self._baseline) / 1024, 1),
+            "ms": round(elapsed * 1000, 2),
+        }
+        if exc_type is None:
+            self.check()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
+
+    def usage(self) -> Dict[str, float]:
+        """Measured over limit, for the limits that are set."""
+
+        def ratio(measured, limit):
+            if limit:
+                return measured / limit
+            return math.inf if measured else 0.0
+
+        return {
+            metric: ratio(self.measured[metric], limit)
+            for metric, limit in self.limits.items()
+            if limit is not None
+        }
+
+    def check(self):
+        over = [
+            f"{metric} {self.measured[metric]} > {self.limits[metric]}"
+            for metric, used in self.usage().items()
+            if used > 1
+        ]
+        if over:
+            statements = "\n".join(f"  {s}" for s in self.statements)
+            pytest.fail(
+                f"{self.name} over budget: {', '.join(over)}\n"
+                f"statements:\n{statements}",
+                pytrace=False,
+            )
+
+
+@pytest.fixture
+def budget(request):
+    """``budget(name, max_queries=, max_memory_kb=, max_ms=)`` measures a block.
+
+    ``report=False`` leaves the block out of the summary, for tests of the
+    budget itself.
+    """
+    results = request.config.stash[_results]
+
+    def measure(name: str, report: bool = True, **limits) -> Budget:
+        measured = Budget(name, **limits)
+        if report:
+            results.append({"test": request.node.nodeid, "budget": measured})
+        return measured
+
+    return measure
+
+
+def _rows(config):
+    rows = []
+    for result in config.stash.get(_results, []):
+        measured = result["budget"]
+        if not measured.measured:
+            continue
+        usage = measured.usage()
+        rows.append(
+            {
+                "name": measured.name,
+                "test": result["test"],
+                "measured": measured.measured,
+                "limits": measured.limits,
+                "usage": max(usage.values()) if usage else 0.0,
+                "total_usage": sum(usage.values()),
+            }
+        )
+    # Ties, typically exact query counts, go to the block closer on the rest.
+    return sorted(
+        rows, key=lambda row: (row["usage"], row["total_usage"]), reverse=True
+    )
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    rows = _rows(config)
+    if not rows:
+        return
+    terminalreporter.section("performance budgets")
+    terminalreporter.write_line(
+        f"{'name':<32} {'queries':>9} {'memory KiB':>16} {'ms':>16} {'used':>6}"
+    )
+
+    def cell(row, metric, width):
+        limit = row["limits"][metric]
+        value = f"{row['measured'][metric]:g}"
+        if limit is None:
+            return value.rjust(width)
+        return f"{value}/{limit:g}".rjust(width)
+
+    for row in rows:
+        terminalreporter.write_line(
+            f"{row['name']:<32} {cell(row, 'queries', 9)}"
+            f" {cell(row, 'memory_kb', 16)} {cell(row, 'ms', 16)}"
+            f" {row['usage']:>6.0%}"
+        )
+    path = config.getoption("--budget-report")
+    if path:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(rows, option=orjson.OPT_INDENT_2))
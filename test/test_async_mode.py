@@ -0,0 +1,75 @@
+import inspect
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from async_mode import asyncify_router
+from database import engine, get_async_engine
+from routers import audiobook_router
+from schema import Audiobook, Author, Narrator
+
+app = FastAPI()
+app.include_router(asyncify_router(audiobook_router.router), prefix="/audiobooks")
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+    await get_async_engine().dispose()
+
+
+def test_handlers_are_async():
+    for route in app.routes:
+        if route.path.startswith("/audiobooks"):
+            assert inspect.iscoroutinefunction(route.endpoint)
+
+
+@pytest.mark.asyncio
+async def test_create_and_read_audiobook(async_client, session):
+    author = Author(name="Author One")
+    narrator = Narrator(name="Narrator One")
+    session.add(author)
+    session.add(narrator)
+    session.commit()
+
+    response = await async_client.post(
+        "/audiobooks/",
+        json={
+            "title": "Audiobook One",
+            "author_id": author.author_id,
+            "narrator_id": narrator.narrator_id,
+            "duration": 3600,
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["author"]["name"] == "Author One"
+
+    response = await async_client.get(f"/audiobooks/{response.json()['audiobook_id']}")
+    assert response.status_code == 200
+    assert response.json()["narrator"]["name"] == "Narrator One"
+
+
+@pytest.mark.asyncio
+async def test_list_and_missing_audiobook(async_client, session):
+    session.add(Audiobook(title="Audiobook One", author=Author(name="A"), duration=1))
+    session.commit()
+
+    response = await async_client.get("/audiobooks/")
+    assert response.status_code == 200
+    assert [book["title"] for book in response.json()] == ["Audiobook One"]
+
+    response = await async_client.get("/audiobooks/999")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Audiobook not found"
@@ -0,0 +1,355 @@
+import random
+import tracemalloc
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+import autocomplete
+from autocomplete import (
+    MEMORY_BUDGET_PER_ENTRY,
+    PrefixIndex,
+    autocomplete_index,
+    build_autocomplete_index,
+)
+from database import engine
+from main import app
+from progress_ingest import progress_buffer
+from schema import Audiobook, Author, ListeningHistory, User
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    autocomplete_index.build([])
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def index():
+    index = PrefixIndex()
+    index.build(
+        [
+            ("audiobook", 1, "The Hobbit", 10),
+            ("audiobook", 2, "Hobbit Tales", 30),
+            ("audiobook", 3, "Émile Zola: Œuvres", 5),
+            ("author", 1, "J. R. R. Tolkien", 40),
+        ]
+    )
+    return index
+
+
+def texts(completions):
+    return [completion.text for completion in completions]
+
+
+def test_completes_any_word_start_by_popularity(index):
+    assert texts(index.complete("hob")) == ["Hobbit Tales", "The Hobbit"]
+    assert texts(index.complete("the hob")) == ["The Hobbit"]
+    assert texts(index.complete("tolk")) == ["J. R. R. Tolkien"]
+    assert texts(index.complete("obbit")) == []
+    assert texts(index.complete("  ")) == []
+
+
+def test_normalizes_case_and_accents(index):
+    assert texts(index.complete("EMILE")) == ["Émile Zola: Œuvres"]
+    assert texts(index.complete("zola œu")) == ["Émile Zola: Œuvres"]
+
+
+def test_limit_and_kind(index):
+    assert texts(index.complete("t", limit=1)) == ["J. R. R. Tolkien"]
+    assert texts(index.complete("t", kind="audiobook")) == [
+        "Hobbit Tales",
+        "The Hobbit",
+    ]
+
+
+def test_upsert_and_remove(index):
+    assert texts(index.complete("h")) == ["Hobbit Tales", "The Hobbit"]
+    index.upsert("audiobook", 1, "There and Back Again")
+    assert texts(index.complete("h")) == ["Hobbit Tales"]
+    assert index.complete("there")[0].popularity == 10
+    index.remove("audiobook", 2)
+    assert texts(index.complete("h")) == []
+    assert len(index) == 3
+
+
+def test_sparse_ids(index):
+    index.upsert("author", 100000000000, "Big")
+    index.upsert("author", 7, "Bigger")
+    assert [(c.id, c.text) for c in index.complete("big")] == [
+        (7, "Bigger"),
+        (100000000000, "Big"),
+    ]
+    index.remove("author", 100000000000)
+    index.add_popularity({("author", 100000000000): 5, ("author", 7): 5})
+    assert [(c.id, c.popularity) for c in index.complete("big")] == [(7, 5)]
+
+
+def test_failed_update_is_logged(index, monkeypatch, caplog):
+    def fail(*args):
+        raise MemoryError
+
+    monkeypatch.setattr(index, "_upsert", fail)
+    index.upsert("audiobook", 4, "Silmarillion")
+    assert "Failed to update the autocomplete index" in caplog.text
+
+
+def test_completions_run_during_upsert_many(index, monkeypatch):
+    record = autocomplete._record
+    seen = []
+
+    def record_while_completing(text):
+        # upsert_many is preparing its arrays; a completion must get through
+        assert index._lock.acquire(timeout=5)
+        index._lock.release()
+        seen.append(texts(index.complete("hob")))
+        return record(text)
+
+    monkeypatch.setattr(autocomplete, "_record", record_while_completing)
+    index.upsert_many("audiobook", [(4, "Hobbit Lore"), (2, "Tales")])
+    assert seen == [["Hobbit Tales", "The Hobbit"]] * 2
+    monkeypatch.undo()
+    assert texts(index.complete("hob")) == ["The Hobbit", "Hobbit Lore"]
+    assert texts(index.complete("tales")) == ["Tales"]
+
+
+def test_completions_run_during_upsert(index, monkeypatch):
+    spliced = index._spliced
+    seen = []
+
+    def splice_while_completing(*args):
+        # the arrays are rebuilt aside; a completion must get through
+        assert index._lock.acquire(timeout=5)
+        index._lock.release()
+        seen.append(texts(index.complete("hob")))
+        return spliced(*args)
+
+    monkeypatch.setattr(index, "_spliced", splice_while_completing)
+    index.upsert("audiobook", 4, "Hobbit Lore")
+    index.upsert("audiobook", 2, "Tales")
+    index.remove("audiobook", 1)
+    assert seen == [
+        ["Hobbit Tales", "The Hobbit"],
+        ["Hobbit Tales", "The Hobbit", "Hobbit Lore"],
+        ["The Hobbit", "Hobbit Lore"],
+    ]
+    assert texts(index.complete("hob")) == ["Hobbit Lore"]
+
+
+def test_popularity_updates(index):
+    index.add_popularity({("audiobook", 1): 25, ("author", 7): 3})
+    assert texts(index.complete("hob")) == ["The Hobbit", "Hobbit Tales"]
+    assert index.complete("the")[0].popularity == 35
+    index.add_popularity({("audiobook", 1): -30})
+    assert texts(index.complete("hob")) == ["Hobbit Tales", "The Hobbit"]
+
+
+def test_tables_match_ranking_every_key(monkeypatch):
+    # Small tables and ranges, so that writes build, merge and recompute them.
+    monkeypatch.setattr(autocomplete, "TOP_K", 3)
+    monkeypatch.setattr(autocomplete, "_TABLE_RANGE", 4)
+    monkeypatch.setattr(autocomplete, "_MIN_GARBAGE", 200)
+    rng = random.Random(0)
+    names = "ab abc abd ba bab b ac ca cab cb".split()
+    entries = {}
+
+    def name():
+        return " ".join(rng.choices(names, k=rng.randint(1, 3))).title()
+
+    def check():
+        expected = {}
+        for (kind, entity_id), (text, popularity) in entries.items():
+            words = autocomplete.normalize(text).split(" ")
+            for start in range(len(words)):
+                key = " ".join(words[start:])
+                for length in range(1, len(key) + 1):
+                    if key[length - 1] == " ":
+                        continue  # normalized away
+                    expected.setdefault(key[:length], set()).add((kind, entity_id))
+        for prefix, matches in expected.items():
+            for kind in (None,) + autocomplete.KINDS:
+                ranked = sorted(
+                    (
+                        (-entries[match][1], match[1] * 3 + KINDS.index(match[0]))
+                        for match in matches
+                        if kind in (None, match[0])
+                    )
+                )
+                completions = index.complete(prefix, limit=3, kind=kind)
+                assert [
+                    (-c.popularity, c.id * 3 + KINDS.index(c.kind)) for c in completions
+                ] == ranked[:3], (prefix, kind)
+        for prefix in expected:
+            low, high = index._range(prefix.encode())
+            if high - low > autocomplete._TABLE_RANGE:
+                assert prefix.encode() in index._tables
+
+    KINDS = autocomplete.KINDS
+    for entity_id in range(30):
+        entries[rng.choice(KINDS), entity_id] = (name(), rng.randint(0, 5))
+    index = PrefixIndex()
+    index.build((kind, i, text, pop) for (kind, i), (text, pop) in entries.items())
+    check()
+    for _ in range(200):
+        kind, entity_id = rng.choice(KINDS), rng.randint(0, 40)
+        action = rng.random()
+        if action < 0.4:
+            popularity = entries.get((kind, entity_id), ("", 0))[1]
+            entries[kind, entity_id] = (name(), popularity)
+            index.upsert(kind, entity_id, entries[kind, entity_id][0])
+        elif action < 0.6:
+            entries.pop((kind, entity_id), None)
+            index.remove(kind, entity_id)
+        elif action < 0.95:
+            if (kind, entity_id) in entries:
+                delta = rng.randint(-entries[kind, entity_id][1], 4)
+                text, popularity = entries[kind, entity_id]
+                entries[kind, entity_id] = (text, popularity + delta)
+                index.add_popularity({(kind, entity_id): delta})
+        else:
+            items = [(rng.randint(0, 40), name()) for _ in range(3)]
+            for item_id, text in items:
+                popularity = entries.get((kind, item_id), ("", 0))[1]
+                entries[kind, item_id] = (text, popularity)
+            index.upsert_many(kind, items)
+        check()
+    assert len(index) == len(entries)
+
+
+def test_writes_during_build_are_replayed():
+    index = PrefixIndex()
+    index.build([("author", 1, "J. R. R. Tolkien", 0)])
+
+    def entries():
+        yield "audiobook", 1, "The Hobbit", 10
+        yield "audiobook", 2, "Hobbit Tales", 30
+        # completions meanwhile come from the old contents
+        assert texts(index.complete("tolk")) == ["J. R. R. Tolkien"]
+        index.upsert("audiobook", 3, "The Hobbit Again")
+        index.remove("audiobook", 2)
+        index.add_popularity({("audiobook", 1): 5})
+
+    index.build(entries())
+    assert [(c.text, c.popularity) for c in index.complete("hob")] == [
+        ("The Hobbit", 15),
+        ("The Hobbit Again", 0),
+    ]
+    assert index.complete("tolk") == []
+
+
+def test_build_from_database(session):
+    tolkien = Author(name="J. R. R. Tolkien")
+    session.add(User(username="u", name="U", email="u@example.com", password="x"))
+    session.add(Audiobook(title="The Hobbit", author=tolkien, duration=1))
+    session.add(Audiobook(title="The Silmarillion", author=tolkien, duration=1))
+    session.commit()
+    for _ in range(3):
+        session.add(ListeningHistory(user_id=1, audiobook_id=1))
+    session.add(ListeningHistory(user_id=1, audiobook_id=2))
+    session.commit()
+
+    build_autocomplete_index(session)
+    completions = autocomplete_index.complete("t")
+    assert [(c.kind, c.text, c.popularity) for c in completions] == [
+        ("author", "J. R. R. Tolkien", 4),
+        ("audiobook", "The Hobbit", 3),
+        ("audiobook", "The Silmarillion", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_index_follows_router_writes(async_client, session):
+    response = await async_client.post("/authors/", json={"name": "Ursula Le Guin"})
+    author_id = response.json()["author_id"]
+    response = await async_client.get("/autocomplete/", params={"q": "le g"})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"kind": "author", "id": author_id, "text": "Ursula Le Guin", "popularity": 0}
+    ]
+
+    await async_client.put(f"/authors/{author_id}", json={"name": "Ursula K. Le Guin"})
+    response = await async_client.get(
+        "/autocomplete/", params={"q": "ursula k", "kind": "author"}
+    )
+    assert [c["text"] for c in response.json()] == ["Ursula K. Le Guin"]
+
+    await async_client.delete(f"/authors/{author_id}")
+    response = await async_client.get("/autocomplete/", params={"q": "ursula"})
+    assert response.json() == []
+
+
+def test_memory_per_entry_within_budget():
+    rng = random.Random(0)
+    syllables = "ka lo mi ra ten vor sil an del mar is quen tha bel or".split()
+    entries = [
+        (
+            "audiobook",
+            entity_id,
+            " ".join(
+                "".join(rng.choices(syllables, k=rng.randint(2, 4)))
+                for _ in range(rng.randint(2, 5))
+            ).title(),
+            rng.randint(0, 1000),
+        )
+        for entity_id in range(20000)
+    ]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    index = PrefixIndex()
+    index.build(entries)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(index) == len(entries)
+    assert used / len(entries) < MEMORY_BUDGET_PER_ENTRY
+
+
+@pytest.mark.asyncio
+async def test_listens_raise_popularity(async_client, session):
+    tolkien = Author(name="J. R. R. Tolkien")
+    session.add(User(username="u", name="U", email="u@example.com", password="x"))
+    session.add(Audiobook(title="The Hobbit", author=tolkien, duration=1))
+    session.add(Audiobook(title="The Silmarillion", author=tolkien, duration=1))
+    session.commit()
+    build_autocomplete_index(session)
+
+    def popularity():
+        return {
+            (c.kind, c.text): c.popularity for c in autocomplete_index.complete("t")
+        }
+
+    response = await async_client.post(
+        "/listening_histories/",
+        json={"user_id": 1, "audiobook_id": 2, "started_at": "2023-01-01T00:00:00"},
+    )
+    history_id = response.json()["history_id"]
+    event = {
+        "user_id": 1,
+        "audiobook_id": 1,
+        "started_at": "2023-01-01T00:00:00",
+        "reported_at": "2023-01-01T00:05:00",
+    }
+    await async_client.post("/listening_histories/progress", json=[event])
+    progress_buffer.flush()
+    # Later heartbeats of the same session are no new listen.
+    event["reported_at"] = "2023-01-01T00:10:00"
+    await async_client.post("/listening_histories/progress", json=[event])
+    progress_buffer.flush()
+    assert popularity() == {
+        ("author", "J. R. R. Tolkien"): 2,
+        ("audiobook", "The Hobbit"): 1,
+        ("audiobook", "The Silmarillion"): 1,
+    }
+
+    await async_client.delete(f"/listening_histories/{history_id}")
+    assert popularity()[("audiobook", "The Silmarillion")] == 0
+    assert popularity()[("author", "J. R. R. Tolkien")] == 1
@@ -0,0 +1,132 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from response_cache import SharedCache
+from schema import Audiobook, Author, Narrator, User
+from settings import get_settings
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def audiobooks(session):
+    author = Author(name="Frank Herbert")
+    narrator = Narrator(name="Scott Brick")
+    audiobooks = [
+        Audiobook(title=f"Dune {i}", author=author, narrator=narrator, duration=i)
+        for i in range(1, 4)
+    ]
+    session.add_all(audiobooks)
+    session.commit()
+    return [audiobook.audiobook_id for audiobook in audiobooks]
+
+
+@pytest.mark.asyncio
+async def test_batch_keeps_request_order_and_reports_misses(
+    async_client, audiobooks, statements
+):
+    statements.clear()
+    response = await async_client.get("/audiobooks/batch?ids=3,99,1,3")
+    assert response.status_code == 200
+    body = response.json()
+    assert [item and item["audiobook_id"] for item in body["items"]] == [
+        3,
+        None,
+        1,
+        3,
+    ]
+    assert body["items"][0]["author"]["name"] == "Frank Herbert"
+    assert body["items"][0]["narrator"]["name"] == "Scott Brick"
+    assert body["missing"] == [99]
+    # one query with relationships joined in
+    assert len([s for s in statements if s.startswith("SELECT")]) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_matches_single_reads(async_client, audiobooks):
+    batch = await async_client.post("/audiobooks/batch", json={"ids": audiobooks})
+    singles = [
+        (await async_client.get(f"/audiobooks/{audiobook_id}")).json()
+        for audiobook_id in audiobooks
+    ]
+    assert batch.json() == {"items": singles, "missing": []}
+
+
+@pytest.mark.asyncio
+async def test_batch_uses_response_cache(async_client, audiobooks, statements):
+    await async_client.get("/audiobooks/1")
+    statements.clear()
+    response = await async_client.get("/audiobooks/batch?ids=1,2")
+    assert [item["audiobook_id"] for item in response.json()["items"]] == [1, 2]
+    # audiobook 1 came from the cache, 2 from the database, and is now cached
+    assert any("IN (?)" in statement for statement in statements)
+    statements.clear()
+    hit = await async_client.get("/audiobooks/2")
+    assert hit.headers["X-Cache"] == "HIT"
+    response = await async_client.get("/audiobooks/batch?ids=2,1")
+    assert [item["audiobook_id"] for item in response.json()["items"]] == [2, 1]
+    assert statements == []
+
+
+@pytest.mark.asyncio
+async def test_batch_uncached_entity(async_client, session):
+    session.add(User(username="u", name="U", email="u@example.com", password="x"))
+    session.commit()
+    response = await async_client.get("/users/batch?ids=2,1")
+    body = response.json()
+    assert body["items"][0] is None
+    assert body["items"][1]["username"] == "u"
+    assert body["missing"] == [2]
+
+
+@pytest.mark.asyncio
+async def test_batch_validation(async_client, session, monkeypatch):
+    response = await async_client.get("/authors/batch?ids=1,x")
+    assert response.status_code == 422
+    response = await async_client.get("/authors/batch?ids=")
+    assert response.json() == {"items": [], "missing": []}
+    monkeypatch.setattr(get_settings(), "batch_max_ids", 2)
+    response = await async_client.post("/authors/batch", json={"ids": [1, 2, 3]})
+    assert response.status_code == 413
+
+
+def test_shared_backend_get_many(tmp_path):
+    now = [0.0]
+    cache = SharedCache(
+        str(tmp_path / "cache.db"), max_entries=10, ttl=5, clock=lambda: now[0]
+    )
+    cache.set_many({"a": b"1", "b": b"2"})
+    now[0] = 3
+    cache.set("c", b"3")
+    now[0] = 6
+    assert cache.get_many(["c", "a", "x"]) == [b"3", None, None]
+    assert (cache.hits, cache.misses, cache.expirations) == (1, 2, 1)
@@ -0,0 +1,120 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session, select
+
+from database import engine
+from main import app
+from schema import Audiobook, Author, Chapter, Narrator, Rating, User
+
+BOOKS = 20
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def catalog(session):
+    """Books with distinct authors and narrators, so a lazy load per row shows."""
+    user = User(username="u", name="U", email="u@example.com", password="x")
+    for i in range(BOOKS):
+        session.add(
+            Audiobook(
+                title=f"Dune {i}",
+                author=Author(name=f"Author {i}"),
+                narrator=Narrator(name=f"Narrator {i}"),
+                duration=600,
+                chapters=[
+                    Chapter(title=f"Chapter {n}", duration=60, position=n)
+                    for n in range(1, 11)
+                ],
+            )
+        )
+    session.add(user)
+    session.commit()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_list_audiobooks(async_client, catalog, budget):
+    async with budget("list_audiobooks", max_queries=1, max_memory_kb=800):
+        response = await async_client.get(f"/audiobooks/?limit={BOOKS}")
+    assert len(response.json()) == BOOKS
+
+
+@pytest.mark.asyncio
+async def test_get_audiobook(async_client, catalog, budget):
+    async with budget("get_audiobook", max_queries=1, max_memory_kb=400):
+        response = await async_client.get("/audiobooks/1")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_batch_audiobooks(async_client, catalog, budget):
+    ids = ",".join(str(i) for i in range(1, BOOKS + 1))
+    async with budget("batch_audiobooks", max_queries=1, max_memory_kb=600):
+        response = await async_client.get(f"/audiobooks/batch?ids={ids}")
+    assert response.json()["missing"] == []
+
+
+@pytest.mark.asyncio
+async def test_timeline(async_client, catalog, budget):
+    async with budget("audiobook_timeline", max_queries=1, max_memory_kb=400):
+        response = await async_client.get("/audiobooks/1/timeline")
+    assert len(response.json()["chapters"]) == 10
+
+
+@pytest.mark.asyncio
+async def test_search(async_client, catalog, budget):
+    async with budget("search", max_queries=1, max_memory_kb=200):
+        response = await async_client.get("/search/?q=dune")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_list_authors(async_client, catalog, budget):
+    async with budget("list_authors", max_queries=1, max_memory_kb=200):
+        response = await async_client.get(f"/authors/?limit={BOOKS}")
+    assert len(response.json()) == BOOKS
+
+
+@pytest.mark.asyncio
+async def test_create_rating(async_client, catalog, budget):
+    rating = {"user_id": catalog.user_id, "audiobook_id": 1, "rating": 5}
+    async with budget("create_rating", max_queries=4, max_memory_kb=400):
+        response = await async_client.post("/ratings/", json=rating)
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_list_ratings(async_client, catalog, session, budget):
+    for audiobook_id in range(1, BOOKS + 1):
+        session.add(
+            Rating(user_id=catalog.user_id, audiobook_id=audiobook_id, rating=4)
+        )
+    session.commit()
+    async with budget("list_ratings", max_queries=2, max_memory_kb=300):
+        response = await async_client.get(
+            f"/ratings/?user_id={catalog.user_id}&limit={BOOKS}"
+        )
+    assert len(response.json()) == BOOKS
+
+
+def test_over_budget_fails(session, budget):
+    with pytest.raises(pytest.fail.Exception, match="queries 2 > 1"):
+        with budget("two queries", report=False, max_queries=1) as measured:
+            session.exec(select(User)).all()
+            session.exec(select(Author)).all()
+    assert measured.statements[0].startswith("SELECT user.")
+    assert measured.usage()["queries"] == 2
@@ -0,0 +1,250 @@
+import orjson
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, func, select
+
+from autocomplete import autocomplete_index
+from database import engine
+from main import app
+from schema import Audiobook, Author, Category, Chapter
+from settings import get_settings
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def audiobook(session):
+    audiobook = Audiobook(title="Dune", author=Author(name="Frank Herbert"), duration=1)
+    session.add(audiobook)
+    session.commit()
+    session.refresh(audiobook)
+    return audiobook
+
+
+def count(session, model):
+    return session.exec(select(func.count()).select_from(model)).one()
+
+
+def chapters(audiobook_id, n):
+    return [
+        {
+            "audiobook_id": audiobook_id,
+            "title": f"Chapter {i}",
+            "duration": 60,
+            "position": i,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_in_one_transaction(
+    async_client, session, audiobook, statements
+):
+    statements.clear()
+    response = await async_client.post(
+        "/chapters/bulk", json=chapters(audiobook.audiobook_id, 2500)
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["updated"], body["skipped"]) == (2500, 0, 0)
+    assert [result["index"] for result in body["results"]] == list(range(2500))
+    assert {result["status"] for result in body["results"]} == {"created"}
+    # ids come back in request order
+    ids = [result["id"] for result in body["results"]]
+    positions = dict(session.exec(select(Chapter.chapter_id, Chapter.position)).all())
+    assert [positions[chapter_id] for chapter_id in ids] == list(range(1, 2501))
+    # multi-row INSERTs, not one statement per chapter
+    inserts = [s for s in statements if s.startswith("INSERT")]
+    assert 1 <= len(inserts) <= 3
+    assert len([s for s in statements if s == "COMMIT"]) <= 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_from_ndjson_stream(async_client, session, audiobook):
+    async def body():
+        for chapter in chapters(audiobook.audiobook_id, 3):
+            line = orjson.dumps(chapter) + b"\n"
+            # split lines across chunks
+            yield line[:10]
+            yield line[10:]
+
+    response = await async_client.post(
+        "/chapters/bulk",
+        content=body(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.json()["created"] == 3
+    assert count(session, Chapter) == 3
+
+
+@pytest.mark.asyncio
+async def test_bulk_fail_on_conflict_writes_nothing(async_client, session):
+    session.add(Author(author_id=5, name="Existing"))
+    session.commit()
+    response = await async_client.post(
+        "/authors/bulk", json=[{"name": "New"}, {"author_id": 5, "name": "Clash"}]
+    )
+    assert response.status_code == 409
+    assert response.json()["results"] == [
+        {"index": 1, "status": "conflict", "id": 5, "errors": None}
+    ]
+    assert count(session, Author) == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_rejects_ids_out_of_range(async_client, session):
+    session.add_all(
+        [Author(author_id=1, name="First"), Author(author_id=5, name="Fifth")]
+    )
+    session.commit()
+    response = await async_client.post(
+        "/authors/bulk",
+        json=[
+            {"author_id": 3, "name": "Gap"},
+            {"author_id": 100000000000, "name": "Big"},
+            {"author_id": 0, "name": "Zero"},
+        ],
+    )
+    assert response.status_code == 422
+    results = response.json()["results"]
+    assert [(r["index"], r["status"]) for r in results] == [
+        (1, "invalid"),
+        (2, "invalid"),
+    ]
+    assert results[0]["errors"][0]["type"] == "out_of_range"
+    assert count(session, Author) == 2
+
+    response = await async_client.post(
+        "/authors/bulk", json=[{"author_id": 3, "name": "Gap"}]
+    )
+    assert response.json()["results"][0] == {
+        "index": 0,
+        "status": "created",
+        "id": 3,
+        "errors": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_bulk_skip_on_conflict(async_client, session):
+    session.add(Author(author_id=5, name="Existing"))
+    session.commit()
+    response = await async_client.post(
+        "/authors/bulk?on_conflict=skip",
+        json=[{"author_id": 5, "name": "Clash"}, {"name": "New"}],
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["skipped"]) == (1, 1)
+    assert [result["status"] for result in body["results"]] == ["skipped", "created"]
+    session.expire_all()
+    assert session.get(Author, 5).name == "Existing"
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_on_conflict_refreshes_caches(async_client, audiobook):
+    author_id = audiobook.author_id
+    cached = await async_client.get(f"/audiobooks/{audiobook.audiobook_id}")
+    assert cached.json()["author"]["name"] == "Frank Herbert"
+    response = await async_client.post(
+        "/authors/bulk?on_conflict=update",
+        json=[{"author_id": author_id, "name": "F. Herbert", "bio": "Wrote Dune"}],
+    )
+    assert response.status_code == 200
+    assert response.json()["results"][0]["status"] == "updated"
+    author = (await async_client.get(f"/authors/{author_id}")).json()
+    assert (author["name"], author["bio"]) == ("F. Herbert", "Wrote Dune")
+    refreshed = await async_client.get(f"/audiobooks/{audiobook.audiobook_id}")
+    assert refreshed.json()["author"]["name"] == "F. Herbert"
+    completions = autocomplete_index.complete("f. her", kind="author")
+    assert [(c.id, c.text) for c in completions] == [(author_id, "F. Herbert")]
+
+
+@pytest.mark.asyncio
+async def test_bulk_conflict_on_unique_column(async_client, session):
+    session.add(Category(name="Fantasy"))
+    session.commit()
+    response = await async_client.post(
+        "/categories/bulk?on_conflict=skip",
+        json=[{"name": "Fantasy"}, {"name": "Horror"}],
+    )
+    assert [result["status"] for result in response.json()["results"]] == [
+        "skipped",
+        "created",
+    ]
+    assert count(session, Category) == 2
+
+
+@pytest.mark.asyncio
+async def test_bulk_rejects_invalid_batch(async_client, session):
+    response = await async_client.post(
+        "/authors/bulk",
+        json=[{"name": "Fine"}, {"bio": "no name"}, {"author_id": "x", "name": "N"}],
+    )
+    assert response.status_code == 422
+    results = response.json()["results"]
+    assert [(r["index"], r["status"]) for r in results] == [
+        (1, "invalid"),
+        (2, "invalid"),
+    ]
+    assert results[0]["errors"][0]["loc"] == ["name"]
+    assert results[1]["errors"][0]["loc"] == ["author_id"]
+
+    response = await async_client.post(
+        "/authors/bulk",
+        json=[{"author_id": 1, "name": "A"}, {"author_id": 1, "name": "B"}],
+    )
+    assert response.status_code == 422
+    assert response.json()["results"][0]["index"] == 1
+    assert response.json()["results"][0]["errors"][0]["type"] == "duplicate"
+
+    response = await async_client.post(
+        "/authors/bulk",
+        content=b'{"name": "A"}\n{"name": \n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    assert response.json()["results"][0]["errors"][0]["type"] == "json_invalid"
+    assert count(session, Author) == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_limits_batch_size(async_client, session, monkeypatch):
+    monkeypatch.setattr(get_settings(), "bulk_max_items", 2)
+    response = await async_client.post("/categories/bulk", json=[{"name": "a"}] * 3)
+    assert response.status_code == 413
+    response = await async_client.post(
+        "/categories/bulk",
+        content=b'{"name": "a"}\n{"name": "b"}\n{"name": "c"}\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 413
+    assert count(session, Category) == 0
@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from entitlements import Entitlements, entitlement_index
+from main import app
+from schema import Audiobook, Author, Purchase, Subscription, User, UserSubscriptionLink
+from settings import get_settings
+
+JAN = datetime(2024, 1, 1)
+FEB = datetime(2024, 2, 1)
+MAR = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def library(session):
+    """A user who bought book 1; books 2 and 3 exist; a monthly plan."""
+    user = User(username="u", name="U", email="u@example.com", password="x")
+    author = Author(name="A")
+    books = [Audiobook(title=f"Book {i}", author=author, duration=1) for i in range(3)]
+    plan = Subscription(name="Monthly", price=9.99, duration_days=30)
+    session.add_all([user, plan, *books])
+    session.commit()
+    session.add(Purchase(user_id=user.user_id, audiobook_id=1, purchase_date=JAN))
+    session.commit()
+    return user
+
+
+def test_periods_are_merged_and_half_open():
+    entitlements = Entitlements(
+        1,
+        purchased=[7],
+        periods=[(FEB, MAR), (JAN, FEB), (MAR + timedelta(days=5), MAR), (JAN, JAN)],
+    )
+    assert entitlements.starts == [JAN] and entitlements.ends == [MAR]
+    assert entitlements.subscribed_until(JAN) == MAR
+    assert entitlements.subscribed_until(MAR - timedelta(microseconds=1)) == MAR
+    assert entitlements.subscribed_until(MAR) is None
+    assert entitlements.subscribed_until(JAN - timedelta(days=1)) is None
+
+    assert entitlements.check(7, MAR).reason == "purchase"
+    assert entitlements.check(8, FEB).expires_at == MAR
+    assert not entitlements.check(8, MAR).entitled
+
+
+@pytest.mark.asyncio
+async def test_purchase_and_subscription(async_client, library, session):
+    response = await async_client.get(f"/users/{library.user_id}/entitlements/1")
+    assert response.json() == {
+        "user_id": library.user_id,
+        "audiobook_id": 1,
+        "entitled": True,
+        "reason": "purchase",
+        "expires_at": None,
+    }
+    response = await async_client.get(f"/users/{library.user_id}/entitlements/2")
+    assert response.json()["entitled"] is False
+
+    session.add(
+        UserSubscriptionLink(
+            user_id=library.user_id, subscription_id=1, start_date=JAN, end_date=FEB
+        )
+    )
+    session.commit()
+    entitlement_index.invalidate(library.user_id)
+    path = f"/users/{library.user_id}/entitlements/2"
+    inside = (
+        await async_client.get(path, params={"at": "2024-01-15T00:00:00Z"})
+    ).json()
+    assert inside["reason"] == "subscription"
+    assert inside["expires_at"] == "2024-02-01T00:00:00"
+    after = (await async_client.get(path, params={"at": "2024-02-01T00:00:00"})).json()
+    assert after["entitled"] is False
+
+
+@pytest.mark.asyncio
+async def test_unknown_user(async_client, library):
+    response = await async_client.get("/users/999/entitlements/1")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_cached_checks_skip_the_database(async_client, library, budget):
+    path = f"/users/{library.user_id}/entitlements/1"
+    async with budget("entitlement_first_check", max_queries=3):
+        await async_client.get(path)
+    async with budget("entitlement_check", max_queries=0):
+        response = await async_client.get(path)
+    assert response.json()["entitled"] is True
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate(async_client, library):
+    user_id = library.user_id
+    path = f"/users/{user_id}/entitlements/2"
+    assert (await async_client.get(path)).json()["entitled"] is False
+
+    purchase = {"user_id": user_id, "audiobook_id": 2, "purchase_date": "2024-01-01"}
+    response = await async_client.post("/purchases/", json=purchase)
+    assert response.status_code == 200
+    assert (await async_client.get(path)).json()["reason"] == "purchase"
+    await async_client.delete(f"/purchases/{response.json()['purchase_id']}")
+    assert (await async_client.get(path)).json()["entitled"] is False
+
+    now = datetime.utcnow()
+    link = {
+        "user_id": user_id,
+        "subscription_id": 1,
+        "start_date": (now - timedelta(days=1)).isoformat(),
+        "end_date": (now + timedelta(days=29)).isoformat(),
+    }
+    response = await async_client.post("/user_subscriptions/", json=link)
+    assert response.status_code == 200
+    assert (await async_client.get(path)).json()["reason"] == "subscription"
+
+    ended = {"start_date": link["start_date"], "end_date": now.isoformat()}
+    response = await async_client.put(f"/user_subscriptions/{user_id}/1", json=ended)
+    assert response.status_code == 200
+    assert (await async_client.get(path)).json()["entitled"] is False
+    response = await async_client.delete(f"/user_subscriptions/{user_id}/1")
+    assert response.json() == {"ok": True}
+    response = await async_client.get(f"/user_subscriptions/{user_id}")
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_batch(async_client, library, monkeypatch):
+    user_id = library.user_id
+    response = await async_client.get(f"/users/{user_id}/entitlements/batch?ids=3,1,2")
+    body = response.json()
+    assert body["user_id"] == user_id
+    assert [item["audiobook_id"] for item in body["items"]] == [3, 1, 2]
+    assert [item["entitled"] for item in body["items"]] == [False, True, False]
+
+    response = await async_client.post(
+        f"/users/{user_id}/entitlements/batch", json={"ids": [1, 1]}
+    )
+    assert [item["reason"] for item in response.json()["items"]] == [
+        "purchase",
+        "purchase",
+    ]
+
+    monkeypatch.setattr(get_settings(), "batch_max_ids", 2)
+    response = await async_client.get(f"/users/{user_id}/entitlements/batch?ids=1,2,3")
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_user_subscription_validation(async_client, library):
+    link = {
+        "user_id": library.user_id,
+        "subscription_id": 1,
+        "start_date": "2024-01-01T00:00:00",
+        "end_date": "2024-02-01T00:00:00",
+    }
+    assert (
+        await async_client.post("/user_subscriptions/", json=link)
+    ).status_code == 200
+    assert (
+        await async_client.post("/user_subscriptions/", json=link)
+    ).status_code == 409
+    unknown = {**link, "user_id": 999}
+    assert (
+        await async_client.post("/user_subscriptions/", json=unknown)
+    ).status_code == 404
+    backwards = {**link, "subscription_id": 1, "end_date": "2023-12-01T00:00:00"}
+    assert (
+        await async_client.post("/user_subscriptions/", json=backwards)
+    ).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_subscription_dates_are_stored_as_utc(async_client, library):
+    link = {
+        "user_id": library.user_id,
+        "subscription_id": 1,
+        "start_date": "2024-01-01T05:00:00+05:00",
+        "end_date": "2024-02-01T00:00:00",
+    }
+    response = await async_client.post("/user_subscriptions/", json=link)
+    assert response.status_code == 200
+    assert response.json()["start_date"] == "2024-01-01T00:00:00"
+
+    path = f"/users/{library.user_id}/entitlements/2"
+    before = await async_client.get(path, params={"at": "2023-12-31T23:30:00Z"})
+    assert before.json()["entitled"] is False
+    after = await async_client.get(path, params={"at": "2024-01-01T00:30:00Z"})
+    assert after.json()["reason"] == "subscription"
+
+    period = {
+        "start_date": "2024-01-01T00:00:00",
+        "end_date": "2024-01-01T04:00:00-02:00",
+    }
+    response = await async_client.put(
+        f"/user_subscriptions/{library.user_id}/1", json=period
+    )
+    assert response.json()["end_date"] == "2024-01-01T06:00:00"
+    # 09:00 UTC is after the naive 08:00
+    backwards = {
+        "start_date": "2024-01-01T14:00:00+05:00",
+        "end_date": "2024-01-01T08:00:00",
+    }
+    response = await async_client.put(
+        f"/user_subscriptions/{library.user_id}/1", json=backwards
+    )
+    assert response.status_code == 422
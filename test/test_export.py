@@ -0,0 +1,147 @@
+import csv
+import io
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from export import stream_export
+from main import app
+from schema import Audiobook, Author, Rating, User
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def ratings(session):
+    session.add(User(username="u", name="U", email="u@example.com", password="x"))
+    session.add(Audiobook(title="Dune", author=Author(name="A"), duration=1))
+    session.commit()
+    ratings = [Rating(user_id=1, audiobook_id=1, rating=stars) for stars in (3, 4, 5)]
+    session.add_all(ratings)
+    session.commit()
+    return ratings
+
+
+@pytest.mark.asyncio
+async def test_ndjson(async_client, ratings):
+    response = await async_client.get("/export/ratings")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [orjson.loads(line) for line in response.text.splitlines()]
+    assert [row["rating"] for row in rows] == [3, 4, 5]
+    assert set(rows[0]) == {
+        "rating_id",
+        "user_id",
+        "audiobook_id",
+        "rating",
+        "created_at",
+        "updated_at",
+    }
+    datetime.fromisoformat(rows[0]["updated_at"])
+
+
+@pytest.mark.asyncio
+async def test_csv(async_client, ratings):
+    response = await async_client.get("/export/ratings", params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["rating"] for row in rows] == ["3", "4", "5"]
+    datetime.fromisoformat(rows[0]["created_at"])
+
+
+@pytest.mark.asyncio
+async def test_empty_table(async_client, session):
+    response = await async_client.get("/export/reviews")
+    assert response.text == ""
+    response = await async_client.get("/export/reviews", params={"format": "csv"})
+    assert (
+        response.text.strip()
+        == "review_id,user_id,audiobook_id,review_text,created_at,updated_at"
+    )
+
+
+@pytest.mark.asyncio
+async def test_unknown_table(async_client, session):
+    response = await async_client.get("/export/users")
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_updated_since(async_client, session, ratings):
+    since = datetime.utcnow()
+    await async_client.put(
+        f"/ratings/{ratings[0].rating_id}",
+        json={"user_id": 1, "audiobook_id": 1, "rating": 1},
+    )
+    response = await async_client.get(
+        "/export/ratings", params={"updated_since": since.isoformat()}
+    )
+    rows = [orjson.loads(line) for line in response.text.splitlines()]
+    assert [(row["rating_id"], row["rating"]) for row in rows] == [
+        (ratings[0].rating_id, 1)
+    ]
+
+    # the same moment two hours east of UTC
+    aware = (since + timedelta(hours=2)).replace(tzinfo=timezone(timedelta(hours=2)))
+    response = await async_client.get(
+        "/export/ratings", params={"updated_since": aware.isoformat()}
+    )
+    assert len(response.text.splitlines()) == 1
+
+
+def test_chunks(ratings):
+    chunks = list(stream_export(engine, Rating, chunk_size=2))
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 1]
+
+
+def test_memory_does_not_grow_with_table_size(session, ratings):
+    created = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Rating),
+            [
+                dict(
+                    user_id=1,
+                    audiobook_id=1,
+                    rating=i % 5 + 1,
+                    created_at=created + timedelta(seconds=i),
+                    updated_at=created + timedelta(seconds=i),
+                )
+                for i in range(50000)
+            ],
+        )
+
+    def peak(rows):
+        tracemalloc.start()
+        size = 0
+        for chunk in stream_export(engine, Rating, chunk_size=500):
+            size += len(chunk)
+            if size > rows * 100:
+                break
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size, peak
+
+    small_size, small_peak = peak(1000)
+    large_size, large_peak = peak(50000)
+    assert large_size > 20 * small_size
+    assert large_peak < 2 * small_peak
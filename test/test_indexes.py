@@ -0,0 +1,127 @@
+from datetime import datetime
+from itertools import combinations
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from schema import (
+    Audiobook,
+    Author,
+    Bookmark,
+    Chapter,
+    ListeningHistory,
+    Narrator,
+    Purchase,
+    Rating,
+    Review,
+    User,
+)
+
+# Every filter each list endpoint supports; the test tries all combinations.
+LIST_FILTERS = {
+    "/audiobooks/": ["author_id", "narrator_id"],
+    "/chapters/": ["audiobook_id"],
+    "/bookmarks/": ["user_id", "audiobook_id"],
+    "/listening_histories/": ["user_id", "audiobook_id", "since", "until"],
+    "/reviews/": ["user_id", "audiobook_id", "since", "until"],
+    "/ratings/": ["user_id", "audiobook_id", "since", "until"],
+    "/purchases/": ["user_id", "audiobook_id", "since", "until"],
+}
+VALUES = {"since": "2000-01-01T00:00:00", "until": "2100-01-01T00:00:00"}
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def queries():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if statement.startswith("SELECT"):
+            executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def rows(session):
+    # One row everywhere, so the eager loads of each list query run too.
+    user = User(username="u", name="U", email="u@example.com", password="x")
+    audiobook = Audiobook(
+        title="Dune", author=Author(name="A"), narrator=Narrator(name="N"), duration=1
+    )
+    chapter = Chapter(audiobook=audiobook, title="One", duration=1, position=1)
+    session.add_all(
+        [
+            chapter,
+            Bookmark(user=user, audiobook=audiobook, chapter=chapter, position=1),
+            ListeningHistory(user=user, audiobook=audiobook),
+            Review(user=user, audiobook=audiobook, review_text="Good"),
+            Rating(user=user, audiobook=audiobook, rating=5),
+            Purchase(user=user, audiobook=audiobook),
+        ]
+    )
+    session.commit()
+
+
+def query_plan(statement, parameters):
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters
+        ).all()
+    return [row[-1] for row in rows]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", LIST_FILTERS)
+async def test_list_filters_use_indexes(async_client, rows, queries, path):
+    names = LIST_FILTERS[path]
+    for count in range(1, len(names) + 1):
+        for combination in combinations(names, count):
+            params = {name: VALUES.get(name, 1) for name in combination}
+            queries.clear()
+            response = await async_client.get(path, params=params)
+            assert response.status_code == 200
+            assert len(response.json()) == 1, params
+            for statement, parameters in queries:
+                plan = query_plan(statement, parameters)
+                scans = [step for step in plan if step.startswith("SCAN")]
+                assert not scans, (params, statement, plan)
+
+
+@pytest.mark.asyncio
+async def test_period_filters(async_client, session, rows):
+    session.add(Purchase(user_id=1, audiobook_id=1, purchase_date=datetime(2020, 1, 1)))
+    session.commit()
+    response = await async_client.get(
+        "/purchases/", params={"user_id": 1, "until": "2021-01-01T00:00:00"}
+    )
+    assert [row["purchase_date"] for row in response.json()] == ["2020-01-01T00:00:00"]
+    # 2019-12-31T23:30 UTC
+    response = await async_client.get(
+        "/purchases/", params={"user_id": 1, "until": "2020-01-01T01:30:00+02:00"}
+    )
+    assert response.json() == []
+    response = await async_client.get(
+        "/purchases/", params={"since": "2021-01-01T00:00:00"}
+    )
+    assert [row["purchase_id"] for row in response.json()] == [1]
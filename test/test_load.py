@@ -0,0 +1,46 @@
+from bench.load import regressions
+
+
+def result(throughput=1000.0, **endpoints):
+    return {
+        "overall": {"throughput": throughput},
+        "endpoints": {
+            endpoint: {"requests": 100, "errors": errors, "p95_ms": p95_ms}
+            for endpoint, (p95_ms, errors) in endpoints.items()
+        },
+    }
+
+
+def test_slower_p95_and_throughput_regress():
+    baseline = result(**{"GET /audiobooks/": (10.0, 0)})
+    assert regressions(result(**{"GET /audiobooks/": (11.0, 0)}), baseline, 0.2) == []
+    # relatively slower, but within the noise floor
+    fast = result(**{"GET /audiobooks/": (0.2, 0)})
+    assert regressions(result(**{"GET /audiobooks/": (1.0, 0)}), fast, 0.2) == []
+    found = regressions(result(700.0, **{"GET /audiobooks/": (20.0, 0)}), baseline, 0.2)
+    assert found == [
+        "throughput 700/s, was 1000/s",
+        "GET /audiobooks/ p95 20.00 ms, was 10.00 ms",
+    ]
+
+
+def test_more_errors_regress():
+    baseline = result(**{"GET /audiobooks/": (10.0, 0), "POST /ratings/": (10.0, 2)})
+    # fast errors are not an improvement
+    found = regressions(
+        result(**{"GET /audiobooks/": (1.0, 5), "POST /ratings/": (10.0, 2)}),
+        baseline,
+        0.2,
+    )
+    assert found == ["GET /audiobooks/ errors 5.00%, was 0.00%"]
+    assert (
+        regressions(
+            result(**{"GET /audiobooks/": (10.0, 0), "POST /ratings/": (10.0, 1)}),
+            baseline,
+            0.2,
+        )
+        == []
+    )
+    # an endpoint the baseline did not have may not fail either
+    new = result(**{"GET /audiobooks/": (10.0, 0), "GET /search/": (10.0, 1)})
+    assert regressions(new, baseline, 0.2) == ["GET /search/ errors 1.00%, was 0.00%"]
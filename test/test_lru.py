@@ -0,0 +1,32 @@
+from lru import LRU
+
+
+def test_evicts_least_recently_used():
+    lru = LRU(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert (lru.get("b"), lru.get("a"), lru.get("c")) == (None, 1, 3)
+    assert lru.evictions == 1
+
+
+def test_entries_expire():
+    now = [0.0]
+    lru = LRU(max_entries=2, ttl=10, clock=lambda: now[0])
+    lru.set("a", None)
+    now[0] = 9
+    assert lru.get("a", "missing") is None
+    now[0] = 10
+    assert lru.get("a", "missing") == "missing"
+    assert (len(lru), lru.expirations) == (0, 1)
+
+
+def test_load_overtaken_by_invalidation_is_not_stored():
+    lru = LRU(max_entries=2)
+    generation = lru.generation
+    lru.invalidate()
+    assert not lru.store("a", 1, generation)
+    assert lru.store("a", 1, lru.generation)
+    lru.invalidate("a")
+    assert lru.get("a") is None
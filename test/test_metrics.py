@@ -0,0 +1,92 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from metrics import Histogram, RequestMetrics, request_metrics
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+def samples(text):
+    return dict(
+        line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#")
+    )
+
+
+def test_histogram_buckets():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    # upper bounds are inclusive
+    assert histogram.counts == [2, 1, 1]
+    metrics = RequestMetrics((0.1, 1))
+    metrics.latency[("GET", "/x/{id}", 200)] = histogram
+    lines = samples("\n".join(metrics.render()))
+    labels = 'method="GET",route="/x/{id}",status="200"'
+    name = "audiobook_http_request_duration_seconds"
+    assert [
+        lines[f'{name}_bucket{{{labels},le="{le}"}}'] for le in (0.1, 1, "+Inf")
+    ] == [
+        "2",
+        "3",
+        "4",
+    ]
+    assert lines[f"{name}_count{{{labels}}}"] == "4"
+    assert float(lines[f"{name}_sum{{{labels}}}"]) == pytest.approx(3.65)
+
+
+def test_histogram_sum_keeps_full_precision():
+    metrics = RequestMetrics((0.1, 1))
+    metrics.observe("GET", "/x", 200, 1234567.891)
+    metrics.observe("GET", "/x", 200, 0.004)
+    lines = samples("\n".join(metrics.render()))
+    name = "audiobook_http_request_duration_seconds"
+    labels = 'method="GET",route="/x",status="200"'
+    assert float(lines[f"{name}_sum{{{labels}}}"]) == 1234567.891 + 0.004
+
+
+@pytest.mark.asyncio
+async def test_requests_are_recorded_by_route_template(async_client, session):
+    request_metrics.latency.clear()
+    await async_client.get("/authors/1")
+    await async_client.get("/authors/2")
+    await async_client.get("/authors/")
+    response = await async_client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = samples(response.text)
+    name = "audiobook_http_request_duration_seconds_count"
+    assert (
+        lines[f'{name}{{method="GET",route="/authors/{{author_id}}",status="404"}}']
+        == "2"
+    )
+    assert lines[f'{name}{{method="GET",route="/authors/",status="200"}}'] == "1"
+    # the scrape itself is still in flight
+    assert lines["audiobook_http_requests_in_flight"] == "1"
+    assert request_metrics.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_resource_metrics(async_client, session):
+    await async_client.get("/authors/1")
+    await async_client.get("/authors/1")
+    lines = samples((await async_client.get("/metrics")).text)
+    assert lines['audiobook_db_pool_size{engine="sync"}'] == "20"
+    assert int(lines['audiobook_threadpool_threads{state="limit"}']) == 40
+    assert 'audiobook_threadpool_threads{state="busy"}' in lines
+    assert int(lines['audiobook_cache_misses_total{cache="response"}']) >= 1
+    assert 0 <= float(lines['audiobook_cache_hit_ratio{cache="timeline"}']) <= 1
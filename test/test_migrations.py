@@ -0,0 +1,173 @@
+import threading
+
+import pytest
+from sqlalchemy import event, inspect
+from sqlmodel import SQLModel
+
+import search
+from database import create_db_engine
+from migrations import HEAD, current_version, ensure_schema, upgrade
+from settings import Settings
+
+# Added to the models after the first deployments, newest last.
+ADDED_COLUMNS = {
+    "review": ["updated_at"],
+    "rating": ["updated_at"],
+    "purchase": ["updated_at"],
+    "bookmark": ["is_resume", "updated_at"],
+}
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    db_engine = create_db_engine(
+        Settings(database_url=f"sqlite:///{tmp_path / 'app.db'}")
+    )
+    yield db_engine
+    db_engine.dispose()
+
+
+def make_legacy(db_engine):
+    """The tables as they were before ratings, search, resume and indexes."""
+    SQLModel.metadata.create_all(db_engine)
+    with db_engine.begin() as connection:
+        for table in SQLModel.metadata.tables.values():
+            for index in table.indexes:
+                connection.exec_driver_sql(f"DROP INDEX {index.name}")
+        for (trigger,) in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+        ):
+            connection.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        for table in [*search.TABLES, "ratingaggregate", "listeninghistory"]:
+            connection.exec_driver_sql(f"DROP TABLE {table}")
+        # SQLite cannot drop a constraint, so this one is recreated without
+        connection.exec_driver_sql(
+            "CREATE TABLE listeninghistory ("
+            " history_id INTEGER NOT NULL PRIMARY KEY,"
+            " user_id INTEGER REFERENCES user (user_id),"
+            " audiobook_id INTEGER REFERENCES audiobook (audiobook_id),"
+            " started_at DATETIME NOT NULL,"
+            " finished_at DATETIME)"
+        )
+        for table, columns in ADDED_COLUMNS.items():
+            for column in columns:
+                connection.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {column}")
+        connection.exec_driver_sql(
+            "INSERT INTO author (name, created_at) VALUES ('Frank Herbert', '2020-01-01')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO audiobook (title, author_id, duration, created_at)"
+            " VALUES ('Dune', 1, 10, '2020-01-01')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO rating (user_id, audiobook_id, rating, created_at)"
+            " VALUES (1, 1, 4, '2020-01-02 00:00:00.000000')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO bookmark (user_id, audiobook_id, position, created_at)"
+            " VALUES (1, 1, 30, '2020-01-03 00:00:00.000000')"
+        )
+
+
+def schema_of(db_engine):
+    inspector = inspect(db_engine)
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)},
+        )
+        for table in inspector.get_table_names()
+        if table != "schema_migrations"
+    }
+
+
+def test_new_database_is_created_and_stamped(db_engine):
+    assert ensure_schema(db_engine) is None
+    assert current_version(db_engine) == HEAD
+    statements = []
+    event.listen(
+        db_engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+    )
+    assert ensure_schema(db_engine) == HEAD
+    assert statements == ["SELECT max(version) FROM schema_migrations"]
+
+
+def test_legacy_database_upgrades_to_models(db_engine, tmp_path):
+    make_legacy(db_engine)
+    ensure_schema(db_engine)
+    assert current_version(db_engine) == HEAD
+
+    fresh = create_db_engine(Settings(database_url=f"sqlite:///{tmp_path / 'new.db'}"))
+    ensure_schema(fresh)
+    expected = schema_of(fresh)
+    # create_all declares the session key as a constraint, the migration as
+    # a named unique index
+    expected["listeninghistory"][1].add("uq_listeninghistory_session")
+    assert schema_of(db_engine) == expected
+    fresh.dispose()
+
+    with db_engine.connect() as connection:
+        assert connection.exec_driver_sql(
+            "SELECT rating_count, rating_sum FROM ratingaggregate"
+        ).all() == [(1, 4)]
+        assert connection.exec_driver_sql(
+            "SELECT rowid FROM catalog_search WHERE catalog_search MATCH 'herbert'"
+        ).all() == [(1,)]
+        assert connection.exec_driver_sql(
+            "SELECT is_resume, updated_at FROM bookmark"
+        ).all() == [(0, "2020-01-03 00:00:00.000000")]
+    # nothing left to do
+    assert upgrade(db_engine) == []
+
+
+def test_updated_at_is_backfilled_when_column_exists(db_engine):
+    make_legacy(db_engine)
+    with db_engine.begin() as connection:
+        # added by an earlier deployment, but never filled
+        connection.exec_driver_sql("ALTER TABLE rating ADD COLUMN updated_at DATETIME")
+    upgrade(db_engine)
+    with db_engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT updated_at FROM rating").all() == [
+            ("2020-01-02 00:00:00.000000",)
+        ]
+
+
+def test_migrations_resume_from_partial_upgrade(db_engine):
+    make_legacy(db_engine)
+    assert [m.version for m in upgrade(db_engine, 2)] == [1, 2]
+    assert current_version(db_engine) == 2
+    assert [m.version for m in upgrade(db_engine)] == list(range(3, HEAD + 1))
+
+
+def test_behind_schema_refused_without_migrate(db_engine):
+    make_legacy(db_engine)
+    with pytest.raises(RuntimeError, match="migrations.py upgrade"):
+        ensure_schema(db_engine, migrate=False)
+    assert current_version(db_engine) is None
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+def test_workers_starting_together(db_engine, legacy):
+    if legacy:
+        make_legacy(db_engine)
+    settings = Settings(database_url=str(db_engine.url))
+    engines = [create_db_engine(settings) for _ in range(4)]
+    barrier = threading.Barrier(len(engines))
+    errors = []
+
+    def start(db_engine):
+        barrier.wait()
+        try:
+            ensure_schema(db_engine)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=start, args=(e,)) for e in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert current_version(db_engine) == HEAD
+    for db_engine in engines:
+        db_engine.dispose()
@@ -0,0 +1,82 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from schema import Author
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+def add_authors(session, count):
+    for i in range(count):
+        session.add(Author(name=f"Author {i}"))
+    session.commit()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+
+
+@pytest.mark.asyncio
+async def test_cursor_walks_every_row_once(async_client, session):
+    add_authors(session, 5)
+
+    names = []
+    response = await async_client.get("/authors/?limit=2")
+    while True:
+        assert response.status_code == 200
+        names.extend(author["name"] for author in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+        response = await async_client.get(f"/authors/?limit=2&cursor={cursor}")
+
+    assert names == [f"Author {i}" for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_skip_limit_still_supported(async_client, session):
+    add_authors(session, 5)
+
+    response = await async_client.get("/authors/?skip=3&limit=10")
+    assert response.status_code == 200
+    assert [author["name"] for author in response.json()] == ["Author 3", "Author 4"]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor(async_client, session):
+    response = await async_client.get("/authors/?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+    # well encoded, but not an id
+    for after in ([1], {"id": 1}, "1", True, None):
+        response = await async_client.get(f"/authors/?cursor={encode_cursor(after)}")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.asyncio
+async def test_negative_limit_returns_every_row(async_client, session):
+    add_authors(session, 5)
+
+    response = await async_client.get("/authors/?skip=1&limit=-1")
+    assert response.status_code == 200
+    assert len(response.json()) == 4
+    assert NEXT_CURSOR_HEADER not in response.headers
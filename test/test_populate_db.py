@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import inspect
+from sqlmodel import SQLModel
+
+import populate_db
+from database import create_db_engine
+from migrations import HEAD, current_version
+from settings import Settings
+
+SMALL = ["--users", "200", "--audiobooks", "100", "--listening-histories", "4000"]
+
+
+def generate(path, *args):
+    url = f"sqlite:///{path}"
+    populate_db.main(["--database-url", url, "--batch", "1000", *SMALL, *args])
+    return create_db_engine(Settings(database_url=url))
+
+
+def rows(db_engine, statement):
+    with db_engine.connect() as connection:
+        return connection.exec_driver_sql(statement).all()
+
+
+def test_generates_indexed_migrated_database(tmp_path):
+    db_engine = generate(tmp_path / "app.db")
+    assert rows(db_engine, "SELECT count(*) FROM listeninghistory") == [(4000,)]
+    assert rows(db_engine, "SELECT count(*) FROM bookmark") == [(1000,)]
+    assert rows(db_engine, "SELECT count(*) FROM rating") == [(200,)]
+    assert current_version(db_engine) == HEAD
+    indexes = {
+        index["name"]
+        for table in SQLModel.metadata.tables
+        for index in inspect(db_engine).get_indexes(table)
+    }
+    expected = {
+        index.name
+        for table in SQLModel.metadata.tables.values()
+        for index in table.indexes
+    }
+    assert expected | {"uq_listeninghistory_session"} <= indexes
+    # An audiobook lasts as long as its chapters.
+    assert not rows(
+        db_engine,
+        "SELECT audiobook_id FROM audiobook JOIN chapter USING (audiobook_id)"
+        " GROUP BY audiobook_id HAVING audiobook.duration != sum(chapter.duration)",
+    )
+    assert rows(db_engine, "SELECT count(*) FROM catalog_search") == [(100,)]
+    db_engine.dispose()
+
+
+def test_popularity_is_skewed(tmp_path):
+    db_engine = generate(tmp_path / "app.db")
+    counts = [
+        count
+        for (count,) in rows(
+            db_engine,
+            "SELECT count(*) AS sessions FROM listeninghistory"
+            " GROUP BY audiobook_id ORDER BY sessions DESC",
+        )
+    ]
+    # The top 10% of audiobooks get most of the listening.
+    assert sum(counts[:10]) > 4000 / 2
+    db_engine.dispose()
+
+
+def test_same_seed_same_data(tmp_path):
+    dump = "SELECT * FROM listeninghistory ORDER BY history_id"
+    first = generate(tmp_path / "first.db", "--seed", "7")
+    second = generate(tmp_path / "second.db", "--seed", "7")
+    other = generate(tmp_path / "other.db", "--seed", "8")
+    assert rows(first, dump) == rows(second, dump)
+    assert rows(first, dump) != rows(other, dump)
+    for db_engine in (first, second, other):
+        db_engine.dispose()
+
+
+def test_refuses_non_empty_database_without_reset(tmp_path):
+    generate(tmp_path / "app.db").dispose()
+    with pytest.raises(SystemExit):
+        generate(tmp_path / "app.db")
+    db_engine = generate(tmp_path / "app.db", "--reset")
+    assert rows(db_engine, "SELECT count(*) FROM listeninghistory") == [(4000,)]
+    db_engine.dispose()
@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from profiling import ProfilingMiddleware, StackSampler
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def profiled_client(tmp_path):
+    def client(**options):
+        profiled = ProfilingMiddleware(app, directory=str(tmp_path), **options)
+        return AsyncClient(app=profiled, base_url="http://test")
+
+    return client
+
+
+def profiles(directory):
+    return sorted(os.listdir(directory)) if os.path.exists(directory) else []
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_records_busy_threads_only():
+    stop = threading.Event()
+    busy = threading.Thread(target=spin, args=(stop,), name="busy")
+    idle = threading.Thread(target=stop.wait, name="idle")
+    sampler = StackSampler(0.001)
+    busy.start()
+    idle.start()
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    busy.join()
+    idle.join()
+
+    lines = sampler.collapsed().splitlines()
+    assert sampler.samples > 0
+    assert all(re.fullmatch(r"[^;]+(;[^;]+)* \d+", line) for line in lines)
+    busy_stacks = [line for line in lines if line.startswith("busy;")]
+    assert busy_stacks and all("spin (" in line for line in busy_stacks)
+    assert not [line for line in lines if line.startswith("idle;")]
+
+
+@pytest.mark.asyncio
+async def test_profiles_requests_with_token(profiled_client, session, tmp_path):
+    async with profiled_client(token=TOKEN) as client:
+        response = await client.get("/authors/", headers={"X-Profile": TOKEN})
+        name = response.headers["x-profile"]
+        assert re.fullmatch(r"\d{8}T\d{6}-GET-authors-1\.collapsed", name)
+        assert profiles(tmp_path) == [name]
+
+        response = await client.get(f"/authors/?profile={TOKEN}")
+        assert response.status_code == 200
+        assert len(profiles(tmp_path)) == 2
+
+
+@pytest.mark.asyncio
+async def test_ignores_requests_without_token(profiled_client, session, tmp_path):
+    async with profiled_client(token=TOKEN) as client:
+        for headers in ({}, {"X-Profile": "guess"}):
+            response = await client.get("/authors/", headers=headers)
+            assert response.status_code == 200
+            assert "x-profile" not in response.headers
+        await client.get("/authors/?profile=")
+    assert profiles(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_samples_one_in_n(profiled_client, session, tmp_path):
+    async with profiled_client(sample_every=3) as client:
+        for _ in range(6):
+            response = await client.get("/authors/", headers={"X-Profile": ""})
+            assert "x-profile" not in response.headers
+    assert [name.rsplit("-", 1)[1] for name in profiles(tmp_path)] == [
+        "3.collapsed",
+        "6.collapsed",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_keeps_newest_profiles_within_size(
+    profiled_client, session, tmp_path, monkeypatch
+):
+    stopped_on = []
+    stop = StackSampler.stop
+
+    def stop_and_record(sampler):
+        sampler.stacks[("MainThread", "x" * 2000)] += 1
+        sampler.stacks[("MainThread", "y" * 100)] += 2
+        stopped_on.append(threading.current_thread())
+        stop(sampler)
+
+    monkeypatch.setattr(StackSampler, "stop", stop_and_record)
+    async with profiled_client(sample_every=1, max_files=2, max_file_kb=1) as client:
+        for _ in range(3):
+            await client.get("/authors/")
+            # distinct modification times to rotate by
+            time.sleep(0.01)
+
+    assert [name.rsplit("-", 1)[1] for name in profiles(tmp_path)] == [
+        "2.collapsed",
+        "3.collapsed",
+    ]
+    for name in profiles(tmp_path):
+        with open(tmp_path / name) as f:
+            collapsed = f.read()
+        assert len(collapsed.encode()) <= 1024
+        assert "y" * 100 in collapsed and "x" * 2000 not in collapsed
+    # the sampler is stopped and the file written on the threadpool
+    assert threading.main_thread() not in stopped_on
+
+
+def test_not_installed_by_default():
+    assert not any(m.cls is ProfilingMiddleware for m in app.user_middleware)
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session, select
+
+from database import engine
+from main import app
+from progress_ingest import ProgressBuffer, progress_buffer
+from schema import ListeningHistory, ListeningProgressEvent
+
+STARTED_AT = datetime(2023, 1, 1, 0, 0, 0)
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+def heartbeat(minute, user_id=1):
+    return ListeningProgressEvent(
+        user_id=user_id,
+        audiobook_id=1,
+        started_at=STARTED_AT,
+        reported_at=datetime(2023, 1, 1, 0, minute, 0),
+    )
+
+
+def test_heartbeats_coalesce_and_upsert(session):
+    buffer = ProgressBuffer(engine, max_size=10, batch_size=10, flush_interval=60)
+
+    assert buffer.offer([heartbeat(1), heartbeat(3), heartbeat(2)])
+    assert len(buffer) == 1
+    assert buffer.flush() == 1
+
+    assert buffer.offer([heartbeat(5)])
+    assert buffer.flush() == 1
+
+    histories = session.exec(select(ListeningHistory)).all()
+    assert len(histories) == 1
+    assert histories[0].finished_at == datetime(2023, 1, 1, 0, 5, 0)
+
+
+def test_aware_and_naive_times_coalesce(session):
+    buffer = ProgressBuffer(engine, max_size=10, batch_size=10, flush_interval=60)
+    plus_two = timezone(timedelta(hours=2))
+    aware = ListeningProgressEvent(
+        user_id=1,
+        audiobook_id=1,
+        started_at=STARTED_AT.replace(tzinfo=timezone.utc),
+        reported_at=datetime(2023, 1, 1, 2, 4, 0, tzinfo=plus_two),
+    )
+
+    assert buffer.offer([heartbeat(3), aware])
+    assert buffer.offer([heartbeat(2)])
+    assert len(buffer) == 1
+    assert buffer.flush() == 1
+
+    histories = session.exec(select(ListeningHistory)).all()
+    assert len(histories) == 1
+    assert histories[0].started_at == STARTED_AT
+    assert histories[0].finished_at == datetime(2023, 1, 1, 0, 4, 0)
+
+
+@pytest.mark.asyncio
+async def test_ingest_endpoint_mixed_time_zones(async_client, session):
+    events = [
+        {"user_id": 1, "audiobook_id": 1, "started_at": "2023-01-01T00:00:00Z"},
+        {"user_id": 1, "audiobook_id": 1, "started_at": "2023-01-01T00:00:00"},
+    ]
+
+    response = await async_client.post("/listening_histories/progress", json=events)
+    assert response.status_code == 202
+    progress_buffer.flush()
+    assert len(session.exec(select(ListeningHistory)).all()) == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_listening_session_conflicts(async_client, session):
+    history = {"user_id": 1, "audiobook_id": 1, "started_at": STARTED_AT.isoformat()}
+
+    response = await async_client.post("/listening_histories/", json=history)
+    assert response.status_code == 200
+    response = await async_client.post("/listening_histories/", json=history)
+    assert response.status_code == 409
+
+    other = {**history, "started_at": datetime(2023, 1, 2).isoformat()}
+    response = await async_client.post("/listening_histories/", json=other)
+    assert response.status_code == 200
+    response = await async_client.put(
+        f"/listening_histories/{response.json()['history_id']}", json=history
+    )
+    assert response.status_code == 409
+    assert len(session.exec(select(ListeningHistory)).all()) == 2
+
+
+def test_full_buffer_rejects(session):
+    buffer = ProgressBuffer(engine, max_size=1, batch_size=10, flush_interval=60)
+
+    assert buffer.offer([heartbeat(1, user_id=1)])
+    assert buffer.offer([heartbeat(2, user_id=1)])
+    assert not buffer.offer([heartbeat(1, user_id=2)])
+    assert buffer.rejected == 1
+
+
+def test_stop_drains_buffer(session):
+    buffer = ProgressBuffer(engine, max_size=10, batch_size=10, flush_interval=60)
+    buffer.start()
+    buffer.offer([heartbeat(1, user_id=1), heartbeat(1, user_id=2)])
+    buffer.stop()
+
+    assert len(session.exec(select(ListeningHistory)).all()) == 2
+
+
+@pytest.mark.asyncio
+async def test_ingest_endpoint(async_client, session, monkeypatch):
+    event = {"user_id": 1, "audiobook_id": 1, "started_at": STARTED_AT.isoformat()}
+
+    response = await async_client.post("/listening_histories/progress", json=[event])
+    assert response.status_code == 202
+    assert response.json()["accepted"] == 1
+    progress_buffer.flush()
+    assert len(session.exec(select(ListeningHistory)).all()) == 1
+
+    monkeypatch.setattr(progress_buffer, "max_size", 0)
+    response = await async_client.post("/listening_histories/progress", json=[event])
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
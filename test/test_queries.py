@@ -0,0 +1,76 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from schema import Audiobook, Author, Narrator
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_audiobooks(session, count):
+    for i in range(count):
+        author = Author(name=f"Author {i}")
+        narrator = Narrator(name=f"Narrator {i}")
+        session.add(
+            Audiobook(
+                title=f"Audiobook {i}", author=author, narrator=narrator, duration=3600
+            )
+        )
+    session.commit()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("page_size", [1, 10, 50])
+async def test_list_audiobooks_query_count_is_fixed(
+    async_client, session, statements, page_size
+):
+    add_audiobooks(session, page_size)
+    statements.clear()
+
+    response = await async_client.get(f"/audiobooks/?limit={page_size}")
+    assert response.status_code == 200
+    assert len(response.json()) == page_size
+    assert response.json()[0]["author"]["name"] == "Author 0"
+    assert response.json()[0]["narrator"]["name"] == "Narrator 0"
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_read_audiobook_loads_relationships_in_one_query(
+    async_client, session, statements
+):
+    add_audiobooks(session, 1)
+    statements.clear()
+
+    response = await async_client.get("/audiobooks/1")
+    assert response.status_code == 200
+    assert response.json()["author"]["name"] == "Author 0"
+    assert len(statements) == 1
@@ -0,0 +1,101 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from rating_aggregates import rebuild_rating_aggregates
+from schema import Audiobook, Author, Rating, RatingAggregate, User
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def audiobook(session):
+    audiobook = Audiobook(title="Audiobook One", author=Author(name="A"), duration=1)
+    session.add(audiobook)
+    session.add(User(username="user1", name="U", email="u@example.com", password="x"))
+    session.commit()
+    session.refresh(audiobook)
+    return audiobook
+
+
+async def rate(async_client, audiobook, rating):
+    response = await async_client.post(
+        "/ratings/",
+        json={"user_id": 1, "audiobook_id": audiobook.audiobook_id, "rating": rating},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_aggregate_follows_rating_writes(async_client, audiobook):
+    path = f"/audiobooks/{audiobook.audiobook_id}/rating"
+    response = await async_client.get(path)
+    assert response.status_code == 200
+    assert response.json()["rating_count"] == 0
+    assert response.json()["average"] is None
+
+    first = await rate(async_client, audiobook, 5)
+    second = await rate(async_client, audiobook, 3)
+    response = await async_client.get(path)
+    assert response.json()["rating_count"] == 2
+    assert response.json()["average"] == 4
+    assert response.json()["histogram"] == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+
+    await async_client.put(
+        f"/ratings/{second['rating_id']}",
+        json={"user_id": 1, "audiobook_id": audiobook.audiobook_id, "rating": 1},
+    )
+    await async_client.delete(f"/ratings/{first['rating_id']}")
+    response = await async_client.get(path)
+    assert response.json()["rating_count"] == 1
+    assert response.json()["histogram"] == {"1": 1, "2": 0, "3": 0, "4": 0, "5": 0}
+
+    response = await async_client.get(f"/audiobooks/{audiobook.audiobook_id}")
+    assert response.json()["rating_aggregate"]["average"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rating_out_of_range(async_client, audiobook):
+    response = await async_client.post(
+        "/ratings/",
+        json={"user_id": 1, "audiobook_id": audiobook.audiobook_id, "rating": 6},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_rating_of_missing_audiobook(async_client, session):
+    response = await async_client.get("/audiobooks/999/rating")
+    assert response.status_code == 404
+
+
+def test_rebuild_matches_raw_ratings(session, audiobook):
+    for rating in (4, 4, 2):
+        session.add(
+            Rating(user_id=1, audiobook_id=audiobook.audiobook_id, rating=rating)
+        )
+    session.commit()
+
+    assert rebuild_rating_aggregates(session) == 1
+    session.commit()
+
+    aggregate = session.get(RatingAggregate, audiobook.audiobook_id)
+    assert aggregate.rating_count == 3
+    assert aggregate.rating_sum == 10
+    assert aggregate.histogram == {1: 0, 2: 1, 3: 0, 4: 2, 5: 0}
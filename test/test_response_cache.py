@@ -0,0 +1,269 @@
+import orjson
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from response_cache import (
+    CacheBackend,
+    MemoryCache,
+    ResponseCache,
+    SharedCache,
+    response_cache,
+)
+from schema import Audiobook, Author, AuthorBase, Narrator, User
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def audiobook(session):
+    audiobook = Audiobook(
+        title="Dune",
+        author=Author(name="Frank Herbert"),
+        narrator=Narrator(name="Scott Brick"),
+        duration=3600,
+    )
+    session.add(audiobook)
+    session.add(User(username="u", name="U", email="u@example.com", password="x"))
+    session.commit()
+    session.refresh(audiobook)
+    return audiobook
+
+
+@pytest.fixture(params=["memory", "shared"])
+def backend(request, tmp_path):
+    clock = FakeClock()
+    if request.param == "memory":
+        cache = MemoryCache(max_entries=2, ttl=10, clock=clock)
+    else:
+        cache = SharedCache(
+            str(tmp_path / "cache.db"), max_entries=2, ttl=10, clock=clock
+        )
+    return cache, clock
+
+
+def test_backend_eviction_and_expiry(backend):
+    cache, clock = backend
+    cache.set("a", b"1")
+    clock.now = 1
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"
+    assert cache.get("missing") is None
+    clock.now = 2
+    cache.set("c", b"3")
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+    clock.now = 11
+    assert cache.get("c") == b"3"
+    clock.now = 12
+    assert cache.get("c") is None
+    assert cache.expirations == 1
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_memory_backend_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2, ttl=10)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("a") == b"1"
+    assert cache.get("b") is None
+
+
+def test_shared_backend_counts_only_near_capacity(tmp_path):
+    clock = FakeClock()
+    cache = SharedCache(
+        str(tmp_path / "cache.db"), max_entries=100, ttl=1000, clock=clock
+    )
+    statements = []
+    cache._connection().set_trace_callback(statements.append)
+    for i in range(100):
+        clock.now = i
+        cache.set(f"audiobook:{i}", b"{}")
+    assert not any("count(*)" in statement for statement in statements)
+
+    clock.now = 100
+    cache.set("audiobook:100", b"{}")
+    # evicts the excess and a tenth more, so the next writes need no count
+    assert cache.evictions == 11
+    assert len(cache) == 90
+    statements.clear()
+    for i in range(101, 111):
+        clock.now = i
+        cache.set(f"audiobook:{i}", b"{}")
+    assert not any("count(*)" in statement for statement in statements)
+    assert cache.get("audiobook:0") is None
+    assert cache.get("audiobook:110") == b"{}"
+
+
+def test_shared_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = SharedCache(path, max_entries=10, ttl=10)
+    second = SharedCache(path, max_entries=10, ttl=10)
+    first.set("audiobook:1", b"{}")
+    assert second.get("audiobook:1") == b"{}"
+    second.delete("audiobook:1")
+    assert first.get("audiobook:1") is None
+
+
+def test_invalidation_during_load_is_not_overwritten():
+    cache = ResponseCache(MemoryCache(max_entries=10, ttl=10))
+    names = iter(["Frank Herbert", "F. Herbert"])
+
+    def load():
+        name = next(names)
+        if name == "Frank Herbert":
+            # a write commits and invalidates while the old row is serialized
+            cache.invalidate("author:1")
+        return AuthorBase(name=name)
+
+    response = cache.fetch("author:1", AuthorBase, load)
+    assert orjson.loads(response.body)["name"] == "Frank Herbert"
+    response = cache.fetch("author:1", AuthorBase, load)
+    assert response.headers["X-Cache"] == "MISS"
+    assert orjson.loads(response.body)["name"] == "F. Herbert"
+    assert cache.fetch("author:1", AuthorBase, load).headers["X-Cache"] == "HIT"
+
+    def load_many(ids):
+        cache.invalidate("author:2")
+        return {author_id: AuthorBase(name="Frank Herbert") for author_id in ids}
+
+    assert set(cache.fetch_many("author", [2, 3], AuthorBase, load_many)) == {2, 3}
+    assert cache.backend.get("author:2") is None
+    assert cache.backend.get("author:3") is not None
+    assert cache._loads == {}
+
+
+def test_incomplete_backend_fails_on_construction():
+    class GetOnly(CacheBackend):
+        name = "get-only"
+
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+def test_store_writes_outside_the_lock():
+    class Racing(MemoryCache):
+        def set_many(self, items):
+            # another fill or invalidation can run meanwhile
+            assert not cache._lock.locked()
+            super().set_many(items)
+            cache.invalidate(*items)
+            super().set_many(items)
+
+    cache = ResponseCache(Racing(max_entries=10, ttl=10))
+    response = cache.fetch("author:1", AuthorBase, lambda: AuthorBase(name="A"))
+    assert orjson.loads(response.body)["name"] == "A"
+    # the invalidation during the write wins
+    assert cache.backend.get("author:1") is None
+    assert cache._loads == {}
+
+
+@pytest.mark.asyncio
+async def test_read_is_served_from_cache(async_client, audiobook, statements):
+    path = f"/audiobooks/{audiobook.audiobook_id}"
+    first = await async_client.get(path)
+    assert first.headers["X-Cache"] == "MISS"
+    statements.clear()
+    second = await async_client.get(path)
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert second.json()["author"]["name"] == "Frank Herbert"
+    assert statements == []
+
+
+@pytest.mark.asyncio
+async def test_misses_are_not_cached(async_client, session):
+    assert (await async_client.get("/authors/1")).status_code == 404
+    await async_client.post("/authors/", json={"name": "Frank Herbert"})
+    response = await async_client.get("/authors/1")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate(async_client, audiobook):
+    audiobook_id = audiobook.audiobook_id
+    path = f"/audiobooks/{audiobook_id}"
+    author_path = f"/authors/{audiobook.author_id}"
+    await async_client.get(path)
+    await async_client.get(author_path)
+
+    await async_client.put(author_path, json={"name": "F. Herbert"})
+    assert (await async_client.get(author_path)).json()["name"] == "F. Herbert"
+    assert (await async_client.get(path)).json()["author"]["name"] == "F. Herbert"
+
+    await async_client.put(
+        f"/narrators/{audiobook.narrator_id}", json={"name": "S. Brick"}
+    )
+    assert (await async_client.get(path)).json()["narrator"]["name"] == "S. Brick"
+
+    await async_client.post(
+        "/ratings/", json={"user_id": 1, "audiobook_id": audiobook_id, "rating": 4}
+    )
+    assert (await async_client.get(path)).json()["rating_aggregate"]["average"] == 4
+
+    await async_client.put(
+        path, json={"title": "Dune Messiah", "author_id": 1, "duration": 1}
+    )
+    assert (await async_client.get(path)).json()["title"] == "Dune Messiah"
+
+
+@pytest.mark.asyncio
+async def test_delete_invalidates(async_client, session):
+    await async_client.post("/categories/", json={"name": "Science Fiction"})
+    assert (await async_client.get("/categories/1")).status_code == 200
+    await async_client.delete("/categories/1")
+    assert (await async_client.get("/categories/1")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stats(async_client, audiobook):
+    before = response_cache.stats()
+    path = f"/audiobooks/{audiobook.audiobook_id}"
+    await async_client.get(path)
+    await async_client.get(path)
+    stats = (await async_client.get("/cache/stats")).json()
+    assert stats["backend"] == "memory"
+    assert stats["hits"] == before.hits + 1
+    assert stats["misses"] == before.misses + 1
@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, select
+
+from database import engine
+from main import app
+from resume import UNKNOWN, ResumeStore, resume_store
+from schema import Audiobook, Author, Bookmark, ResumePositionRead, User
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def user_and_audiobook(session):
+    user = User(username="u", name="U", email="u@example.com", password="x")
+    audiobook = Audiobook(title="Dune", author=Author(name="A"), duration=1)
+    session.add_all([user, audiobook])
+    session.commit()
+    return user.user_id, audiobook.audiobook_id
+
+
+def position(seconds, at, user_id=1, audiobook_id=1):
+    return ResumePositionRead(
+        user_id=user_id, audiobook_id=audiobook_id, position=seconds, updated_at=at
+    )
+
+
+@pytest.mark.asyncio
+async def test_resume_reads_come_from_memory(
+    async_client, user_and_audiobook, statements
+):
+    user_id, audiobook_id = user_and_audiobook
+    url = f"/users/{user_id}/resume/{audiobook_id}"
+    assert (await async_client.get(url)).status_code == 404
+    response = await async_client.put(url, json={"position": 42})
+    assert response.json()["position"] == 42
+    statements.clear()
+    response = await async_client.get(url)
+    assert response.json()["position"] == 42
+    assert statements == []
+
+
+@pytest.mark.asyncio
+async def test_older_updates_are_ignored(async_client, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    url = f"/users/{user_id}/resume/{audiobook_id}"
+    await async_client.put(
+        url, json={"position": 20, "updated_at": "2024-01-01T12:00:00Z"}
+    )
+    response = await async_client.put(
+        url, json={"position": 10, "updated_at": "2024-01-01T11:00:00Z"}
+    )
+    assert response.json()["position"] == 20
+    assert (await async_client.get(url)).json()["position"] == 20
+
+
+@pytest.mark.asyncio
+async def test_future_updates_are_clamped_to_now(async_client, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    url = f"/users/{user_id}/resume/{audiobook_id}"
+    response = await async_client.put(
+        url, json={"position": 20, "updated_at": "2999-01-01T00:00:00Z"}
+    )
+    assert datetime.fromisoformat(response.json()["updated_at"]) <= datetime.utcnow()
+    response = await async_client.put(url, json={"position": 30})
+    assert response.json()["position"] == 30
+
+
+def test_flush_upserts_one_resume_bookmark(session, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    start = datetime(2024, 1, 1)
+    resume_store.put(position(10, start, user_id, audiobook_id))
+    assert resume_store.flush() == 1
+    resume_store.put(position(30, start + timedelta(minutes=1), user_id, audiobook_id))
+    assert resume_store.flush() == 1
+
+    # a worker flushing a stale position does not move the bookmark back
+    other = ResumeStore(engine, max_size=10, max_pending=10, flush_interval=1)
+    other.put(position(5, start, user_id, audiobook_id))
+    other.flush()
+
+    bookmarks = session.exec(select(Bookmark).where(Bookmark.is_resume)).all()
+    assert [(b.position, b.updated_at) for b in bookmarks] == [
+        (30, start + timedelta(minutes=1))
+    ]
+
+
+def test_miss_loads_newest_bookmark(session, user_and_audiobook, statements):
+    user_id, audiobook_id = user_and_audiobook
+    session.add_all(
+        [
+            Bookmark(user_id=user_id, audiobook_id=audiobook_id, position=5),
+            Bookmark(user_id=user_id, audiobook_id=audiobook_id, position=7),
+        ]
+    )
+    session.commit()
+    assert resume_store.get(user_id, audiobook_id) is UNKNOWN
+    assert resume_store.load(user_id, audiobook_id).position == 7
+    statements.clear()
+    assert resume_store.get(user_id, audiobook_id).position == 7
+    # known to have no position: no query either
+    assert resume_store.load(user_id, audiobook_id + 1) is None
+    assert resume_store.get(user_id, audiobook_id + 1) is None
+    assert len(statements) == 1
+
+
+def test_miss_loads_newer_bookmark_over_resume(session, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    start = datetime(2024, 1, 1)
+    resume_store.put(position(10, start, user_id, audiobook_id))
+    resume_store.flush()
+    session.add(
+        Bookmark(
+            user_id=user_id,
+            audiobook_id=audiobook_id,
+            position=25,
+            updated_at=start + timedelta(minutes=1),
+        )
+    )
+    session.commit()
+    resume_store.invalidate((user_id, audiobook_id))
+    assert resume_store.load(user_id, audiobook_id).position == 25
+
+
+def test_positions_expire_after_ttl(session, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    now = [0.0]
+    store = ResumeStore(
+        engine,
+        max_size=10,
+        max_pending=10,
+        flush_interval=1,
+        ttl=60,
+        clock=lambda: now[0],
+    )
+    assert store.load(user_id, audiobook_id) is None
+    # another worker writes a bookmark this store is not told about
+    session.add(Bookmark(user_id=user_id, audiobook_id=audiobook_id, position=8))
+    session.commit()
+    now[0] = 59.0
+    assert store.get(user_id, audiobook_id) is None
+    now[0] = 60.0
+    assert store.get(user_id, audiobook_id) is UNKNOWN
+    assert store.load(user_id, audiobook_id).position == 8
+
+
+@pytest.mark.asyncio
+async def test_bookmark_writes_refresh_resume(async_client, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    url = f"/users/{user_id}/resume/{audiobook_id}"
+    assert (await async_client.get(url)).status_code == 404
+
+    bookmark = {"user_id": user_id, "audiobook_id": audiobook_id, "position": 12}
+    response = await async_client.post("/bookmarks/", json=bookmark)
+    bookmark_id = response.json()["bookmark_id"]
+    assert (await async_client.get(url)).json()["position"] == 12
+
+    bookmark["position"] = 15
+    await async_client.put(f"/bookmarks/{bookmark_id}", json=bookmark)
+    assert (await async_client.get(url)).json()["position"] == 15
+
+    await async_client.delete(f"/bookmarks/{bookmark_id}")
+    assert (await async_client.get(url)).status_code == 404
+
+
+def test_invalidate_during_load_is_not_cached(session, user_and_audiobook):
+    user_id, audiobook_id = user_and_audiobook
+    store = ResumeStore(engine, max_size=10, max_pending=10, flush_interval=1)
+
+    def invalidate(conn, cursor, statement, parameters, context, many):
+        store.invalidate((user_id, audiobook_id))
+
+    event.listen(engine, "before_cursor_execute", invalidate)
+    try:
+        assert store.load(user_id, audiobook_id) is None
+    finally:
+        event.remove(engine, "before_cursor_execute", invalidate)
+    assert store.get(user_id, audiobook_id) is UNKNOWN
+
+
+def test_eviction_keeps_pending_writes(session):
+    store = ResumeStore(engine, max_size=2, max_pending=2, flush_interval=1)
+    now = datetime.utcnow()
+    for audiobook_id in (1, 2):
+        assert store.put(position(audiobook_id, now, audiobook_id=audiobook_id))
+    # full: a new pair is refused, the pending ones can still move
+    assert store.put(position(3, now, audiobook_id=3)) is None
+    assert store.put(position(9, now, audiobook_id=1)).position == 9
+    store.flush()
+    store.put(position(3, now, audiobook_id=3))
+    store.put(position(4, now, audiobook_id=4))
+    assert len(store) == 2
+    assert store.get(1, 1) is UNKNOWN
+    assert store.get(1, 3).position == 3
+
+
+@pytest.mark.asyncio
+async def test_full_store_returns_503(async_client, session, monkeypatch):
+    monkeypatch.setattr(resume_store, "max_pending", 0)
+    response = await async_client.put("/users/1/resume/1", json={"position": 1})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
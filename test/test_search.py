@@ -0,0 +1,171 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from schema import Audiobook, Author, Category, Narrator
+from search import TABLES, match_expression, rebuild_search_index
+from settings import get_settings
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def catalog(session):
+    tolkien = Author(name="J. R. R. Tolkien")
+    fantasy = Category(name="Fantasy")
+    hobbit = Audiobook(
+        title="The Hobbit",
+        description="A hobbit is swept into a quest for dragon gold.",
+        author=tolkien,
+        narrator=Narrator(name="Andy Serkis"),
+        duration=3600,
+        categories=[fantasy],
+    )
+    session.add(hobbit)
+    session.add(
+        Audiobook(
+            title="Dune",
+            description="Politics and sandworms on the desert planet Arrakis.",
+            author=Author(name="Frank Herbert"),
+            duration=7200,
+        )
+    )
+    session.commit()
+    return {"hobbit": hobbit, "tolkien": tolkien, "fantasy": fantasy}
+
+
+async def search_ids(async_client, q):
+    response = await async_client.get("/search/", params={"q": q})
+    assert response.status_code == 200
+    return [result["audiobook_id"] for result in response.json()]
+
+
+def test_match_expression_quotes_words():
+    assert match_expression('dune" OR -x') == '"dune" "OR" "x"'
+    assert match_expression("***") == ""
+
+
+def test_match_expression_expands_only_the_last_word():
+    assert match_expression("tolkien dra") == '"tolkien" "dra"*'
+    assert match_expression("tol dr") == '"tol" "dr"'
+
+
+@pytest.mark.asyncio
+async def test_search_by_every_field(async_client, catalog):
+    hobbit_id = catalog["hobbit"].audiobook_id
+    assert await search_ids(async_client, "hobbit") == [hobbit_id]
+    assert await search_ids(async_client, "dragon") == [hobbit_id]
+    assert await search_ids(async_client, "tolkien") == [hobbit_id]
+    assert await search_ids(async_client, "serkis") == [hobbit_id]
+    assert await search_ids(async_client, "fantasy") == [hobbit_id]
+    assert await search_ids(async_client, "sandw") != [hobbit_id]
+    assert await search_ids(async_client, "tolkien drag") == [hobbit_id]
+    assert await search_ids(async_client, "tolk drag") == []
+
+
+@pytest.mark.asyncio
+async def test_search_result_shape(async_client, catalog):
+    response = await async_client.get("/search/", params={"q": "dragon"})
+    result = response.json()[0]
+    assert result["title"] == "The Hobbit"
+    assert result["author"] == "J. R. R. Tolkien"
+    assert "<b>dragon</b>" in result["snippet"]
+
+
+@pytest.mark.asyncio
+async def test_index_follows_catalog_writes(async_client, session, catalog):
+    hobbit_id = catalog["hobbit"].audiobook_id
+    catalog["tolkien"].name = "John Ronald Reuel Tolkien"
+    catalog["fantasy"].name = "High Fantasy"
+    session.commit()
+    assert await search_ids(async_client, "reuel") == [hobbit_id]
+    assert await search_ids(async_client, "high") == [hobbit_id]
+
+    session.delete(catalog["hobbit"])
+    session.commit()
+    assert await search_ids(async_client, "hobbit") == []
+
+
+@pytest.mark.asyncio
+async def test_index_follows_author_and_narrator_deletes(async_client, session):
+    audiobook = Audiobook(
+        title="Dune",
+        author=Author(name="Frank Herbert"),
+        narrator=Narrator(name="Scott Brick"),
+        duration=1,
+    )
+    session.add(audiobook)
+    session.commit()
+    for table in ("author", "narrator"):
+        # raw deletes, as the ORM would first null out the audiobook's key
+        session.execute(text(f"DELETE FROM {table}"))
+    session.commit()
+    assert await search_ids(async_client, "herbert") == []
+    assert await search_ids(async_client, "brick") == []
+    assert await search_ids(async_client, "dune") == [audiobook.audiobook_id]
+
+
+@pytest.mark.asyncio
+async def test_rebuild(async_client, session, catalog):
+    for table in TABLES:
+        session.execute(text(f"INSERT INTO {table} ({table}) VALUES ('delete-all')"))
+    session.commit()
+    assert await search_ids(async_client, "hobbit") == []
+
+    assert rebuild_search_index(session) == 2
+    session.commit()
+    assert await search_ids(async_client, "hobbit") == [catalog["hobbit"].audiobook_id]
+
+
+@pytest.mark.asyncio
+async def test_best_match_is_kept_under_candidate_limit(
+    async_client, session, monkeypatch
+):
+    best = Audiobook(title="Dragon", author=Author(name="A"), duration=1)
+    session.add(best)
+    session.commit()
+    # many newer, weaker matches on the narrator name only
+    narrator = Narrator(name="Dragon Voice")
+    session.add_all(
+        Audiobook(title=f"Book {i}", narrator=narrator, author_id=1, duration=1)
+        for i in range(100)
+    )
+    session.commit()
+    # candidates are the best-ranked matches, not the newest
+    monkeypatch.setattr(get_settings(), "search_candidate_limit", 5)
+    assert (await search_ids(async_client, "drag"))[0] == best.audiobook_id
+
+
+@pytest.mark.asyncio
+async def test_tables_are_merged_by_normalized_score(async_client, session):
+    # the best match of either table scores 1 there; a book in both adds up
+    by_title = Audiobook(title="Dragon", author=Author(name="A"), duration=1)
+    by_description = Audiobook(
+        title="Wyrm", description="dragon " * 5, author_id=1, duration=1
+    )
+    session.add_all([by_title, by_description])
+    session.commit()
+    response = await async_client.get("/search/", params={"q": "dragon"})
+    results = response.json()
+    assert [r["audiobook_id"] for r in results] == [
+        by_title.audiobook_id,
+        by_description.audiobook_id,
+    ]
+    assert 1 < results[0]["score"] <= 2
+    assert 0 < results[1]["score"] <= 1
@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import List
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from pydantic import TypeAdapter
+from sqlmodel import SQLModel, Session
+
+import schema
+from database import engine
+from main import app
+from pagination import NEXT_CURSOR_HEADER
+from queries import select_for
+from serialization import encoder_for
+
+READ_MODELS = [
+    (schema.User, schema.UserRead),
+    (schema.Subscription, schema.SubscriptionRead),
+    (schema.Author, schema.AuthorRead),
+    (schema.Narrator, schema.NarratorRead),
+    (schema.Audiobook, schema.AudiobookRead),
+    (schema.Chapter, schema.ChapterRead),
+    (schema.Category, schema.CategoryRead),
+    (schema.ListeningHistory, schema.ListeningHistoryRead),
+    (schema.Bookmark, schema.BookmarkRead),
+    (schema.Review, schema.ReviewRead),
+    (schema.Rating, schema.RatingRead),
+    (schema.Purchase, schema.PurchaseRead),
+]
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def catalog(session):
+    user = schema.User(username="u", name="U", email="u@example.com", password="x")
+    audiobook = schema.Audiobook(
+        title="Dune ☀",
+        author=schema.Author(name="Frank Herbert", bio="Born 1920"),
+        narrator=schema.Narrator(name="Scott Brick"),
+        duration=3600,
+        release_date=datetime(1965, 8, 1, 12, 30, 15, 250),
+        categories=[schema.Category(name="Science Fiction")],
+    )
+    session.add_all([user, audiobook])
+    session.add(schema.Subscription(name="Monthly", price=10, duration_days=30))
+    session.commit()
+    chapter = schema.Chapter(audiobook=audiobook, title="One", duration=60, position=1)
+    session.add_all(
+        [
+            chapter,
+            schema.ListeningHistory(user=user, audiobook=audiobook),
+            schema.Bookmark(user=user, audiobook=audiobook, position=42),
+            schema.Review(user=user, audiobook=audiobook, review_text="Spice"),
+            schema.Rating(user=user, audiobook=audiobook, rating=5),
+            schema.Purchase(user=user, audiobook=audiobook),
+            schema.RatingAggregate(
+                audiobook=audiobook, rating_count=1, rating_sum=5, stars_5=1
+            ),
+        ]
+    )
+    session.commit()
+
+
+@pytest.mark.parametrize("model, read_model", READ_MODELS)
+def test_encoder_matches_pydantic(session, catalog, model, read_model):
+    rows = session.exec(select_for(model, read_model)).unique().all()
+    assert rows
+    adapter = TypeAdapter(List[read_model])
+    expected = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    assert encoder_for(List[read_model])(rows) == expected
+    adapter = TypeAdapter(read_model)
+    expected = adapter.dump_json(adapter.validate_python(rows[0], from_attributes=True))
+    assert encoder_for(read_model)(rows[0]) == expected
+
+
+def test_whole_floats_stay_floats():
+    subscription = schema.Subscription(
+        subscription_id=1,
+        name="Monthly",
+        price=10,
+        duration_days=30,
+        created_at=datetime(2024, 1, 1),
+    )
+    assert b'"price":10.0' in encoder_for(schema.SubscriptionRead)(subscription)
+
+
+@pytest.mark.asyncio
+async def test_list_response_keeps_headers(async_client, session, catalog):
+    session.add(schema.Author(name="Brian Herbert"))
+    session.commit()
+    response = await async_client.get("/authors/", params={"limit": 1})
+    assert response.headers["content-type"] == "application/json"
+    assert [author["name"] for author in response.json()] == ["Frank Herbert"]
+    assert NEXT_CURSOR_HEADER in response.headers
+
+    response = await async_client.get("/audiobooks/")
+    assert response.json()[0]["author"]["name"] == "Frank Herbert"
+    assert response.json()[0]["rating_aggregate"]["histogram"]["5"] == 1
+
+
+def test_openapi_schema_is_unchanged():
+    paths = app.openapi()["paths"]
+
+    def schema_of(path):
+        return paths[path]["get"]["responses"]["200"]["content"]["application/json"][
+            "schema"
+        ]
+
+    assert schema_of("/audiobooks/") == {
+        "type": "array",
+        "items": {"$ref": "#/components/schemas/AudiobookRead"},
+        "title": "Response List Audiobooks Audiobooks  Get",
+    }
+    assert schema_of("/users/{user_id}") == {"$ref": "#/components/schemas/UserRead"}
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.util import await_only, greenlet_spawn
+from sqlmodel import SQLModel, Session
+
+from database import engine, get_async_engine
+from main import app, settings
+from response_cache import response_cache
+from schema import Audiobook, Author
+from single_flight import SingleFlight
+
+CALLERS = 20
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+def test_threads_share_one_call():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait()
+        return "result"
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flights.do, "key", fn) for _ in range(CALLERS)]
+        while flights.leaders + flights.coalesced < CALLERS:
+            time.sleep(0.001)
+        release.set()
+        assert [future.result() for future in futures] == ["result"] * CALLERS
+    assert len(calls) == 1
+    assert (flights.leaders, flights.coalesced) == (1, CALLERS - 1)
+
+
+def test_error_reaches_every_caller():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait()
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(flights.do, "key", fn) for _ in range(2)]
+        while flights.leaders + flights.coalesced < 2:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    # Nothing is remembered once the call is over.
+    assert flights.do("key", lambda: "again") == "again"
+
+
+@pytest.mark.asyncio
+async def test_coroutines_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(
+        *(flights.do_async("key", fn) for _ in range(CALLERS))
+    )
+    assert results == ["result"] * CALLERS
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_sync_callers_do_not_block_the_loop():
+    # Sync code run by AsyncSession.run_sync executes in a greenlet on the
+    # event loop; a follower blocking there would deadlock the leader.
+    flights = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        await_only(asyncio.sleep(0.01))
+        return "result"
+
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            *(greenlet_spawn(flights.do, "key", fn) for _ in range(CALLERS))
+        ),
+        timeout=5,
+    )
+    assert results == ["result"] * CALLERS
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_stampede_issues_one_query(async_client, session):
+    session.add(Audiobook(title="Launch Day", author=Author(name="A"), duration=1))
+    session.commit()
+    selects = []
+
+    def slow_select(conn, cursor, statement, parameters, context, many):
+        if statement.startswith("SELECT"):
+            selects.append(statement)
+            time.sleep(0.2)
+
+    if settings.database_mode == "async":
+        app_engine = get_async_engine().sync_engine
+    else:
+        app_engine = engine
+    event.listen(app_engine, "before_cursor_execute", slow_select)
+    try:
+        coalesced = response_cache.stats().coalesced
+        responses = await asyncio.gather(
+            *(async_client.get("/audiobooks/1") for _ in range(CALLERS))
+        )
+    finally:
+        event.remove(app_engine, "before_cursor_execute", slow_select)
+    assert {response.json()["title"] for response in responses} == {"Launch Day"}
+    assert len(selects) == 1
+    assert response_cache.stats().coalesced == coalesced + CALLERS - 1
@@ -0,0 +1,105 @@
+import logging
+
+import orjson
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from schema import Audiobook, Author, User
+from settings import get_settings
+from sql_instrumentation import QueryStats
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def slow_log(caplog):
+    def records(event):
+        return [
+            orjson.loads(record.getMessage())
+            for record in caplog.records
+            if record.name == "sql.slow"
+            and orjson.loads(record.getMessage())["event"] == event
+        ]
+
+    caplog.set_level(logging.WARNING, logger="sql.slow")
+    return records
+
+
+def test_server_timing_value():
+    stats = QueryStats()
+    stats.add("SELECT 1", 0.002)
+    stats.add("SELECT 2", 0.0005)
+    assert stats.slowest_statement == "SELECT 1"
+    assert stats.server_timing() == 'db;dur=2.50;desc="2 queries", db-slowest;dur=2.00'
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header(async_client, session):
+    session.add(Audiobook(title="Dune", author=Author(name="A"), duration=1))
+    session.commit()
+    response = await async_client.get("/authors/")
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert 'desc="1 queries"' in response.headers["server-timing"]
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log(async_client, session, slow_log, monkeypatch):
+    monkeypatch.setattr(get_settings(), "slow_query_ms", 1e-9)
+    await async_client.post("/authors/", json={"name": "Frank Herbert"})
+    (insert,) = [r for r in slow_log("slow_query") if "INSERT" in r["statement"]]
+    assert insert["route"] == "/authors/"
+    assert {"name": "<str>"} in insert["parameters"]
+
+
+def test_slow_query_log_redacts_parameters(session, slow_log, monkeypatch):
+    monkeypatch.setattr(get_settings(), "slow_query_ms", 1e-9)
+
+    def add_user(username):
+        session.add(
+            User(username=username, name="U", email=f"{username}@x", password="pw")
+        )
+        session.commit()
+        return [r for r in slow_log("slow_query") if "INSERT" in r["statement"]][-1]
+
+    insert = add_user("u")
+    # outside a request
+    assert insert["route"] is None
+    assert {"username": "<str>"} in insert["parameters"]
+    assert {"password": "***"} in insert["parameters"]
+    assert {"email": "***"} in insert["parameters"]
+
+    monkeypatch.setattr(get_settings(), "sql_log_parameters", True)
+    insert = add_user("v")
+    assert {"username": "v"} in insert["parameters"]
+    assert {"password": "***"} in insert["parameters"]
+
+
+@pytest.mark.asyncio
+async def test_request_budget_log(async_client, session, slow_log, monkeypatch):
+    session.add(Audiobook(title="Dune", author=Author(name="A"), duration=1))
+    session.commit()
+    await async_client.get("/audiobooks/1")
+    assert slow_log("slow_request") == []
+    monkeypatch.setattr(get_settings(), "slow_request_queries", 1)
+    await async_client.get("/audiobooks/2")
+    (record,) = slow_log("slow_request")
+    assert record["route"] == "/audiobooks/{audiobook_id}"
+    assert record["method"] == "GET"
+    assert record["queries"] >= 1
+    assert record["slowest_statement"].startswith("SELECT")
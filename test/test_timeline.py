@@ -0,0 +1,186 @@
+import random
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+
+from database import engine
+from main import app
+from schema import Audiobook, Author, Chapter
+from timeline import Timeline, TimelineEntry, chapter_timelines
+
+
+@pytest.fixture
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def audiobook(session):
+    audiobook = Audiobook(title="Dune", author=Author(name="A"), duration=1)
+    # inserted out of order; position decides
+    audiobook.chapters = [
+        Chapter(title="Two", duration=200, position=2),
+        Chapter(title="One", duration=100, position=1),
+        Chapter(title="Three", duration=300, position=3),
+    ]
+    session.add(audiobook)
+    session.commit()
+    session.refresh(audiobook)
+    return audiobook
+
+
+def entries(durations):
+    return [
+        TimelineEntry(position, position, None, duration)
+        for position, duration in enumerate(durations, 1)
+    ]
+
+
+def test_chapter_at():
+    timeline = Timeline(1, entries([10, 0, 5]))
+    assert timeline.starts == [0, 10, 10]
+    assert timeline.duration == 15
+    assert [timeline.chapter_at(offset) for offset in (0, 9.5, 10, 14.9)] == [
+        0,
+        0,
+        2,
+        2,
+    ]
+    assert timeline.chapter_at(15) is None
+    assert timeline.chapter_at(-1) is None
+
+
+def test_incremental_updates_match_rebuild():
+    rng = random.Random(7)
+    timeline = Timeline(1, [])
+    chapters = {}
+    for _ in range(500):
+        chapter_id = rng.randrange(30)
+        if chapter_id in chapters and rng.random() < 0.3:
+            del chapters[chapter_id]
+            timeline.remove(chapter_id)
+        else:
+            entry = TimelineEntry(rng.randrange(10), chapter_id, None, rng.randrange(5))
+            chapters[chapter_id] = entry
+            timeline.upsert(entry)
+        rebuilt = Timeline(1, chapters.values())
+        assert (timeline.entries, timeline.starts, timeline.duration) == (
+            rebuilt.entries,
+            rebuilt.starts,
+            rebuilt.duration,
+        )
+        for chapter_id in chapters:
+            assert (
+                rebuilt.entries[timeline.index_of(chapter_id)].chapter_id == chapter_id
+            )
+
+
+@pytest.mark.asyncio
+async def test_table_of_contents(async_client, audiobook, statements):
+    statements.clear()
+    response = await async_client.get(f"/audiobooks/{audiobook.audiobook_id}/timeline")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["duration"] == 600
+    assert [(c["title"], c["start"]) for c in body["chapters"]] == [
+        ("One", 0),
+        ("Two", 100),
+        ("Three", 300),
+    ]
+    assert len(statements) == 1
+    statements.clear()
+    await async_client.get(f"/audiobooks/{audiobook.audiobook_id}/timeline")
+    assert statements == []
+
+
+@pytest.mark.asyncio
+async def test_offset_and_chapter_lookups(async_client, audiobook):
+    base = f"/audiobooks/{audiobook.audiobook_id}/timeline"
+    response = await async_client.get(f"{base}/at?offset=250.5")
+    body = response.json()
+    assert body["chapter"]["title"] == "Two"
+    assert body["offset_in_chapter"] == 150.5
+    assert (await async_client.get(f"{base}/at?offset=600")).status_code == 404
+
+    three = body["chapter"]["chapter_id"] + 2
+    response = await async_client.get(f"{base}/chapters/{three}")
+    assert (response.json()["start"], response.json()["duration"]) == (300, 300)
+    assert (await async_client.get(f"{base}/chapters/999")).status_code == 404
+    assert (await async_client.get("/audiobooks/999/timeline")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_chapter_writes_update_cached_timeline(async_client, audiobook, session):
+    audiobook_id = audiobook.audiobook_id
+    base = f"/audiobooks/{audiobook_id}/timeline"
+    await async_client.get(base)
+    other = Audiobook(title="Other", author_id=audiobook.author_id, duration=1)
+    session.add(other)
+    session.commit()
+    await async_client.get(f"/audiobooks/{other.audiobook_id}/timeline")
+
+    created = await async_client.post(
+        "/chapters/",
+        json={
+            "audiobook_id": audiobook_id,
+            "title": "Zero",
+            "duration": 50,
+            "position": 0,
+        },
+    )
+    chapter_id = created.json()["chapter_id"]
+    toc = (await async_client.get(base)).json()
+    assert [c["start"] for c in toc["chapters"]] == [0, 50, 150, 350]
+
+    # moving a chapter to another audiobook updates both timelines
+    await async_client.put(
+        f"/chapters/{chapter_id}",
+        json={
+            "audiobook_id": other.audiobook_id,
+            "title": "Zero",
+            "duration": 50,
+            "position": 1,
+        },
+    )
+    assert (await async_client.get(base)).json()["duration"] == 600
+    moved = (
+        await async_client.get(f"/audiobooks/{other.audiobook_id}/timeline")
+    ).json()
+    assert [c["chapter_id"] for c in moved["chapters"]] == [chapter_id]
+
+    await async_client.delete(f"/chapters/{chapter_id}")
+    moved = (
+        await async_client.get(f"/audiobooks/{other.audiobook_id}/timeline")
+    ).json()
+    assert moved["chapters"] == []
+
+    await async_client.post(
+        "/chapters/bulk",
+        json=[{"audiobook_id": audiobook_id, "duration": 10, "position": 9}],
+    )
+    assert (await async_client.get(base)).json()["duration"] == 610
+    assert len(chapter_timelines) == 2
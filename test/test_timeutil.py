@@ -0,0 +1,12 @@
+from datetime import datetime, timedelta, timezone
+
+from timeutil import naive_utc
+
+
+def test_naive_utc():
+    moment = datetime(2024, 1, 1, 12, 0)
+    assert naive_utc(moment) is moment
+    plus_two = timezone(timedelta(hours=2))
+    assert naive_utc(datetime(2024, 1, 1, 14, 0, tzinfo=plus_two)) == moment
+    assert naive_utc(moment.replace(tzinfo=timezone.utc)).tzinfo is None
+    assert naive_utc(None) is None
@@ -0,0 +1,204 @@
+"""Per-audiobook chapter timelines: playback offset <-> chapter lookups.
+
+A ``Timeline`` holds the chapters of one audiobook in playback order
+(``Chapter.position``, then id) with the cumulative offset at which each one
+starts, so the chapter playing at a global offset, such as a
+``Bookmark.position``, is a ``bisect`` over the start offsets and the start of
+a chapter is a dict lookup.
+
+``chapter_timelines`` keeps the timelines of recently used audiobooks in an
+LRU, loading one with a single query on first use. The chapter router
+applies its writes to the cached timelines incrementally: a write only
+recomputes the start offsets of the chapters after it.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from lru import LRU
+from schema import Chapter, TimelineChapter, TimelineRead
+from settings import get_settings
+
+
+class TimelineEntry(NamedTuple):
+    position: int
+    chapter_id: int
+    title: Optional[str]
+    duration: int
+
+
+class Timeline:
+    def __init__(self, audiobook_id: int, entries: Iterable[TimelineEntry]):
+        self.audiobook_id = audiobook_id
+        self.entries: List[TimelineEntry] = sorted(entries)
+        # starts[i] is the offset in seconds at which entries[i] begins.
+        self.starts: List[int] = []
+        self._index: Dict[int, int] = {}
+        self.duration = 0
+        self._reindex(0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _reindex(self, first: int):
+        """Recompute start offsets and the id index from ``entries[first]`` on."""
+        offset = (
+            self.starts[first - 1] + self.entries[first - 1].duration if first else 0
+        )
+        del self.starts[first:]
+        for i in range(first, len(self.entries)):
+            entry = self.entries[i]
+            self.starts.append(offset)
+            self._index[entry.chapter_id] = i
+            offset += entry.duration
+        self.duration = offset
+
+    def chapter_at(self, offset: float) -> Optional[int]:
+        """Index of the entry playing at ``offset``, ``None`` past the end."""
+        if offset < 0 or offset >= self.duration:
+            return None
+        # Zero-length chapters share their start with the next one; the
+        # last entry starting at or before the offset is the one playing.
+        return bisect_right(self.starts, offset) - 1
+
+    def index_of(self, chapter_id: int) -> Optional[int]:
+        return self._index.get(chapter_id)
+
+    def chapter(self, i: int) -> TimelineChapter:
+        entry = self.entries[i]
+        return TimelineChapter(
+            chapter_id=entry.chapter_id,
+            title=entry.title,
+            position=entry.position,
+            start=self.starts[i],
+            duration=entry.duration,
+        )
+
+    def read(self) -> TimelineRead:
+        """The table of contents."""
+        return TimelineRead(
+            audiobook_id=self.audiobook_id,
+            duration=self.duration,
+            chapters=[self.chapter(i) for i in range(len(self.entries))],
+        )
+
+    def upsert(self, entry: TimelineEntry):
+        first = self._pop(entry.chapter_id)
+        insort(self.entries, entry)
+        at = bisect_left(self.entries, entry)
+        self._reindex(at if first is None else min(first, at))
+
+    def remove(self, chapter_id: int):
+        first = self._pop(chapter_id)
+        if first is not None:
+            self._reindex(first)
+
+    def _pop(self, chapter_id: int) -> Optional[int]:
+        i = self._index.pop(chapter_id, None)
+        if i is not None:
+            del self.entries[i]
+            del self.starts[i]
+        return i
+
+
+def _entry(chapter: Chapter) -> TimelineEntry:
+    return TimelineEntry(
+        chapter.position, chapter.chapter_id, chapter.title, chapter.duration
+    )
+
+
+class TimelineIndex:
+    """LRU of ``Timeline`` by audiobook id, kept current by chapter writes."""
+
+    def __init__(self, max_entries: int):
+        # Cached timelines are never changed in place, so readers can use
+        # one without holding the lock; writes replace it with a new copy.
+        self._timelines = LRU(max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._timelines)
+
+    def get(self, session: Session, audiobook_id: int) -> Timeline:
+        with self._lock:
+            timeline = self._timelines.get(audiobook_id)
+            if timeline is not None:
+                self.hits += 1
+                return timeline
+            self.misses += 1
+            generation = self._timelines.generation
+        statement = select(
+            Chapter.position, Chapter.chapter_id, Chapter.title, Chapter.duration
+        ).where(Chapter.audiobook_id == audiobook_id)
+        timeline = Timeline(
+            audiobook_id, (TimelineEntry(*row) for row in session.exec(statement))
+        )
+        with self._lock:
+            self._timelines.store(audiobook_id, timeline, generation)
+        return timeline
+
+    def upsert(self, chapter: Chapter, previous_audiobook_id: Optional[int] = None):
+        """Apply a created or updated chapter to the cached timelines."""
+        with self._lock:
+            # A load racing this write would miss it, so none is stored.
+            self._timelines.invalidate()
+            if previous_audiobook_id not in (None, chapter.audiobook_id):
+                self._remove(previous_audiobook_id, chapter.chapter_id)
+            timeline = self._timelines.get(chapter.audiobook_id)
+            if timeline is not None:
+                timeline = self._copy(timeline)
+                timeline.upsert(_entry(chapter))
+                self._timelines.set(chapter.audiobook_id, timeline)
+
+    def remove(self, audiobook_id: int, chapter_id: int):
+        with self._lock:
+            self._timelines.invalidate()
+            self._remove(audiobook_id, chapter_id)
+
+    def _remove(self, audiobook_id: int, chapter_id: int):
+        timeline = self._timelines.get(audiobook_id)
+        if timeline is not None:
+            timeline = self._copy(timeline)
+            timeline.remove(chapter_id)
+            self._timelines.set(audiobook_id, timeline)
+
+    @staticmethod
+    def _copy(timeline: Timeline) -> Timeline:
+        copy = Timeline.__new__(Timeline)
+        copy.audiobook_id = timeline.audiobook_id
+        copy.entries = list(timeline.entries)
+        copy.starts = list(timeline.starts)
+        copy._index = dict(timeline._index)
+        copy.duration = timeline.duration
+        return copy
+
+    def invalidate(self, audiobook_ids: Iterable[int] = (), chapter_ids=()):
+        """Drop the timelines of ``audiobook_ids`` and of those holding ``chapter_ids``."""
+        chapter_ids = set(chapter_ids)
+        with self._lock:
+            stale = set(audiobook_ids)
+            if chapter_ids:
+                stale.update(
+                    audiobook_id
+                    for audiobook_id, timeline in self._timelines.items()
+                    if not chapter_ids.isdisjoint(timeline._index)
+                )
+            self._timelines.invalidate(*stale)
+
+    def clear(self):
+        with self._lock:
+            self._timelines.clear()
+
+
+chapter_timelines = TimelineIndex(get_settings().timeline_cache_size)
+
+
+@event.listens_for(SQLModel.metadata, "after_drop")
+def clear_chapter_timelines(target, connection, **kw):
+    chapter_timelines.clear()
@@ -0,0 +1,16 @@
+"""Timestamps are stored as naive UTC, as ``datetime.utcnow()`` returns them.
+
+Clients may send aware datetimes, such as ``...Z`` or ``...+02:00``, which
+neither compare with naive ones nor mean the same moment once their offset is
+dropped. ``naive_utc`` converts them before they are compared or stored.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """``moment`` in UTC without a time zone; naive values are taken as UTC."""
+    if moment is not None and moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment